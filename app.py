@@ -1,9 +1,25 @@
 import sqlite3
+import json
+import base64
+import itertools
+import logging
+import gzip
+import zlib
+import hashlib
+import threading
 from datetime import datetime, timedelta, timezone
-from flask import Flask, render_template, jsonify, request, abort
+import numpy as np
+from flask import Flask, render_template, jsonify, request, abort, Response
 from config_init import initialize_config
 import argparse
-from utils import celsius_to_fahrenheit
+from utils import celsius_to_fahrenheit, haversine_distance
+from node_cache import get_latest_nodes, get_nodes
+from node_positions import parse_bbox, radius_bbox, nodes_in_bbox
+from db_connection import connect_database, init_read_pool, read_connection, write_connection, ReadPoolTimeout
+from packet_history import get_node_timeline, portnum_value
+from topology import get_topology_payload
+from live_updates import start_live_updates, stream_events
+from db_operations import SYNC_COLUMNS, SYNC_PROTOCOL_VERSION, ingest_sync_entries, initialize_database, build_trend_query, build_rollup_query, build_trend_range_query, pick_trend_resolution, TREND_RESOLUTIONS, TREND_RAW_FIELDS, TREND_ROLLUP_FIELDS
 
 app = Flask(__name__)
 application = app  # For Elastic Beanstalk deployment
@@ -19,6 +35,37 @@ if args.config is not None:
 
 system_config = initialize_config(config_file) 
 
+# Create missing tables, apply schema migrations (indexes) and switch to WAL before serving
+init_conn = connect_database(db_path, system_config['sqlite'])
+initialize_database({'logger': logging.getLogger(__name__), 'conn': init_conn})
+init_conn.close()
+
+# Routes borrow read-only connections from a small pool instead of connecting per request
+init_read_pool(db_path, system_config['sqlite'])
+
+# /get-trend-data picks the coarsest rollup that still gives about this many points per node
+TREND_TARGET_POINTS = 300
+# Most trend rows one /get-trend-data page returns when a limit is asked for
+TREND_MAX_LIMIT = 50000
+# Streamed trend JSON is sent in chunks of about this many characters
+TREND_STREAM_CHUNK = 64 * 1024
+# Stored in Celsius, sent in Fahrenheit
+TREND_TEMPERATURE_FIELDS = ('temperature', 'temperature_min', 'temperature_max')
+# rows: {node: [row objects]}, columnar: per node a timestamp vector and one packed float32 array per field
+TREND_FORMATS = ('rows', 'columnar')
+# Fields a columnar series carries once per node or not at all
+TREND_COLUMNAR_SKIPPED = ('id', 'synced', 'timestamp', 'sender_node_id', 'sender_long_name', 'sender_short_name')
+
+# Serialized /get-telemetry-data payload, rebuilt only when the node cache version changes
+telemetry_response = {
+    'version': None,
+    'etag': None,
+    'last_modified': None,
+    'body': None,
+    'gzip_body': None
+}
+telemetry_response_lock = threading.Lock()
+
 # decorator to limit access to the data routs
 def limit_referrer(allowed_domains):
     def decorator(f):
@@ -33,6 +80,30 @@ def limit_referrer(allowed_domains):
         return wrapped_function
     return decorator
 
+# every pooled read connection stayed busy for read_pool_timeout_ms (slow streamed responses hold theirs)
+@app.errorhandler(ReadPoolTimeout)
+def read_pool_busy(e):
+    app.logger.warning(f"Read pool busy: {e}")
+    response = jsonify({"error": "Database busy, try again shortly"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+def primed(stream):
+    """
+    Run a streaming generator to its first chunk inside the request, so borrowing its read connection
+    can still fail with a 503 before the status line goes out.
+    """
+    first = next(stream)
+    def chunks():
+        try:
+            yield first
+            yield from stream
+        finally:
+            # a client gone before the second chunk still has to give the connection back
+            stream.close()
+    return chunks()
+
 # Route to serve the HTML template
 @app.route('/')
 def index():
@@ -47,43 +118,13 @@ def dataTable():
 def trendData():
     return render_template('trend.html', flask_path=system_config['flask_path'])  # Ensure index.html is in the 'templates' folder
  
-# Route to provide telemetry data as JSON
-@app.route('/get-telemetry-data', methods=['GET'])
-@limit_referrer(["https://testbench.cc/meshlogger/"])
-def get_telemetry_data():
-    conn = sqlite3.connect(db_path)  # Replace with your actual database path
-    cursor = conn.cursor()
-
-    # Query to get the most recent non-null values for each field per sender_node_id
-    query = '''
-        SELECT
-            td.sender_node_id,
-            MAX(td.sender_short_name) AS sender_short_name,
-            MAX(td.timestamp) AS timestamp,
-            (SELECT temperature FROM TelemetryData WHERE temperature IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS temperature,
-            (SELECT humidity FROM TelemetryData WHERE humidity IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS humidity,
-            (SELECT pressure FROM TelemetryData WHERE pressure IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS pressure,
-            (SELECT battery_level FROM TelemetryData WHERE battery_level IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS battery_level,
-            (SELECT voltage FROM TelemetryData WHERE voltage IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS voltage,
-            (SELECT uptime_seconds FROM TelemetryData WHERE uptime_seconds IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS uptime_seconds,
-            (SELECT latitude FROM TelemetryData WHERE latitude IS NOT NULL AND latitude != 0 AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS latitude,
-            (SELECT longitude FROM TelemetryData WHERE longitude IS NOT NULL AND longitude != 0 AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS longitude,
-            (SELECT altitude FROM TelemetryData WHERE altitude IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS altitude,
-            (SELECT sats_in_view FROM TelemetryData WHERE sats_in_view IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS sats_in_view,
-            (SELECT snr FROM TelemetryData WHERE snr IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS snr,
-            (SELECT hardware_model FROM TelemetryData WHERE hardware_model IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS hardware_model,
-            (SELECT sender_long_name FROM TelemetryData WHERE sender_long_name IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS sender_long_name,
-            (SELECT role FROM TelemetryData WHERE role IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS role,
-            (SELECT first_contact FROM TelemetryData WHERE first_contact IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS first_contact,
-            (SELECT miles_to_base FROM TelemetryData WHERE miles_to_base IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS miles_to_base,
-            (SELECT mqtt FROM TelemetryData WHERE mqtt IS NOT NULL AND sender_node_id = td.sender_node_id ORDER BY id DESC LIMIT 1) AS mqtt
-        FROM TelemetryData td
-        GROUP BY td.sender_node_id;
-    '''
-    
-    cursor.execute(query)
-    data = cursor.fetchall()
-
+def build_telemetry_payload(data, center=None):
+    """
+    Format the cached node rows into the close/far node lists served by /get-telemetry-data.
+    Nodes within the configured general radius of the base are close. Both lists are sorted by miles_to_base,
+    or by distance from center (lat, lon) when given, which is then also returned per node.
+    last_seen is relative to when the payload is built, the pages recompute it from timestamp.
+    """
     telemetry_data = []
     current_time = datetime.now(timezone.utc)
 
@@ -176,80 +217,352 @@ def get_telemetry_data():
                 # Assign default value if conversion fails
                 row['miles_to_base'] = 9999.0
         
-    # Create two lists, one for nodes within 100 miles of Boise, and everything else
-    close_nodes = [node for node in telemetry_data if int(node['miles_to_base']) < 100]
-    far_nodes = [node for node in telemetry_data if int(node['miles_to_base']) >= 100]
+    # Create two lists, one for nodes within the configured radius of the base, and everything else
+    radius = system_config['general']['radius']
+    close_nodes = [node for node in telemetry_data if node['miles_to_base'] < radius]
+    far_nodes = [node for node in telemetry_data if node['miles_to_base'] >= radius]
+
+    sort_key = 'miles_to_base'
+    if center is not None:
+        for node in telemetry_data:
+            node['distance'] = round(haversine_distance(center[0], center[1], node['latitude'], node['longitude']), 2)
+        sort_key = 'distance'
 
-    # Sort both lists based on miles_to_base
-    close_nodes = sorted(close_nodes, key=lambda x: x['miles_to_base'])
-    far_nodes = sorted(far_nodes, key=lambda x: x['miles_to_base'])
+    # Sort both lists based on distance
+    close_nodes = sorted(close_nodes, key=lambda x: x[sort_key])
+    far_nodes = sorted(far_nodes, key=lambda x: x[sort_key])
 
-    conn.close()
-    return jsonify({"close_nodes": close_nodes, "far_nodes": far_nodes})
+    return {"close_nodes": close_nodes, "far_nodes": far_nodes}
+
+# Route to provide telemetry data as JSON
+@app.route('/get-telemetry-data', methods=['GET'])
+@limit_referrer(["https://testbench.cc/meshlogger/"])
+def get_telemetry_data():
+    if 'bbox' in request.args or 'radius' in request.args:
+        return get_telemetry_data_in_area()
+
+    # Latest state per node comes from the in-memory cache, refreshed only when the DB has changed
+    version, data = get_latest_nodes(db_path)
+
+    # Every poller shares one serialized (and gzipped) body per data version
+    with telemetry_response_lock:
+        if telemetry_response['version'] != version:
+            body = json.dumps(build_telemetry_payload(data)).encode('utf-8')
+            telemetry_response['version'] = version
+            telemetry_response['etag'] = hashlib.sha1(body).hexdigest()[:20]
+            telemetry_response['last_modified'] = datetime.now(timezone.utc).replace(microsecond=0)
+            telemetry_response['body'] = body
+            telemetry_response['gzip_body'] = gzip.compress(body, compresslevel=6)
+        cached = dict(telemetry_response)
+
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = Response(cached['gzip_body'] if use_gzip else cached['body'], mimetype='application/json')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.no_cache = True  # browsers revalidate every poll and get a 304 when nothing changed
+    response.set_etag(cached['etag'] + ('-gz' if use_gzip else ''))
+    response.last_modified = cached['last_modified']
+
+    return response.make_conditional(request)
+
+def get_telemetry_data_in_area():
+    """
+    /get-telemetry-data?bbox=west,south,east,north and/or ?radius=miles[&lat=..&lon=..]: only the nodes in the area,
+    found through the nodePositions R*Tree and sorted by distance from lat/lon (default the base location).
+    """
+    location = system_config['general']['location']
+    try:
+        center = (float(request.args.get('lat', location['base_lat'])), float(request.args.get('lon', location['base_lon'])))
+        bbox = parse_bbox(request.args['bbox']) if 'bbox' in request.args else None
+        radius = float(request.args['radius']) if 'radius' in request.args else None
+        if radius is not None and not radius >= 0:
+            raise ValueError(radius)
+    except ValueError:
+        return jsonify({"error": "Invalid 'bbox', 'radius', 'lat' or 'lon' value, bbox is west,south,east,north in degrees"}), 400
+
+    boxes = [bbox] if bbox is not None else []
+    if radius is not None:
+        boxes.append(radius_bbox(center[0], center[1], radius))
+
+    try:
+        with read_connection() as conn:
+            node_ids = set.intersection(*(nodes_in_bbox(conn, *box) for box in boxes))
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
+
+    _, data = get_nodes(db_path, node_ids)
+    # the cache can be a refresh ahead of the index, and the box around a circle has corners outside it
+    data = [row for row in data if row[9] is not None and row[10] is not None]
+    if radius is not None:
+        data = [row for row in data if haversine_distance(center[0], center[1], row[9], row[10]) <= radius]
+
+    body = json.dumps(build_telemetry_payload(data, center)).encode('utf-8')
+    response = Response(body, mimetype='application/json')
+    response.cache_control.no_cache = True
+    response.set_etag(hashlib.sha1(body).hexdigest()[:20])
+    return response.make_conditional(request)
+
+@app.route('/live-updates', methods=['GET'])
+@limit_referrer(["https://testbench.cc/meshlogger/"])
+def live_updates_stream():
+    # One broadcaster per process diffs the node cache, every stream is fed the same encoded events
+    start_live_updates(db_path, build_telemetry_payload)
+
+    # EventSource sends Last-Event-ID when it reconnects, the stream then resumes from the backlog
+    last_event_id = request.headers.get('Last-Event-ID')
+    snapshot = request.args.get('snapshot', '1') != '0'
+
+    response = Response(stream_events(last_event_id, snapshot), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx would otherwise buffer the stream
+    return response
+
+class SyncBodyTooLarge(Exception):
+    pass
+
+def gunzip_limited(raw, max_bytes):
+    """
+    Decompress a gzip body, but never past max_bytes so a small gzip bomb cannot exhaust memory.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = decompressor.decompress(raw, max_bytes)
+    if decompressor.unconsumed_tail or (len(data) >= max_bytes and decompressor.decompress(b'', 1)):
+        raise SyncBodyTooLarge()
+    if not decompressor.eof:
+        raise ValueError("truncated gzip body")
+    return data
+
+def read_sync_entries():
+    """
+    Parse a /sync body into a list of {column: value} dicts.
+    Accepts the chunked delta format ({"version": 2, "rows": [...]}, usually gzip'd) and the older plain list of full rows.
+    Returns (entries, chunk) or (None, None) if the body is not understood. Raises SyncBodyTooLarge past sync_max_body_mb.
+    """
+    max_bytes = system_config['api_sync']['max_body_bytes']
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise SyncBodyTooLarge()
+    raw = request.get_data()
+    if len(raw) > max_bytes:
+        raise SyncBodyTooLarge()
+    if request.headers.get('Content-Encoding') == 'gzip':
+        raw = gunzip_limited(raw, max_bytes)
+    data = json.loads(raw)
+
+    if isinstance(data, list):
+        # old clients send every column, a missing one means NULL
+        return [{col: entry.get(col) for col in SYNC_COLUMNS} if isinstance(entry, dict) else {} for entry in data], None
+
+    if isinstance(data, dict) and data.get('version') == SYNC_PROTOCOL_VERSION and isinstance(data.get('rows'), list):
+        # delta rows only carry the columns that changed
+        return [{col: value for col, value in row.items() if col in SYNC_COLUMNS} if isinstance(row, dict) else {} for row in data['rows']], data.get('chunk')
+
+    return None, None
 
 @app.route('/sync', methods=['POST'])
 def sync_db():
-    data = request.get_json()
+    try:
+        entries, chunk = read_sync_entries()
+    except SyncBodyTooLarge:
+        return jsonify({"error": f"Sync body is larger than {system_config['api_sync']['max_body_bytes']} bytes"}), 413
+    except (OSError, ValueError, zlib.error) as e:
+        return jsonify({"error": f"Could not read sync body: {e}"}), 400
+
+    if entries is None:
+        return jsonify({"error": "Expected a list of entries or a version 2 sync chunk"}), 400
+
+    try:
+        # one executemany in one transaction, bad rows come back in 'rejected' instead of failing the batch
+        with write_connection() as conn:
+            stored, rejected = ingest_sync_entries(conn, entries)
 
-    if not isinstance(data, list):
-        return jsonify({"error": "Expected a list of entries"}), 400
+    except sqlite3.Error as e: 
+        return jsonify({"message": str(e), "status": "failed", "chunk": chunk})
 
-    
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    return jsonify({"message": "Data received and stored.", "status": "success", "chunk": chunk, "stored": stored, "rejected": rejected})
 
-    for entry in data:
-        # Prepare the list of columns and their corresponding values
-        columns = [
-            'sender_node_id', 'sender_short_name', 'timestamp', 'temperature', 'humidity', 'pressure',
-            'battery_level', 'voltage', 'uptime_seconds', 'latitude', 'longitude', 'altitude',
-            'sats_in_view', 'snr', 'hardware_model', 'sender_long_name', 'role', 'mqtt', 'miles_to_base'
-        ]
-        values = [entry.get(col) for col in columns]
+def encode_trend_cursor(resolution, key):
+    return base64.urlsafe_b64encode(json.dumps([resolution] + list(key)).encode('utf-8')).decode('ascii')
 
+def decode_trend_cursor(value):
+    """
+    [resolution, node id, timestamp, id or None] of the last row a page ended on, or None if the cursor is not one of ours.
+    """
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(value.encode('ascii')))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(cursor, list) or len(cursor) != 4 or not all(isinstance(part, str) for part in cursor[:3]):
+        return None
+    if cursor[0] == 'raw' and not isinstance(cursor[3], int):
+        return None
+    if cursor[0] != 'raw' and (cursor[0] not in TREND_RESOLUTIONS or cursor[3] is not None):
+        return None
+    return cursor
+
+def trend_rows(conn, resolution, node_ids, fields, since, cursor):
+    """
+    Yield (node id, key, row) for every trend row of the nodes, node by node in id order and newest first within a node.
+    key is (node id, timestamp, id) for raw rows and (node id, bucket, None) for rollups; rows resume after cursor's key.
+    One indexed query per node, read lazily, so only the rows in flight are in memory.
+    """
+    for node_id in sorted(set(node_ids)):
+        if cursor is not None and node_id < cursor[1]:
+            continue
+        resume = cursor is not None and node_id == cursor[1]
+        if resolution == 'raw':
+            query = build_trend_query(fields, since is not None, resume)
+            params = [node_id] + ([since] if since else []) + ([cursor[2], cursor[2], cursor[3]] if resume else [])
+            for row in conn.execute(query, params):
+                yield node_id, (node_id, row[1], row[0]), row[2:]
+        else:
+            query = build_rollup_query(fields, since is not None, resume)
+            params = [TREND_RESOLUTIONS[resolution], node_id] + ([since] if since else []) + ([cursor[2]] if resume else [])
+            for row in conn.execute(query, params):
+                yield node_id, (node_id, row[0], None), row[1:]
+
+def paged_rows(rows, resolution, limit, page):
+    """
+    Pass (node id, key, row) from trend_rows on, stopping after limit rows (None for all).
+    page['next_cursor'] is set when rows remain, one row past the page shows there is more.
+    """
+    last_key = None
+    for sent, (node_id, key, row) in enumerate(rows):
+        if limit is not None and sent == limit:
+            page['next_cursor'] = encode_trend_cursor(resolution, last_key)
+            return
+        last_key = key
+        yield node_id, key, row
+
+def trend_page_end(resolution, cursor, sent_key, error):
+    """
+    Close a paged body that stopped early: "error" says the page is incomplete and next_cursor resumes
+    after the last row sent (the request's own cursor, or null for the first page, when none was).
+    """
+    if sent_key is not None:
+        next_cursor = encode_trend_cursor(resolution, sent_key)
+    else:
+        next_cursor = encode_trend_cursor(cursor[0], cursor[1:]) if cursor is not None else None
+    return f',"next_cursor":{json.dumps(next_cursor)},"error":{json.dumps(error)}}}'
+
+def stream_trend_json(resolution, node_ids, fields, since, cursor, limit):
+    """
+    Generator of the /get-trend-data JSON body, {node: [rows]}, written row by row straight from the cursors.
+    With a limit the body is {"nodes": {node: [rows]}, "next_cursor": ...} and next_cursor is null on the last page.
+    If reading fails once the response has started, a paged body ends with an "error" field (see trend_page_end)
+    and an unpaged one is left unterminated, so it fails to parse instead of passing for the whole window.
+    """
+    temperature_indexes = [i for i, field in enumerate(fields) if field in TREND_TEMPERATURE_FIELDS]
+    paged = limit is not None
+    page = {'next_cursor': None}
+    parts = []
+    size = 0
+    current = None
+    sent_key = None
+
+    # the read connection stays borrowed until the last chunk is sent
+    with read_connection() as conn:
+        # the opening alone, get_trend_data pulls it to borrow the connection before responding (see primed)
+        yield '{"nodes":{' if paged else '{'
         try:
-            # Try to update the existing record
-            cursor.execute('''
-                UPDATE TelemetryData SET
-                    sender_short_name = ?,
-                    timestamp = ?,
-                    temperature = ?,
-                    humidity = ?,
-                    pressure = ?,
-                    battery_level = ?,
-                    voltage = ?,
-                    uptime_seconds = ?,
-                    latitude = ?,
-                    longitude = ?,
-                    altitude = ?,
-                    sats_in_view = ?,
-                    snr = ?,
-                    hardware_model = ?,
-                    sender_long_name = ?,
-                    role = ?,
-                    mqtt = ?,
-                    miles_to_base = ?
-                WHERE sender_node_id = ?
-            ''', values[1:] + [entry['sender_node_id']])
-
-            # If no rows were updated, insert a new record
-            if cursor.rowcount == 0:
-                cursor.execute('''
-                    INSERT INTO TelemetryData (
-                        sender_node_id, sender_short_name, timestamp, temperature, humidity, pressure,
-                        battery_level, voltage, uptime_seconds, latitude, longitude, altitude,
-                        sats_in_view, snr, hardware_model, sender_long_name, role, mqtt, miles_to_base
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', values)
-
-        except Exception as e: 
-            return jsonify({"message": e, "status": "failed"})
-
-    conn.commit()
-    conn.close()
-
-
-    return jsonify({"message": "Data received and stored.", "status": "success"})
+            for node_id, key, row in paged_rows(trend_rows(conn, resolution, node_ids, fields, since, cursor), resolution, limit, page):
+                values = list(row)
+                # Convert temperature from Celsius to Fahrenheit
+                for i in temperature_indexes:
+                    if values[i] is not None:
+                        values[i] = celsius_to_fahrenheit(values[i])
+                entry = json.dumps(dict(zip(fields, values)), separators=(',', ':'))
+                if node_id != current:
+                    entry = f"{'],' if current is not None else ''}{json.dumps(node_id)}:[{entry}"
+                    current = node_id
+                else:
+                    entry = ',' + entry
+                parts.append(entry)
+                size += len(entry)
+                sent_key = key
+                if size >= TREND_STREAM_CHUNK:
+                    yield ''.join(parts)
+                    parts = []
+                    size = 0
+        except Exception:
+            # the status is already sent, all that is left is to end the body the way the docstring says
+            app.logger.exception("Trend data stream failed")
+            if paged:
+                parts.append(']}' if current is not None else '}')
+                parts.append(trend_page_end(resolution, cursor, sent_key, "Trend data stream failed"))
+            yield ''.join(parts)
+            return
+
+    parts.append(']}' if current is not None else '}')
+    if paged:
+        parts.append(f',"next_cursor":{json.dumps(page["next_cursor"])}}}')
+    yield ''.join(parts)
+
+def float_or_nan(value):
+    """
+    A stored value as a float, NaN for null and for anything non-numeric a synced row may carry.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return float('nan')
+
+def epoch_seconds(timestamp):
+    try:
+        return int(datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp())
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+def encode_columnar_series(rows, fields):
+    """
+    One node's trend rows (timestamp, long name, short name, then fields) as
+    {"count", "long_name", "short_name", "timestamp", "columns": {field: ...}}, newest first like the row format.
+    timestamp is base64 little-endian uint32 epoch seconds (0 when unreadable), each column base64 little-endian
+    float32 with NaN for null or non-numeric values.
+    """
+    try:
+        timestamps = np.array([row[0] for row in rows], dtype='datetime64[s]').astype('<u4')
+    except (TypeError, ValueError):
+        timestamps = np.array([epoch_seconds(row[0]) for row in rows], dtype='<u4')
+    columns = {}
+    for i, field in enumerate(fields, start=3):
+        # the same conversion as the row format, so the two cannot drift apart
+        convert = celsius_to_fahrenheit if field in TREND_TEMPERATURE_FIELDS else None
+        column = np.fromiter((float_or_nan(convert(row[i]) if convert else row[i]) for row in rows), dtype='<f4', count=len(rows))
+        columns[field] = base64.b64encode(column.tobytes()).decode('ascii')
+    return {
+        'count': len(rows),
+        'long_name': rows[0][1],
+        'short_name': rows[0][2],
+        'timestamp': base64.b64encode(timestamps.tobytes()).decode('ascii'),
+        'columns': columns
+    }
+
+def stream_trend_columnar(resolution, node_ids, fields, since, cursor, limit):
+    """
+    Generator of the format=columnar body, {"nodes": {node: series}, "next_cursor": ...}, see encode_columnar_series.
+    Rows arrive node by node, so only one node's series is held while it is packed.
+    A failure after the response started ends the body with an "error" field, see trend_page_end.
+    """
+    page = {'next_cursor': None}
+    first = True
+    sent_key = None
+
+    with read_connection() as conn:
+        yield '{"nodes":{'
+        try:
+            rows = trend_rows(conn, resolution, node_ids, ['timestamp', 'sender_long_name', 'sender_short_name'] + fields, since, cursor)
+            for node_id, node_rows in itertools.groupby(paged_rows(rows, resolution, limit, page), key=lambda item: item[0]):
+                node_rows = list(node_rows)
+                series = encode_columnar_series([row for _, _, row in node_rows], fields)
+                yield f"{'' if first else ','}{json.dumps(node_id)}:{json.dumps(series, separators=(',', ':'))}"
+                first = False
+                sent_key = node_rows[-1][1]
+        except Exception:
+            app.logger.exception("Trend data stream failed")
+            yield '}' + trend_page_end(resolution, cursor, sent_key, "Trend data stream failed")
+            return
+
+    yield f'}},"next_cursor":{json.dumps(page["next_cursor"])}}}'
 
 @app.route('/get-trend-data', methods=['GET'])
 @limit_referrer(["https://testbench.cc/meshlogger/"])
@@ -257,6 +570,12 @@ def get_trend_data():
     # Retrieve query parameters
     node_ids = request.args.get('node')
     days = request.args.get('days')
+    resolution = request.args.get('resolution', 'auto')
+    points = request.args.get('points', TREND_TARGET_POINTS)
+    fields = request.args.get('fields')
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    trend_format = request.args.get('format', 'rows')
 
     # Validate node_ids and days
     if not node_ids:
@@ -264,61 +583,121 @@ def get_trend_data():
 
     node_ids_list = node_ids.split(',')
 
+    if resolution != 'auto' and resolution != 'raw' and resolution not in TREND_RESOLUTIONS:
+        return jsonify({"error": f"Invalid 'resolution' value, use auto, raw or one of {', '.join(TREND_RESOLUTIONS)}"}), 400
+
+    if trend_format not in TREND_FORMATS:
+        return jsonify({"error": f"Invalid 'format' value, use one of {', '.join(TREND_FORMATS)}"}), 400
+
+    try:
+        points = max(1, int(points))
+    except ValueError:
+        return jsonify({"error": "Invalid 'points' value"}), 400
+
+    if limit is not None:
+        try:
+            limit = min(max(1, int(limit)), TREND_MAX_LIMIT)
+        except ValueError:
+            return jsonify({"error": "Invalid 'limit' value"}), 400
+
+    if cursor is not None:
+        cursor = decode_trend_cursor(cursor)
+        if cursor is None:
+            return jsonify({"error": "Invalid 'cursor' value"}), 400
+        # later pages stay at the resolution the first page picked
+        resolution = cursor[0]
+
     # Determine the time range
-    date_filter = ""
+    since = None
     if days:
         try:
             days = int(days)
             date_limit = datetime.now(timezone.utc) - timedelta(days=days)
-            date_filter = f"AND timestamp >= '{date_limit.strftime('%Y-%m-%d %H:%M:%S')}'"
+            since = date_limit.strftime('%Y-%m-%d %H:%M:%S')
         except ValueError:
             return jsonify({"error": "Invalid 'days' value"}), 400
 
-    # Construct the SQL query to retrieve the trend data for the specified nodes
-    query = f'''
-        SELECT *
-        FROM trendData
-        WHERE sender_node_id IN ({','.join(['?'] * len(node_ids_list))})
-        {date_filter}
-        ORDER BY timestamp DESC;
-    '''
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
+    # Pick the coarsest rollup that still gives about 'points' points over the window
+    if resolution == 'auto':
+        params = node_ids_list + ([since] if since else [])
+        try:
+            with read_connection() as conn:
+                first, last = conn.execute(build_trend_range_query(len(node_ids_list), since is not None), params).fetchone()
+        except sqlite3.Error as e:
+            return jsonify({"error": str(e)}), 500
+        # measure the data actually stored in the window, not back from now
+        window = (datetime.strptime(last, '%Y-%m-%d %H:%M:%S') - datetime.strptime(first, '%Y-%m-%d %H:%M:%S')).total_seconds() if first else 0
+        resolution = pick_trend_resolution(window, points)
+
+    available = TREND_RAW_FIELDS if resolution == 'raw' else TREND_ROLLUP_FIELDS
+    if trend_format == 'columnar':
+        # the timestamp vector and the names always come along, the columns are the numeric fields
+        available = tuple(field for field in available if field not in TREND_COLUMNAR_SKIPPED)
+    if fields:
+        fields = list(dict.fromkeys(fields.split(',')))
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            return jsonify({"error": f"Unknown 'fields' for {resolution} {trend_format} data: {', '.join(unknown)}"}), 400
+        # the charts need the time axis whatever else is asked for
+        if trend_format == 'rows' and 'timestamp' not in fields:
+            fields.insert(0, 'timestamp')
+    else:
+        fields = list(available)
+
+    if trend_format == 'columnar':
+        stream = stream_trend_columnar(resolution, node_ids_list, fields, since, cursor, limit)
+    else:
+        # without a limit the body stays {node: rows} so existing pages keep working, the resolution goes in a header
+        stream = stream_trend_json(resolution, node_ids_list, fields, since, cursor, limit)
+    response = Response(primed(stream), mimetype='application/json')
+    response.headers['X-Trend-Resolution'] = resolution
+    return response
+
+@app.route('/get-topology', methods=['GET'])
+@limit_referrer(["https://testbench.cc/meshlogger/"])
+def get_topology():
+    # The graph and hop distances are kept up to date from the edges table, this only serves the cached body
     try:
-        cursor.execute(query, node_ids_list)
-        trend_data = cursor.fetchall()
-
-        # Extract column names for JSON conversion
-        columns = [column[0] for column in cursor.description]
-
-        # Initialize a dictionary to group data by sender_node_id
-        grouped_data = {}
-
-        # Format the data into a dictionary grouped by sender_node_id
-        for row in trend_data:
-            row_dict = dict(zip(columns, row))
-            sender_node_id = row_dict['sender_node_id']
+        etag, body = get_topology_payload(db_path)
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
 
-            # Convert temperature from Celsius to Fahrenheit
-            if row_dict.get('temperature') is not None:
-                row_dict['temperature'] = celsius_to_fahrenheit(row_dict['temperature'])
+    response = Response(body, mimetype='application/json')
+    response.cache_control.no_cache = True
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
-            # Add the record to the appropriate sender_node_id group
-            if sender_node_id not in grouped_data:
-                grouped_data[sender_node_id] = []
+# Most packets /get-node-packets returns in one response
+NODE_PACKETS_MAX_LIMIT = 5000
 
-            grouped_data[sender_node_id].append(row_dict)
+@app.route('/get-node-packets', methods=['GET'])
+@limit_referrer(["https://testbench.cc/meshlogger/"])
+def get_node_packets():
+    node_id = request.args.get('node')
+    if not node_id:
+        return jsonify({"error": "No node ID provided"}), 400
 
-        conn.close()
+    portnum = request.args.get('portnum')
+    if portnum is not None and portnum_value(portnum) is None:
+        return jsonify({"error": "Invalid 'portnum' value"}), 400
 
-        return jsonify(grouped_data)
+    try:
+        hours = float(request.args.get('hours', 24))
+        limit = min(max(1, int(request.args.get('limit', 1000))), NODE_PACKETS_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "Invalid 'hours' or 'limit' value"}), 400
 
+    since = datetime.now(timezone.utc).timestamp() - hours * 3600
+    try:
+        with read_connection() as conn:
+            timeline = get_node_timeline(conn, node_id, since, portnum=portnum, limit=limit)
+    except ValueError:
+        return jsonify({"error": "Invalid node ID"}), 400
     except sqlite3.Error as e:
-        conn.close()
         return jsonify({"error": str(e)}), 500
 
+    return jsonify({"node": node_id, "packets": timeline})
+
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -7,6 +7,7 @@ import meshtastic.tcp_interface
 import serial.tools.list_ports
 import argparse
 import logging
+from trend_compression import DEFAULT_TOLERANCES, METHODS
 
 def init_cli_parser() -> argparse.Namespace:
     """Function build the CLI parser and parses the arguments.
@@ -56,8 +57,8 @@ def init_cli_parser() -> argparse.Namespace:
     parser.add_argument(
         "--log-level", '-l', 
         action="store",
-        help="Logging level for the system (INFO)| DEBUG, INFO, WARNING, ERROR, CRITICAL",
-        default='INFO')
+        help="Logging level for the system (from the config file)| DEBUG, INFO, WARNING, ERROR, CRITICAL",
+        default=None)
     
     parser.add_argument(
         "--db-file", '-d', 
@@ -69,6 +70,11 @@ def init_cli_parser() -> argparse.Namespace:
         action="store",
         help="API path for the server",
         default=None)
+    parser.add_argument(
+        "--record", '-r',
+        action="store",
+        help="Record the received packets and the node list to this file for tools/replay_packets.py (.gz to compress) (None)",
+        default=None)
     #
     # Add extra arguments here
     #...
@@ -112,6 +118,9 @@ def merge_config(system_config:dict[str, Any], args:argparse.Namespace) -> dict[
 
     if args.api_path is not None:
         system_config['api_path'] = args.api_path
+
+    if args.record is not None:
+        system_config['record_file'] = args.record
     
     return system_config
 
@@ -146,9 +155,76 @@ def initialize_config(config_file: str = None) -> dict[str, Any]:
     max_retries = int(config['interface'].get('max_retries', 0))
     timezone = config['timezone'].get('timezone', 'UTC')
     log_level = config['logging'].get('log_level', 'INFO').upper()
+    debug_sample = int(config['logging'].get('debug_sample', 1))
     db_file = config['database'].get('file', 'nodeData.db')
+    write_queue = {
+        'batch_rows': int(config['database'].get('batch_rows', 200)),
+        'batch_ms': int(config['database'].get('batch_ms', 250)),
+        'queue_size': int(config['database'].get('queue_size', 10000)),
+        'packet_history': config['database'].get('packet_history', 'true').lower() in ('1', 'true', 'yes', 'on'),
+        'packet_queue_size': int(config['database'].get('packet_queue_size', 50000))
+    }
+    sqlite_settings = {
+        'cache_size_mb': int(config['database'].get('cache_size_mb', 32)),
+        'mmap_size_mb': int(config['database'].get('mmap_size_mb', 256)),
+        'busy_timeout_ms': int(config['database'].get('busy_timeout_ms', 5000)),
+        'read_pool_size': int(config['database'].get('read_pool_size', 4)),
+        'read_pool_timeout_ms': int(config['database'].get('read_pool_timeout_ms', 10000))
+    }
     api_path = config['API'].get('api_path', None)
+    api_sync = {
+        'chunk_rows': int(config['API'].get('sync_chunk_rows', 500)),
+        'timeout': float(config['API'].get('sync_timeout', 30)),
+        'max_body_bytes': int(float(config['API'].get('sync_max_body_mb', 16)) * 1024 * 1024)
+    }
     flask_path = config['flask'].get('path', '')
+    journal_section = config['journal'] if config.has_section('journal') else {}
+    journal = {
+        'path': journal_section.get('path', './logs'),
+        'max_bytes': int(float(journal_section.get('max_mb', 10)) * 1024 * 1024),
+        'rotate_daily': str(journal_section.get('rotate_daily', 'true')).lower() in ('1', 'true', 'yes', 'on'),
+        'compress': str(journal_section.get('compress', 'true')).lower() in ('1', 'true', 'yes', 'on'),
+        'keep_segments': int(journal_section.get('keep_segments', 30)),
+        'flush_interval': float(journal_section.get('flush_interval', 1.0)),
+        'queue_size': int(journal_section.get('queue_size', 10000))
+    }
+    topology_section = config['topology'] if config.has_section('topology') else {}
+    topology = {
+        'flush_interval': int(topology_section.get('flush_interval', 60)),
+        'edge_max_age': float(topology_section.get('edge_max_age_hours', 48)) * 3600
+    }
+    scheduler_section = config['scheduler'] if config.has_section('scheduler') else {}
+    scheduler = {
+        'sync_interval': int(scheduler_section.get('sync_interval', 300)),
+        'trend_interval': int(scheduler_section.get('trend_interval', 60)),
+        'jitter': float(scheduler_section.get('jitter', 5)),
+        'workers': int(scheduler_section.get('workers', 4)),
+        'shutdown_timeout': float(scheduler_section.get('shutdown_timeout', 30))
+    }
+    compression_section = config['trend_compression'] if config.has_section('trend_compression') else {}
+    trend_compression = {
+        'enabled': str(compression_section.get('enabled', 'false')).lower() in ('1', 'true', 'yes', 'on'),
+        'method': compression_section.get('method', 'swinging_door'),
+        'tolerances': {metric: float(compression_section.get(metric, default)) for metric, default in DEFAULT_TOLERANCES.items()},
+        'stats': {'samples': 0, 'removed': 0}
+    }
+    if trend_compression['method'] not in METHODS:
+        raise ValueError(f"Unknown trend_compression method {trend_compression['method']}, use one of {', '.join(METHODS)}")
+    retention_section = config['retention'] if config.has_section('retention') else {}
+    retention = {
+        'enabled': str(retention_section.get('enabled', 'false')).lower() in ('1', 'true', 'yes', 'on'),
+        'interval': int(retention_section.get('interval', 3600)),
+        'raw_days': float(retention_section.get('raw_days', 0)),
+        'packet_days': float(retention_section.get('packet_days', 0)),
+        'rollup_days': {
+            '15min': float(retention_section.get('rollup_15min_days', 0)),
+            'hour': float(retention_section.get('rollup_hour_days', 0)),
+            'day': float(retention_section.get('rollup_day_days', 0))
+        },
+        'batch_rows': int(retention_section.get('batch_rows', 500)),
+        'batch_pause': float(retention_section.get('batch_pause', 0.05)),
+        'vacuum_pages': int(retention_section.get('vacuum_pages', 256))
+    }
     base_location = { # defaults to Boise, ID
         'base_lat': float(config['general'].get('base_lat', 0.0)),
         'base_lon': float(config['general'].get('base_lon', 0.0))
@@ -165,11 +241,21 @@ def initialize_config(config_file: str = None) -> dict[str, Any]:
         'max_retries': max_retries,
         'timezone': timezone,
         'log_level': log_level,
+        'debug_sample': debug_sample,
         'conn': None,
         'logger': None,
         'db_file': db_file,
+        'record_file': None,
+        'write_queue': write_queue,
+        'sqlite': sqlite_settings,
         'api_path': api_path,
+        'api_sync': api_sync,
         'flask_path': flask_path,
+        'journal': journal,
+        'topology': topology,
+        'scheduler': scheduler,
+        'trend_compression': trend_compression,
+        'retention': retention,
         'general': {
             'location': base_location,
             'radius': base_radius
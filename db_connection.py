@@ -0,0 +1,116 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Used when no [database] tuning is passed in (e.g. the tools scripts)
+DEFAULT_SQLITE_SETTINGS = {
+    'cache_size_mb': 32,
+    'mmap_size_mb': 256,
+    'busy_timeout_ms': 5000,
+    'read_pool_size': 4,
+    'read_pool_timeout_ms': 10000
+}
+
+class ReadPoolTimeout(Exception):
+    """
+    No pooled read connection came free within read_pool_timeout_ms, the web app answers 503.
+    """
+
+# Read-only connections for the Flask routes, plus one shared connection for the few routes that write
+read_pool = {
+    'lock': threading.Lock(),
+    'db_path': None,
+    'settings': DEFAULT_SQLITE_SETTINGS,
+    'connections': None,    # queue.Queue of idle read-only connections
+    'created': 0,
+    'write_conn': None,
+    'write_lock': threading.Lock()
+}
+
+def connect_database(db_file, sqlite_settings=None, read_only=False):
+    """
+    Open a connection with the shared tuning: WAL, synchronous=NORMAL, a larger page cache, mmap and a busy timeout.
+    Every connection to the database, logger or web app, should come from here.
+    """
+    settings = sqlite_settings or DEFAULT_SQLITE_SETTINGS
+    if read_only:
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False, timeout=settings['busy_timeout_ms'] / 1000)
+    else:
+        conn = sqlite3.connect(db_file, check_same_thread=False, timeout=settings['busy_timeout_ms'] / 1000)
+        # WAL is stored in the file, readers no longer block the writer and the writer no longer blocks readers
+        conn.execute('PRAGMA journal_mode = WAL')
+        # in WAL mode NORMAL only syncs at checkpoints, a power cut can lose the last commits but not corrupt the file
+        conn.execute('PRAGMA synchronous = NORMAL')
+
+    # PRAGMAs do not take parameters, the values are ints from the config
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}")
+    # a negative cache_size is in KiB
+    conn.execute(f"PRAGMA cache_size = -{int(settings['cache_size_mb'] * 1024)}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size_mb'] * 1024 * 1024)}")
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+def init_read_pool(db_path, sqlite_settings=None):
+    """
+    Point the pool at db_path, closing connections to any previous database.
+    """
+    settings = sqlite_settings or DEFAULT_SQLITE_SETTINGS
+    with read_pool['lock']:
+        if read_pool['connections'] is not None:
+            while not read_pool['connections'].empty():
+                read_pool['connections'].get_nowait().close()
+        if read_pool['write_conn'] is not None:
+            read_pool['write_conn'].close()
+        read_pool['db_path'] = db_path
+        read_pool['settings'] = settings
+        read_pool['connections'] = queue.Queue(maxsize=settings['read_pool_size'])
+        read_pool['created'] = 0
+        read_pool['write_conn'] = None
+
+@contextmanager
+def read_connection():
+    """
+    Borrow a read-only connection from the pool. Once the pool is at read_pool_size, callers wait up to
+    read_pool_timeout_ms for a free one (streamed responses keep theirs until the last chunk) and then get ReadPoolTimeout.
+    """
+    pool = read_pool['connections']
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        with read_pool['lock']:
+            create = read_pool['created'] < pool.maxsize
+            if create:
+                read_pool['created'] += 1
+        if create:
+            try:
+                conn = connect_database(read_pool['db_path'], read_pool['settings'], read_only=True)
+            except Exception:
+                # give the slot back, otherwise a failed connect shrinks the pool for good
+                with read_pool['lock']:
+                    read_pool['created'] -= 1
+                raise
+        else:
+            # tools may pass settings without the pool timeout
+            timeout_ms = read_pool['settings'].get('read_pool_timeout_ms', DEFAULT_SQLITE_SETTINGS['read_pool_timeout_ms'])
+            try:
+                conn = pool.get(timeout=timeout_ms / 1000)
+            except queue.Empty:
+                raise ReadPoolTimeout(f"No read connection free after {timeout_ms} ms") from None
+    try:
+        yield conn
+    finally:
+        # a borrowed connection never goes back with a read transaction still open
+        if conn.in_transaction:
+            conn.rollback()
+        pool.put(conn)
+
+@contextmanager
+def write_connection():
+    """
+    The web app's single write connection, one writer at a time so SQLite never has to arbitrate between them.
+    """
+    with read_pool['write_lock']:
+        if read_pool['write_conn'] is None:
+            read_pool['write_conn'] = connect_database(read_pool['db_path'], read_pool['settings'])
+        yield read_pool['write_conn']
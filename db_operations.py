@@ -1,24 +1,187 @@
+import json
+import gzip
+import hashlib
 import logging
+import queue
 import sqlite3
 import threading
 import traceback
 import requests
-from utils import log_text_to_file, haversine_distance, format_real_number
+import numpy as np
+from utils import haversine_distance, haversine_distances, format_real_number
+from journal import journal_packet
+from db_connection import connect_database
+from packet_history import write_packet_batch
+from node_positions import POSITION_MIGRATION
+from node_cache import WRITE_SEQ_MIGRATION
+from trend_compression import SAMPLE_COLUMNS, compress_samples
 import time
 
 from meshtastic import BROADCAST_NUM
 
 thread_local = threading.local()
 
-def get_db_connection(db_file='nodeData.db'):
+def get_db_connection(db_file='nodeData.db', sqlite_settings=None):
     try:
         if not hasattr(thread_local, 'connection'):
-            thread_local.connection = sqlite3.connect(db_file, check_same_thread=False)
+            thread_local.connection = connect_database(db_file, sqlite_settings)
         return thread_local.connection
     except sqlite3.Error as e:
         logging.error(f"Error connecting to database: {e}")
         return None
 
+# Trend rollup resolutions in seconds, finest first
+TREND_RESOLUTIONS = {'15min': 900, 'hour': 3600, 'day': 86400}
+
+# trendData columns summarized (min/avg/max) in trendRollup
+TREND_METRICS = ('temperature', 'humidity', 'pressure', 'battery_level', 'voltage', 'uptime_seconds', 'altitude', 'sats_in_view', 'snr')
+
+def build_rollup_table():
+    metric_columns = ',\n'.join(f"{m}_min REAL, {m}_max REAL, {m}_sum REAL, {m}_count INTEGER NOT NULL DEFAULT 0" for m in TREND_METRICS)
+    return f'''CREATE TABLE IF NOT EXISTS trendRollup (
+                resolution INTEGER NOT NULL,
+                bucket DATETIME NOT NULL,
+                sender_node_id TEXT NOT NULL,
+                sender_long_name TEXT,
+                sender_short_name TEXT,
+                latitude REAL,
+                longitude REAL,
+                samples INTEGER NOT NULL DEFAULT 0,
+                {metric_columns},
+                PRIMARY KEY (resolution, sender_node_id, bucket)
+            ) WITHOUT ROWID'''
+
+def build_rollup_upsert(source, where, resolution, grouped=False):
+    """
+    Fold rows of source (TelemetryData or trendData) into their trendRollup buckets.
+    Minimums/maximums are merged and sums/counts added, so the average stays exact however the rows arrive.
+    grouped aggregates many rows per bucket first (used for the backfill).
+    """
+    bucket = f"datetime((CAST(strftime('%s', timestamp) AS INTEGER) / {resolution}) * {resolution}, 'unixepoch')"
+    if grouped:
+        # any row's name/position is good enough for a backfilled bucket
+        last = lambda column: f"MAX({column})"
+        metrics = ', '.join(f"MIN({m}), MAX({m}), SUM({m}), COUNT({m})" for m in TREND_METRICS)
+        samples = "COUNT(*)"
+        group_by = f"GROUP BY sender_node_id, {bucket}"
+    else:
+        last = lambda column: column
+        metrics = ', '.join(f"{m}, {m}, {m}, {m} IS NOT NULL" for m in TREND_METRICS)
+        samples = "1"
+        group_by = ""
+
+    metric_columns = ', '.join(f"{m}_min, {m}_max, {m}_sum, {m}_count" for m in TREND_METRICS)
+    merges = ',\n'.join(
+        f"{m}_min = MIN(COALESCE({m}_min, excluded.{m}_min), COALESCE(excluded.{m}_min, {m}_min)), "
+        f"{m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {m}_max)), "
+        f"{m}_sum = CASE WHEN excluded.{m}_sum IS NULL THEN {m}_sum ELSE COALESCE({m}_sum, 0) + excluded.{m}_sum END, "
+        f"{m}_count = {m}_count + excluded.{m}_count"
+        for m in TREND_METRICS)
+
+    return f'''
+        INSERT INTO trendRollup (resolution, bucket, sender_node_id, sender_long_name, sender_short_name, latitude, longitude, samples, {metric_columns})
+        SELECT {resolution}, {bucket}, sender_node_id, {last('sender_long_name')}, {last('sender_short_name')}, {last('latitude')}, {last('longitude')}, {samples}, {metrics}
+        FROM {source}
+        {where}
+        {group_by}
+        ON CONFLICT (resolution, sender_node_id, bucket) DO UPDATE SET
+            sender_long_name = COALESCE(excluded.sender_long_name, sender_long_name),
+            sender_short_name = COALESCE(excluded.sender_short_name, sender_short_name),
+            latitude = COALESCE(excluded.latitude, latitude),
+            longitude = COALESCE(excluded.longitude, longitude),
+            samples = samples + excluded.samples,
+            {merges}
+    '''
+
+# Schema changes applied in order on top of the CREATE TABLEs, PRAGMA user_version records the last one applied
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # trend lookups filter on node and time window and sort by time
+        "CREATE INDEX IF NOT EXISTS idx_trendData_node_time ON trendData (sender_node_id, timestamp)",
+        # sync picks up synced = 0 rows in id order
+        "CREATE INDEX IF NOT EXISTS idx_TelemetryData_synced ON TelemetryData (synced)",
+        # add_trend_data copies and resets trend = 1 AND updated = 1 rows
+        "CREATE INDEX IF NOT EXISTS idx_TelemetryData_trend_updated ON TelemetryData (trend, updated)",
+        # the node cache re-read rows newer than its timestamp watermark (dropped again in 10)
+        "CREATE INDEX IF NOT EXISTS idx_TelemetryData_timestamp ON TelemetryData (timestamp)"
+    ]),
+    (2, [
+        # 15 min / hourly / daily min-avg-max per node, backfilled from the raw trend rows
+        build_rollup_table()
+    ] + [build_rollup_upsert('trendData', "WHERE strftime('%s', timestamp) IS NOT NULL", resolution, grouped=True) for resolution in TREND_RESOLUTIONS.values()]),
+    (3, [
+        # the node directory falls back to short name lookups for nodes the radio has forgotten
+        "CREATE INDEX IF NOT EXISTS idx_TelemetryData_short_name ON TelemetryData (lower(sender_short_name))"
+    ]),
+    (4, [
+        # content hash of what startup priming last wrote per node
+        "CREATE TABLE IF NOT EXISTS primeState (sender_node_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL) WITHOUT ROWID"
+    ]),
+    (5, [
+        # append-only history of every received packet, written in batches by the DB writer
+        '''CREATE TABLE IF NOT EXISTS packets (
+                id INTEGER PRIMARY KEY,
+                rx_time INTEGER NOT NULL,
+                from_num INTEGER,
+                to_num INTEGER,
+                packet_id INTEGER,
+                portnum INTEGER,
+                channel INTEGER,
+                rx_snr REAL,
+                rx_rssi INTEGER,
+                hop_limit INTEGER,
+                hop_start INTEGER,
+                via_mqtt INTEGER,
+                payload_size INTEGER
+            )''',
+        "CREATE INDEX IF NOT EXISTS idx_packets_node_time ON packets (from_num, rx_time)",
+        "CREATE INDEX IF NOT EXISTS idx_packets_portnum_time ON packets (portnum, rx_time)"
+    ]),
+    (6, [
+        # mesh topology, to_num heard from_num, from NEIGHBORINFO_APP and traceroutes
+        '''CREATE TABLE IF NOT EXISTS edges (
+                from_num INTEGER NOT NULL,
+                to_num INTEGER NOT NULL,
+                snr REAL,
+                last_seen INTEGER NOT NULL,
+                source TEXT,
+                PRIMARY KEY (from_num, to_num)
+            ) WITHOUT ROWID''',
+        "CREATE INDEX IF NOT EXISTS idx_edges_last_seen ON edges (last_seen)",
+        # small key/value facts shared between the logger and the web app (e.g. our node number)
+        "CREATE TABLE IF NOT EXISTS meshState (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID"
+    ]),
+    # R*Tree of node positions for /get-telemetry-data bbox and radius queries
+    (7, POSITION_MIGRATION),
+    (8, [
+        # per node swinging door / deadband state of the trend compression (JSON)
+        "CREATE TABLE IF NOT EXISTS trendCompression (sender_node_id TEXT PRIMARY KEY, state TEXT NOT NULL) WITHOUT ROWID"
+    ]),
+    (9, [
+        # bumped by every write that sets synced = 0, the sync only marks a row synced if it is unchanged since it was read
+        "ALTER TABLE TelemetryData ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0"
+    ]),
+    # table wide write sequence the node cache refreshes from, kept by triggers so every writer moves it
+    (10, WRITE_SEQ_MIGRATION)
+]
+
+def migrate_database(conn, logger):
+    """
+    Apply the SCHEMA_MIGRATIONS newer than the database's user_version, each in its own transaction.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for migration_version, statements in SCHEMA_MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            # PRAGMA does not take parameters, migration_version is always one of our ints
+            conn.execute(f'PRAGMA user_version = {int(migration_version)}')
+        logger.info(f"Database schema migrated to version {migration_version}.")
+        version = migration_version
+    return version
+
 def initialize_database(system_config):
     logger = system_config['logger']
     try:
@@ -52,7 +215,7 @@ def initialize_database(system_config):
                     publicKey TEXT,
                     updated	INTEGER DEFAULT 0,
                     trend INTEGER DEFAULT 0,
-                    synced INTEGER 0
+                    synced INTEGER DEFAULT 0
                 );
                 ''')
         c.execute('''CREATE TABLE IF NOT EXISTS trendData (
@@ -75,15 +238,153 @@ def initialize_database(system_config):
                     synced INTEGER DEFAULT 0
                 );
                 ''')
+        # last values the sync server acknowledged per node, so only changed columns are sent
+        c.execute('''CREATE TABLE IF NOT EXISTS syncState (
+                    sender_node_id TEXT PRIMARY KEY,
+                    sent TEXT NOT NULL
+                );
+                ''')
 
         conn.commit()
 
+        migrate_database(conn, logger)
+
         logger.info("Database initialized.")
 
     except sqlite3.Error as e:
         logger.error(f"Error initializing database: {e}")
         logger.error(traceback.format_exc())  # Log the full traceback for debugging
 
+# Columns upsert_node_data may write, in the order they appear in the upsert statement
+NODE_COLUMNS = (
+    'sender_long_name', 'sender_short_name', 'to_node_id', 'temperature', 'humidity', 'pressure',
+    'battery_level', 'voltage', 'uptime_seconds', 'latitude', 'longitude', 'miles_to_base',
+    'altitude', 'sats_in_view', 'neighbor_node_id', 'snr', 'hardware_model', 'mac_address',
+    'role', 'mqtt', 'publicKey', 'updated', 'trend', 'synced', 'timestamp'
+)
+
+# Prepared upsert statements keyed by the tuple of columns present in the row
+upsert_statements = {}
+
+def build_node_row(
+    system_config,
+    timestamp=None,
+    sender_short_name=None,
+    to_node_id=None,
+    temperature=None,
+    humidity=None,
+    pressure=None,
+    battery_level=None,
+    voltage=None,
+    uptime_seconds=None,
+    latitude=None,
+    longitude=None,
+    altitude=None,
+    sats_in_view=None,
+    neighbor_node_id=None,
+    snr=None,
+    hardware_model=None,
+    mac_address=None,
+    sender_long_name=None,
+    role=None,
+    dst_to_bs=None,
+    viaMqtt=0,
+    publicKey=None,
+    updated=1,
+    trend=None,
+    set_timestamp=True
+    ):
+    """
+    Turn the upsert_node_data arguments into a {column: value} dict holding only the columns that should be written.
+    Falsy values never overwrite what is stored, miles_to_base is derived from lat/lon and synced is always reset.
+    A timestamp of None with set_timestamp means "now", which the statement fills in with datetime('now','localtime').
+    """
+    row = {}
+
+    if sender_long_name:
+        row['sender_long_name'] = sender_long_name
+    if sender_short_name:
+        row['sender_short_name'] = sender_short_name
+    if to_node_id:
+        row['to_node_id'] = to_node_id
+    if temperature:
+        row['temperature'] = temperature
+    if humidity:
+        row['humidity'] = humidity
+    if pressure:
+        row['pressure'] = pressure
+    if battery_level:
+        row['battery_level'] = battery_level
+    if voltage:
+        row['voltage'] = voltage
+    if uptime_seconds:
+        row['uptime_seconds'] = uptime_seconds
+    if latitude and longitude:
+        row['latitude'] = latitude
+        row['longitude'] = longitude
+        # calculate distance to base station
+        row['miles_to_base'] = format_real_number(haversine_distance(system_config['general']['location']['base_lat'], system_config['general']['location']['base_lon'], latitude, longitude))
+    if altitude:
+        row['altitude'] = altitude
+    if sats_in_view:
+        row['sats_in_view'] = sats_in_view
+    if neighbor_node_id:
+        row['neighbor_node_id'] = neighbor_node_id
+    if snr:
+        row['snr'] = snr
+    if hardware_model:
+        row['hardware_model'] = hardware_model
+    if mac_address:
+        row['mac_address'] = mac_address
+    if role:
+        row['role'] = role
+    if dst_to_bs:
+        row['miles_to_base'] = dst_to_bs
+    if viaMqtt == 0:
+        row['mqtt'] = viaMqtt
+    if publicKey:
+        row['publicKey'] = publicKey
+    if updated:
+        row['updated'] = updated
+    if trend:
+        row['trend'] = trend
+    row['synced'] = 0
+    if set_timestamp:
+        row['timestamp'] = timestamp
+
+    return row
+
+def get_upsert_statement(columns):
+    """
+    Return the single INSERT ... ON CONFLICT statement that writes the given columns, building it on first use.
+    """
+    statement = upsert_statements.get(columns)
+    if statement is None:
+        values = []
+        updates = []
+        for column in columns:
+            if column == 'timestamp':
+                # a missing timestamp means "now", same as the old per-field UPDATE did
+                values.append("COALESCE(?, datetime('now','localtime'))")
+            else:
+                values.append('?')
+            updates.append(f"{column} = COALESCE(excluded.{column}, {column})")
+        if 'synced' in columns:
+            updates.append("change_seq = change_seq + 1")
+
+        statement = f'''INSERT INTO TelemetryData (sender_node_id, {', '.join(columns)})
+                        VALUES (?, {', '.join(values)})
+                        ON CONFLICT(sender_node_id) DO UPDATE SET {', '.join(updates)}'''
+        upsert_statements[columns] = statement
+    return statement
+
+def execute_node_upsert(conn, sender_node_id, row):
+    """
+    Write one row built by build_node_row. The caller owns the transaction.
+    """
+    columns = tuple(row)
+    conn.execute(get_upsert_statement(columns), (sender_node_id, *row.values()))
+
 def upsert_node_data(
     system_config, 
     sender_node_id, 
@@ -123,103 +424,322 @@ def upsert_node_data(
         if conn is None or conn.cursor() is None:
             logging.error("Cannot operate on a closed database.")
             return
-        
+
+        row = build_node_row(
+            system_config,
+            timestamp=timestamp,
+            sender_short_name=sender_short_name,
+            to_node_id=to_node_id,
+            temperature=temperature,
+            humidity=humidity,
+            pressure=pressure,
+            battery_level=battery_level,
+            voltage=voltage,
+            uptime_seconds=uptime_seconds,
+            latitude=latitude,
+            longitude=longitude,
+            altitude=altitude,
+            sats_in_view=sats_in_view,
+            neighbor_node_id=neighbor_node_id,
+            snr=snr,
+            hardware_model=hardware_model,
+            mac_address=mac_address,
+            sender_long_name=sender_long_name,
+            role=role,
+            dst_to_bs=dst_to_bs,
+            viaMqtt=viaMqtt,
+            publicKey=publicKey,
+            updated=updated,
+            trend=trend,
+            set_timestamp=set_timestamp
+        )
+
         with conn:
-            # create the initial row with the ID, then update what is not None
-            conn.execute('''INSERT INTO TelemetryData (sender_node_id) VALUES (?) ON CONFLICT(sender_node_id) DO NOTHING''', (sender_node_id,))
-            logger.info(f"Inserted data for {sender_long_name} ({sender_short_name}) [{sender_node_id}]")
-
-            if sender_long_name:
-                conn.execute('''UPDATE TelemetryData SET sender_long_name = ? WHERE sender_node_id = ?''', (sender_long_name, sender_node_id))
-                logger.debug(f"--- Updated sender_long_name: {sender_long_name}")
-            if sender_short_name:
-                conn.execute('''UPDATE TelemetryData SET sender_short_name = ? WHERE sender_node_id = ?''', (sender_short_name, sender_node_id))
-                logger.debug(f"--- Updated sender_short_name: {sender_short_name}")
-            if to_node_id:
-                conn.execute('''UPDATE TelemetryData SET to_node_id = ? WHERE sender_node_id = ?''', (to_node_id, sender_node_id))
-                logger.debug(f"--- Updated to_node_id: {to_node_id}")
-            if temperature:
-                conn.execute('''UPDATE TelemetryData SET temperature = ? WHERE sender_node_id = ?''', (temperature, sender_node_id))
-                logger.debug(f"--- Updated temperature: {temperature}")
-            if humidity:
-                conn.execute('''UPDATE TelemetryData SET humidity = ? WHERE sender_node_id = ?''', (humidity, sender_node_id))
-                logger.debug(f"--- Updated humidity: {humidity}")
-            if pressure:
-                conn.execute('''UPDATE TelemetryData SET pressure = ? WHERE sender_node_id = ?''', (pressure, sender_node_id))
-                logger.debug(f"--- Updated pressure: {pressure}")
-            if battery_level:
-                conn.execute('''UPDATE TelemetryData SET battery_level = ? WHERE sender_node_id = ?''', (battery_level, sender_node_id))
-                logger.debug(f"--- Updated battery_level: {battery_level}")
-            if voltage:
-                conn.execute('''UPDATE TelemetryData SET voltage = ? WHERE sender_node_id = ?''', (voltage, sender_node_id))
-                logger.debug(f"--- Updated voltage: {voltage}")
-            if uptime_seconds:
-                conn.execute('''UPDATE TelemetryData SET uptime_seconds = ? WHERE sender_node_id = ?''', (uptime_seconds, sender_node_id))
-                logger.debug(f"--- Updated uptime_seconds: {uptime_seconds}")
-            if latitude and longitude:
-                conn.execute('''UPDATE TelemetryData SET latitude = ? WHERE sender_node_id = ?''', (latitude, sender_node_id))
-                logger.debug(f"--- Updated latitude: {latitude}")
-                conn.execute('''UPDATE TelemetryData SET longitude = ? WHERE sender_node_id = ?''', (longitude, sender_node_id))
-                logger.debug(f"--- Updated longitude: {longitude}")
-                # calculate distance to base station
-                # These are for boise, ID. Maybe change to a variable later
-                distance = format_real_number(haversine_distance(system_config['general']['location']['base_lat'],system_config['general']['location']['base_lon'], latitude, longitude))
-                conn.execute('''UPDATE TelemetryData SET miles_to_base = ? WHERE sender_node_id = ?''', (distance, sender_node_id))
-                logger.debug(f"--- Updated miles_to_base: {distance}")
-            if altitude:
-                conn.execute('''UPDATE TelemetryData SET altitude = ? WHERE sender_node_id = ?''', (altitude, sender_node_id))
-                logger.debug(f"--- Updated altitude: {altitude}")
-            if sats_in_view:
-                conn.execute('''UPDATE TelemetryData SET sats_in_view = ? WHERE sender_node_id = ?''', (sats_in_view, sender_node_id))
-                logger.debug(f"--- Updated sats_in_view: {sats_in_view}")
-            if neighbor_node_id:
-                conn.execute('''UPDATE TelemetryData SET neighbor_node_id = ? WHERE sender_node_id = ?''', (neighbor_node_id, sender_node_id))
-                logger.debug(f"--- Updated neighbor_node_id: {neighbor_node_id}")
-            if snr:
-                conn.execute('''UPDATE TelemetryData SET snr = ? WHERE sender_node_id = ?''', (snr, sender_node_id))
-                logger.debug(f"--- Updated snr: {snr}")
-            if hardware_model:
-                conn.execute('''UPDATE TelemetryData SET hardware_model = ? WHERE sender_node_id = ?''', (hardware_model, sender_node_id))
-                logger.debug(f"--- Updated hardware_model: {hardware_model}")
-            if mac_address:
-                conn.execute('''UPDATE TelemetryData SET mac_address = ? WHERE sender_node_id = ?''', (mac_address, sender_node_id))
-                logger.debug(f"--- Updated mac_address: {mac_address}")
-            if role:
-                conn.execute('''UPDATE TelemetryData SET role = ? WHERE sender_node_id = ?''', (role, sender_node_id))
-                logger.debug(f"--- Updated role: {role}")
-            if dst_to_bs:
-                conn.execute('''UPDATE TelemetryData SET miles_to_base = ? WHERE sender_node_id = ?''', (dst_to_bs, sender_node_id))
-                logger.debug(f"--- Updated miles_to_base: {dst_to_bs}")
-            if viaMqtt == 0:
-                conn.execute('''UPDATE TelemetryData SET mqtt = ? WHERE sender_node_id = ?''', (viaMqtt, sender_node_id))
-                system_config['logger'].debug(f"--- Updated mqtt: {viaMqtt}")
-            if publicKey:
-                conn.execute('''UPDATE TelemetryData SET publicKey = ? WHERE sender_node_id = ?''', (publicKey, sender_node_id))
-                system_config['logger'].debug(f"--- Updated publicKey: {publicKey}")
-            if updated:
-                conn.execute('''UPDATE TelemetryData SET updated = ? WHERE sender_node_id = ?''', (updated, sender_node_id))
-                system_config['logger'].debug(f"--- Updated updated: {updated}")
-            if trend:
-                conn.execute('''UPDATE TelemetryData SET trend = ? WHERE sender_node_id = ?''', (trend, sender_node_id))
-                system_config['logger'].debug(f"--- Updated trend: {trend}")
-            if True:
-                conn.execute('''UPDATE TelemetryData SET synced = ? WHERE sender_node_id = ?''', (0, sender_node_id))
-                logger.debug(f"--- Updated synced: False")
-            if timestamp and set_timestamp:
-                conn.execute('''UPDATE TelemetryData SET timestamp = ? WHERE sender_node_id = ?''', (timestamp, sender_node_id))
-                logger.debug(f"--- Updated timestamp: {timestamp}")
-            elif set_timestamp:
-                conn.execute('''UPDATE TelemetryData 
-                                SET timestamp = datetime('now','localtime') 
-                                WHERE sender_node_id = ?;''', (sender_node_id,))
-
-            
-
-            logger.info(f"--------------------------------------------------------")
+            # one statement creates the row if needed and merges in what is not None
+            execute_node_upsert(conn, sender_node_id, row)
+        # once per packet, so DEBUG only; %-style arguments are only formatted if the record is actually emitted
+        logger.debug("Inserted data for %s (%s) [%s]", sender_long_name, sender_short_name, sender_node_id)
+        logger.debug("--- Updated %s", row, extra={'node_id': sender_node_id})
 
     except sqlite3.Error as e:
         logging.error(f"Error inserting or updating telemetry data: {e}")
 
+def start_db_writer(system_config):
+    """
+    Start the background writer that drains queued packets into the database, one transaction per batch.
+    Settings come from system_config['write_queue'] (batch_rows, batch_ms, queue_size).
+    """
+    settings = system_config['write_queue']
+
+    writer = {
+        'queue': queue.Queue(maxsize=settings['queue_size']),
+        'packet_queue': queue.Queue(maxsize=settings['packet_queue_size']),
+        'stop': threading.Event(),
+        'thread': None,
+        'stats': {
+            'queued': 0,        # packets accepted by queue_node_data
+            'written': 0,       # rows committed
+            'failed': 0,        # rows rejected by sqlite
+            'batches': 0,       # transactions committed
+            'blocked': 0,       # times the radio thread had to wait for room in the queue
+            'dropped': 0,       # packets given up on because the queue stayed full
+            'late_dropped': 0,  # packets that arrived after shutdown started
+            'max_depth': 0,     # deepest the queue has been
+            'last_batch_rows': 0,
+            'last_batch_ms': 0.0,
+            'packets_written': 0,   # packet history rows committed
+            'packets_dropped': 0,   # packet history rows lost to a full queue or a failed insert
+            'packets_late': 0       # packet history rows that arrived after shutdown started
+        }
+    }
+    system_config['db_writer'] = writer
+
+    writer['thread'] = threading.Thread(target=db_writer_loop, args=(system_config,), name='db_writer')
+    writer['thread'].daemon = True
+    writer['thread'].start()
+
+    system_config['logger'].info(f"DB writer started (batch of {settings['batch_rows']} rows or {settings['batch_ms']} ms, queue of {settings['queue_size']}).")
+    return writer
+
+def queue_node_data(system_config, sender_node_id, block_timeout=1.0, **fields):
+    """
+    Hand a packet to the background writer. Takes the same keyword arguments as upsert_node_data.
+    Without a writer (tools, startup) the packet is upserted directly. Once stop_db_writer has been called
+    late packets are counted and dropped: the writer's final flush and the shutdown own the connection then.
+    """
+    writer = system_config.get('db_writer')
+    if writer is None:
+        upsert_node_data(system_config, sender_node_id, **fields)
+        return True
+    if writer['stop'].is_set():
+        writer['stats']['late_dropped'] += 1
+        system_config['logger'].debug("DB writer stopping, dropped packet from %s", sender_node_id)
+        return False
+
+    stats = writer['stats']
+    item = (sender_node_id, fields)
+    try:
+        writer['queue'].put_nowait(item)
+    except queue.Full:
+        # backpressure: wait a little for the writer before giving up on the packet
+        stats['blocked'] += 1
+        try:
+            writer['queue'].put(item, timeout=block_timeout)
+        except queue.Full:
+            stats['dropped'] += 1
+            system_config['logger'].error(f"DB write queue full, dropped packet from {sender_node_id} ({stats['dropped']} dropped so far)")
+            return False
+
+    stats['queued'] += 1
+    depth = writer['queue'].qsize()
+    if depth > stats['max_depth']:
+        stats['max_depth'] = depth
+    return True
+
+def write_node_batch(system_config, batch):
+    """
+    Upsert a list of (sender_node_id, fields) in one transaction.
+    If the transaction fails, each row is retried on its own so one bad row does not lose the batch.
+    """
+    logger = system_config['logger']
+    conn = system_config['conn']
+    stats = system_config['db_writer']['stats']
+
+    rows = [(sender_node_id, build_node_row(system_config, **fields)) for sender_node_id, fields in batch]
+
+    start = time.perf_counter()
+    try:
+        with conn:
+            for sender_node_id, row in rows:
+                execute_node_upsert(conn, sender_node_id, row)
+        stats['written'] += len(rows)
+    except sqlite3.Error as e:
+        logger.error(f"Error writing batch of {len(rows)} rows, retrying one at a time: {e}")
+        for sender_node_id, row in rows:
+            try:
+                with conn:
+                    execute_node_upsert(conn, sender_node_id, row)
+                stats['written'] += 1
+            except sqlite3.Error as e:
+                stats['failed'] += 1
+                logger.error(f"Error inserting or updating telemetry data for {sender_node_id}: {e}")
+
+    stats['batches'] += 1
+    stats['last_batch_rows'] = len(rows)
+    stats['last_batch_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    logger.debug("--- Wrote batch of %d rows in %s ms", len(rows), stats['last_batch_ms'])
+
+def db_writer_loop(system_config):
+    """
+    This function runs in its own thread and commits queued packets in batches.
+    A batch is flushed when it reaches batch_rows or batch_ms after its first packet.
+    Packet history is written after every node batch, and every 0.5 s while no node packets arrive.
+    """
+    writer = system_config['db_writer']
+    settings = system_config['write_queue']
+    max_rows = settings['batch_rows']
+    max_delay = settings['batch_ms'] / 1000.0
+    packets = writer['queue']
+
+    while not (writer['stop'].is_set() and packets.empty()):
+        try:
+            first = packets.get(timeout=0.5)
+        except queue.Empty:
+            # undecoded traffic only feeds the history queue, so it has to be drained without node packets too
+            try:
+                write_packet_batch(system_config)
+            except Exception as e:
+                system_config['logger'].error(f"DB writer error: {e}")
+                system_config['logger'].debug(traceback.format_exc())
+            continue
+
+        batch = [first]
+        deadline = time.monotonic() + max_delay
+        while len(batch) < max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(packets.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            write_node_batch(system_config, batch)
+            # packet history goes in its own transaction so a problem there never rolls back node rows
+            write_packet_batch(system_config)
+        except Exception as e:
+            system_config['logger'].error(f"DB writer error: {e}")
+            system_config['logger'].debug(traceback.format_exc())
+
+    write_packet_batch(system_config)
+
+def stop_db_writer(system_config, timeout=10):
+    """
+    Stop accepting packets, flush whatever is still queued and wait for the writer thread to finish.
+    """
+    writer = system_config.get('db_writer')
+    if writer is None:
+        return
+
+    writer['stop'].set()
+    writer['thread'].join(timeout)
+    if writer['thread'].is_alive():
+        system_config['logger'].error(f"DB writer did not finish within {timeout} s, {writer['queue'].qsize()} packets left unwritten.")
+
+    system_config['logger'].info(f"DB writer stopped: {writer['stats']}")
+
+# Copy every node flagged for trending that changed since the last sample into trendData
+TREND_INSERT_QUERY = '''
+    INSERT INTO trendData (timestamp, sender_node_id, sender_long_name, sender_short_name,
+                        latitude, longitude, temperature, humidity, pressure, battery_level, voltage,
+                        uptime_seconds, altitude, sats_in_view, snr)
+    SELECT timestamp, sender_node_id, sender_long_name, sender_short_name,
+        latitude, longitude, temperature, humidity, pressure, battery_level, voltage,
+        uptime_seconds, altitude, sats_in_view, snr
+    FROM TelemetryData
+    WHERE trend = 1
+    AND updated = 1
+    AND latitude IS NOT NULL
+    AND longitude IS NOT NULL;
+'''
+
+# The same rows as samples for the trend compression
+TREND_SAMPLE_QUERY = f'''
+    SELECT {', '.join(SAMPLE_COLUMNS)}
+    FROM TelemetryData
+    WHERE trend = 1
+    AND updated = 1
+    AND latitude IS NOT NULL
+    AND longitude IS NOT NULL;
+'''
+
+# Fold the same rows into every rollup resolution, run before TREND_RESET_QUERY clears 'updated'
+TREND_ROLLUP_QUERIES = [build_rollup_upsert('TelemetryData', '''
+    WHERE trend = 1
+    AND updated = 1
+    AND latitude IS NOT NULL
+    AND longitude IS NOT NULL
+    AND strftime('%s', timestamp) IS NOT NULL''', resolution) for resolution in TREND_RESOLUTIONS.values()]
+
+TREND_RESET_QUERY = '''
+    UPDATE TelemetryData
+    SET updated = 0
+    WHERE trend = 1
+    AND updated = 1
+    AND latitude IS NOT NULL
+    AND longitude IS NOT NULL;
+'''
+
+# Columns /get-trend-data can return, in SELECT * order for raw rows; rollup buckets carry min/max and samples instead
+TREND_RAW_FIELDS = ('id', 'timestamp', 'sender_node_id', 'sender_long_name', 'sender_short_name', 'latitude', 'longitude') + TREND_METRICS + ('synced',)
+TREND_ROLLUP_FIELDS = ('timestamp', 'sender_node_id', 'sender_long_name', 'sender_short_name', 'latitude', 'longitude', 'samples') + \
+    tuple(column for m in TREND_METRICS for column in (m, f"{m}_min", f"{m}_max"))
+
+def build_trend_query(fields, with_since, with_cursor):
+    """
+    Raw trend rows of one node, newest first, as id, timestamp, then the requested fields.
+    Parameters: the node id, the optional since timestamp, then timestamp, timestamp, id of the last row already sent.
+    (timestamp, id) is the (sender_node_id, timestamp) index order, so a page starts where the previous one stopped.
+    """
+    date_filter = "AND timestamp >= ?" if with_since else ""
+    cursor_filter = "AND (timestamp < ? OR (timestamp = ? AND id < ?))" if with_cursor else ""
+    return f'''
+        SELECT id, timestamp, {', '.join(fields)}
+        FROM trendData
+        WHERE sender_node_id = ?
+        {date_filter}
+        {cursor_filter}
+        ORDER BY timestamp DESC, id DESC;
+    '''
+
+def build_rollup_query(fields, with_since, with_cursor):
+    """
+    Rollup buckets of one resolution and one node, newest first, as bucket, then the requested fields
+    (a metric is the bucket average). Parameters: resolution, the node id, the optional since timestamp, then the last bucket sent.
+    """
+    columns = []
+    for field in fields:
+        if field == 'timestamp':
+            columns.append("bucket AS timestamp")
+        elif field in TREND_METRICS:
+            columns.append(f"ROUND({field}_sum / {field}_count, 2) AS {field}")
+        else:
+            columns.append(field)
+    date_filter = "AND bucket >= ?" if with_since else ""
+    cursor_filter = "AND bucket < ?" if with_cursor else ""
+    return f'''
+        SELECT bucket, {', '.join(columns)}
+        FROM trendRollup
+        WHERE resolution = ?
+        AND sender_node_id = ?
+        {date_filter}
+        {cursor_filter}
+        ORDER BY bucket DESC;
+    '''
+
+def build_trend_range_query(node_count, with_since):
+    """
+    Oldest and newest rollup bucket for node_count nodes (optionally from the since timestamp on), used to size
+    the window for resolution=auto. Rollups outlive raw rows, so this is the range the data actually covers.
+    """
+    date_filter = "AND bucket >= ?" if with_since else ""
+    return f"""
+        SELECT MIN(bucket), MAX(bucket) FROM trendRollup
+        WHERE resolution IN ({','.join(str(seconds) for seconds in TREND_RESOLUTIONS.values())})
+        AND sender_node_id IN ({','.join(['?'] * node_count)}) {date_filter}
+    """
+
+def pick_trend_resolution(window_seconds, target_points):
+    """
+    Coarsest rollup that still gives at least target_points buckets over the window, or 'raw' if none does.
+    """
+    best = 'raw'
+    for name, seconds in TREND_RESOLUTIONS.items():
+        if window_seconds / seconds >= target_points:
+            best = name
+    return best
+
 def add_trend_data(system_config):
     
     logger = system_config['logger']
@@ -232,31 +752,25 @@ def add_trend_data(system_config):
             logger.error("Cannot operate on a closed database.")
             return
         
+        compression = system_config['trend_compression']
         with conn:
-            # Insert the data into trendData
-            conn.execute('''
-                INSERT INTO trendData (timestamp, sender_node_id, sender_long_name, sender_short_name,
-                                    latitude, longitude, temperature, humidity, pressure, battery_level, voltage,
-                                    uptime_seconds, altitude, sats_in_view, snr)
-                SELECT timestamp, sender_node_id, sender_long_name, sender_short_name,
-                    latitude, longitude, temperature, humidity, pressure, battery_level, voltage,
-                    uptime_seconds, altitude, sats_in_view, snr
-                FROM TelemetryData
-                WHERE trend = 1
-                AND updated = 1
-                AND latitude IS NOT NULL
-                AND longitude IS NOT NULL;
-            ''')
+            if compression['enabled']:
+                # Every sample goes in, a previous tail row the new one still fits the line of comes out
+                samples, removed = compress_samples(conn, conn.execute(TREND_SAMPLE_QUERY).fetchall(), compression)
+                stats = compression['stats']
+                stats['samples'] += samples
+                stats['removed'] += removed
+                logger.info(f"Trend samples: {samples} written, {removed} superseded. {stats['samples'] - stats['removed']} of {stats['samples']} samples kept since startup.")
+            else:
+                # Insert the data into trendData
+                conn.execute(TREND_INSERT_QUERY)
+
+            # Keep the 15 min / hourly / daily rollups current with the same rows
+            for query in TREND_ROLLUP_QUERIES:
+                conn.execute(query)
 
             # Set the 'updated' column to 0 after inserting the data
-            conn.execute('''
-                UPDATE TelemetryData
-                SET updated = 0
-                WHERE trend = 1
-                AND updated = 1
-                AND latitude IS NOT NULL
-                AND longitude IS NOT NULL;
-            ''')
+            conn.execute(TREND_RESET_QUERY)
 
             logger.info("Trend data added and 'updated' field reset to 0.")
             logger.info("--------------------------------------------------------")
@@ -264,8 +778,94 @@ def add_trend_data(system_config):
     except sqlite3.Error as e:
         logger.error(f"Error adding trend data: {e}")
 
+# The base location the stored miles_to_base values were computed from
+BASE_LOCATION_QUERY = "SELECT value FROM meshState WHERE key = 'base_location'"
+BASE_LOCATION_UPSERT = '''INSERT INTO meshState (key, value) VALUES ('base_location', ?)
+                          ON CONFLICT(key) DO UPDATE SET value = excluded.value'''
+NODE_POSITIONS_QUERY = 'SELECT id, latitude, longitude, miles_to_base FROM TelemetryData WHERE latitude AND longitude'
+# synced = 0 so the sync server gets the new distances too
+MILES_TO_BASE_UPDATE = 'UPDATE TelemetryData SET miles_to_base = ?, synced = 0, change_seq = change_seq + 1 WHERE id = ?'
+
+def recompute_miles_to_base(system_config, force=False):
+    """
+    When the base location differs from the one the stored distances were computed from, recompute miles_to_base
+    for every node with a position in one vectorized pass and one transaction. Returns the number of rows changed.
+    """
+    logger = system_config['logger']
+    conn = system_config['conn']
+    location = system_config['general']['location']
+    base = f"{location['base_lat']},{location['base_lon']}"
+
+    stored = conn.execute(BASE_LOCATION_QUERY).fetchone()
+    if stored is not None and stored[0] == base and not force:
+        return 0
+
+    start = time.perf_counter()
+    rows = conn.execute(NODE_POSITIONS_QUERY).fetchall()
+    updates = []
+    if rows:
+        ids, lats, lons, miles = (np.array(column, dtype=np.float64) for column in zip(*rows))
+        # rounded like build_node_row's format_real_number, so unchanged distances are not rewritten
+        distances = np.round(haversine_distances(location['base_lat'], location['base_lon'], lats, lons), 2)
+        changed = distances != miles    # NULL miles come through as NaN and always differ
+        updates = list(zip(distances[changed].tolist(), ids[changed].astype(np.int64).tolist()))
+
+    with conn:
+        conn.executemany(MILES_TO_BASE_UPDATE, updates)
+        conn.execute(BASE_LOCATION_UPSERT, (base,))
+    logger.info(f"Base location is {base}, miles_to_base recomputed for {len(rows)} nodes ({len(updates)} changed) in {time.perf_counter() - start:.3f} s.")
+    return len(updates)
+
+# Last primed content per node, so unchanged nodes are skipped on the next startup.
+# Only nodes whose TelemetryData row still exists count, a cleared or deleted row is primed again.
+PRIME_STATE_QUERY = '''SELECT p.sender_node_id, p.content_hash FROM primeState p
+                       JOIN TelemetryData t ON t.sender_node_id = p.sender_node_id'''
+PRIME_STATE_UPSERT = '''INSERT INTO primeState (sender_node_id, content_hash) VALUES (?, ?)
+                        ON CONFLICT(sender_node_id) DO UPDATE SET content_hash = excluded.content_hash'''
+
+def node_content_hash(row):
+    return hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def build_prime_row(system_config, node):
+    """
+    Turn one interface.nodes entry into (sender_node_id, row), or None if the node has no id.
+    """
+    user_data = node.get('user', {})
+    position_data = node.get('position', {})
+    device_metrics = node.get('deviceMetrics', {})
+
+    sender_node_id = user_data.get('id')
+    if not sender_node_id:
+        return None
+
+    row = build_node_row(
+        system_config,
+        sender_short_name=user_data.get('shortName'),
+        sender_long_name=user_data.get('longName'),
+        mac_address=user_data.get('macaddr'),
+        hardware_model=user_data.get('hwModel'),
+        publicKey=user_data.get('publicKey', None),
+        latitude=position_data.get('latitude'),
+        longitude=position_data.get('longitude'),
+        altitude=position_data.get('altitude'),
+        sats_in_view=position_data.get('satsInView'),
+        battery_level=device_metrics.get('batteryLevel'),
+        voltage=device_metrics.get('voltage'),
+        uptime_seconds=device_metrics.get('uptimeSeconds'),
+        snr=node.get('snr'),
+        role=user_data.get('role'),
+        set_timestamp=False
+    )
+    return sender_node_id, row
+
 def process_and_insert_telemetry_data(system_config, interface):
+    """
+    Prime TelemetryData from the radio's node DB: one executemany per column set, all in one transaction.
+    Nodes whose content hash matches the last run are skipped. Returns a report dict.
+    """
     logger = system_config['logger']
+    start = time.perf_counter()
+    report = {'nodes': 0, 'primed': 0, 'unchanged': 0, 'skipped': 0, 'seconds': 0.0}
 
     try:
         conn = system_config['conn']
@@ -273,62 +873,174 @@ def process_and_insert_telemetry_data(system_config, interface):
         # Ensure the connection is open
         if conn is None or conn.cursor() is None:
             logging.error("Cannot operate on a closed database.")
-            return
-        
-        interface_values = interface.nodes.values()
-        #  Disable logging for the loop
-        logging.getLogger().setLevel(logging.CRITICAL + 1)
-
-        log_text_to_file('', './logs/INTERFACE_DATA.txt', clear_first=True)
-
-        for node in interface_values:
-            user_data = node.get('user', {})
-            position_data = node.get('position', {})
-            device_metrics = node.get('deviceMetrics', {})
-
-            # Log the user data to ensure it contains the publicKey
-            logger.debug(f"user_data for node {node.get('id', 'unknown')}: {user_data}")
-            
-            sender_node_id = user_data.get('id')
-            
-            if not sender_node_id:
-                logger.error(f"Missing sender_node_id for node: {user_data}")
+            return report
+
+        known_hashes = dict(conn.execute(PRIME_STATE_QUERY).fetchall())
+
+        groups = {}     # column tuple -> parameter rows
+        hashes = []
+        for node in list(interface.nodes.values()):
+            journal_packet(system_config, 'INTERFACE_DATA', node)
+            report['nodes'] += 1
+
+            prime_row = build_prime_row(system_config, node)
+            if prime_row is None:
+                logger.error("Missing sender_node_id for node: %s", node.get('user', {}))
+                report['skipped'] += 1
                 continue
 
-            publicKey = user_data.get('publicKey', None)
-            logger.debug(f"Public key for node {sender_node_id}: {publicKey}")
-            
-            upsert_node_data(
-                conn,
-                sender_node_id=sender_node_id,
-                sender_short_name=user_data.get('shortName'),
-                sender_long_name=user_data.get('longName'),
-                mac_address=user_data.get('macaddr'),
-                hardware_model=user_data.get('hwModel'),
-                publicKey=publicKey,
-                latitude=position_data.get('latitude'),
-                longitude=position_data.get('longitude'),
-                altitude=position_data.get('altitude'),
-                sats_in_view=position_data.get('satsInView'),
-                battery_level=device_metrics.get('batteryLevel'),
-                voltage=device_metrics.get('voltage'),
-                uptime_seconds=device_metrics.get('uptimeSeconds'),
-                snr=node.get('snr'),
-                role=user_data.get('role'),
-                set_timestamp=False
-            )
-        # Re-enable logging
-        logging.getLogger().setLevel(logging.INFO)
-        logger.info("Telemetry data processed and inserted.")
+            sender_node_id, row = prime_row
+            content_hash = node_content_hash(row)
+            if known_hashes.get(sender_node_id) == content_hash:
+                report['unchanged'] += 1
+                continue
+
+            groups.setdefault(tuple(row), []).append((sender_node_id, *row.values()))
+            hashes.append((sender_node_id, content_hash))
+            logger.debug("Priming %s: %s", sender_node_id, row, extra={'node_id': sender_node_id})
+
+        with conn:
+            for columns, params in groups.items():
+                conn.executemany(get_upsert_statement(columns), params)
+            conn.executemany(PRIME_STATE_UPSERT, hashes)
+        report['primed'] = len(hashes)
 
     except Exception as e:
-        logging.error(f"Error processing and inserting telemetry data: {e}")
+        logger.error(f"Error processing and inserting telemetry data: {e}")
+        logger.debug(traceback.format_exc())
+
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    system_config['prime_report'] = report
+    logger.info(f"Primed {report['primed']} of {report['nodes']} nodes from the radio ({report['unchanged']} unchanged, {report['skipped']} without an id) in {report['seconds']} s.")
+    return report
+
+# Columns the sync server stores, sender_node_id first
+SYNC_COLUMNS = (
+    'sender_node_id', 'sender_short_name', 'timestamp', 'temperature', 'humidity', 'pressure',
+    'battery_level', 'voltage', 'uptime_seconds', 'latitude', 'longitude', 'altitude',
+    'sats_in_view', 'snr', 'hardware_model', 'sender_long_name', 'role', 'mqtt', 'miles_to_base'
+)
+
+SYNC_PROTOCOL_VERSION = 2
+
+# Next chunk of unsynced rows after a given id
+UNSYNCED_ROWS_QUERY = f"SELECT id, change_seq, {', '.join(SYNC_COLUMNS)} FROM TelemetryData WHERE synced = 0 AND id > ? ORDER BY id LIMIT ?"
+
+# synced value of rows the server refused: out of the sync, and easy to find, until the node changes again
+SYNC_REJECTED = 2
+
+# Bit per synced column (sender_node_id excluded), used to tell the ingest UPSERT which columns a row carried
+SYNC_COLUMN_BITS = {col: 1 << i for i, col in enumerate(SYNC_COLUMNS) if i > 0}
+
+def build_sync_ingest_statement(masked=True):
+    """
+    One UPSERT for every sync row. When masked, the last parameter is a bitmask of the columns the row carried,
+    so delta rows only touch what they sent. Unmasked, every column is overwritten (full rows).
+    A row that would not change anything is skipped, so the resent unchanged rows of old clients cost no write,
+    no index update and none of the TelemetryData triggers.
+    """
+    count = len(SYNC_COLUMNS)
+    values = [f"COALESCE(?{i + 1}, datetime('now','utc'))" if col == 'timestamp' else f"?{i + 1}" for i, col in enumerate(SYNC_COLUMNS)]
+    if masked:
+        updates = [f"{col} = CASE WHEN ?{count + 1} & {1 << i} THEN excluded.{col} ELSE {col} END" for i, col in enumerate(SYNC_COLUMNS) if i > 0]
+        changed = [f"(?{count + 1} & {1 << i} AND {col} IS NOT excluded.{col})" for i, col in enumerate(SYNC_COLUMNS) if i > 0]
+    else:
+        updates = [f"{col} = excluded.{col}" for col in SYNC_COLUMNS[1:]]
+        changed = [f"{col} IS NOT excluded.{col}" for col in SYNC_COLUMNS[1:]]
+    return f'''INSERT INTO TelemetryData ({', '.join(SYNC_COLUMNS)})
+                VALUES ({', '.join(values)})
+                ON CONFLICT(sender_node_id) DO UPDATE SET {', '.join(updates)}
+                WHERE {' OR '.join(changed)}'''
+
+SYNC_INGEST_STATEMENT = build_sync_ingest_statement()
+SYNC_INGEST_FULL_STATEMENT = build_sync_ingest_statement(masked=False)
+SYNC_FULL_MASK = sum(SYNC_COLUMN_BITS.values())
+
+def ingest_sync_entries(conn, entries):
+    """
+    Store a batch of sync entries ({column: value} dicts) with one executemany inside one transaction.
+    Bad rows are rejected individually instead of failing the batch.
+    Returns (stored, rejected) where rejected is a list of {"index", "sender_node_id", "error"}.
+    """
+    rejected = []
+    rows = []
+    for index, entry in enumerate(entries):
+        if not entry.get('sender_node_id'):
+            rejected.append({"index": index, "sender_node_id": None, "error": "missing sender_node_id"})
+            continue
+        params = [entry.get(col) for col in SYNC_COLUMNS]
+        params.append(sum(SYNC_COLUMN_BITS.get(col, 0) for col in entry))
+        rows.append((index, params))
+
+    # the CASE per column is only needed when some row carries a subset of the columns
+    if all(params[-1] == SYNC_FULL_MASK for _, params in rows):
+        statement = SYNC_INGEST_FULL_STATEMENT
+        rows = [(index, params[:-1]) for index, params in rows]
+    else:
+        statement = SYNC_INGEST_STATEMENT
+
+    stored = 0
+    with conn:
+        try:
+            conn.executemany(statement, [params for _, params in rows])
+            stored = len(rows)
+        except sqlite3.Error:
+            # a row sqlite refused (e.g. a value it cannot bind) rolled back the batch, redo it row by row
+            conn.rollback()
+            for index, params in rows:
+                try:
+                    conn.execute(statement, params)
+                    stored += 1
+                except sqlite3.Error as e:
+                    rejected.append({"index": index, "sender_node_id": params[0], "error": str(e)})
+
+    return stored, rejected
 
-    finally:
-        logging.getLogger().setLevel(logging.INFO)
-        logger.info("Telemetry data processing complete.")
+# Kept open between syncs so chunks reuse the same keep-alive connection
+sync_session = None
+
+def get_sync_session():
+    global sync_session
+    if sync_session is None:
+        sync_session = requests.Session()
+        sync_session.headers.update({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    return sync_session
+
+def build_sync_deltas(conn, rows):
+    """
+    Compare unsynced rows with what the server last acknowledged and keep only the changed columns.
+    Returns a list of (row_id, sender_node_id, change_seq, current_values, delta).
+    """
+    unpacked = [(row[0], row[1], dict(zip(SYNC_COLUMNS, row[2:]))) for row in rows]
+    node_ids = [current['sender_node_id'] for _, _, current in unpacked]
+    sent = {}
+    for sender_node_id, values in conn.execute(f"SELECT sender_node_id, sent FROM syncState WHERE sender_node_id IN ({','.join(['?'] * len(node_ids))})", node_ids):
+        sent[sender_node_id] = json.loads(values)
+
+    deltas = []
+    for row_id, change_seq, current in unpacked:
+        previous = sent.get(current['sender_node_id'], {})
+        delta = {column: value for column, value in current.items() if column not in previous or previous[column] != value}
+        delta['sender_node_id'] = current['sender_node_id']
+        deltas.append((row_id, current['sender_node_id'], change_seq, current, delta))
+    return deltas
+
+def mark_chunk_synced(conn, deltas):
+    """
+    Record an acknowledged chunk: remember what was sent and flag the rows as synced.
+    A row that changed again while the chunk was in flight (its change_seq moved) keeps synced = 0 and goes out next time.
+    """
+    with conn:
+        conn.executemany("INSERT INTO syncState (sender_node_id, sent) VALUES (?, ?) ON CONFLICT(sender_node_id) DO UPDATE SET sent = excluded.sent",
+                         [(sender_node_id, json.dumps(current)) for _, sender_node_id, _, current, _ in deltas])
+        conn.executemany("UPDATE TelemetryData SET synced = 1 WHERE id = ? AND change_seq = ?",
+                         [(row_id, change_seq) for row_id, _, change_seq, _, _ in deltas])
 
 def sync_data_to_server(system_config):
+    """
+    Push unsynced rows to the API in gzip'd chunks of only the columns that changed since the last acknowledged sync.
+    Every chunk is acknowledged and marked on its own, so after a failure the next run resumes with what is left.
+    """
     logger = system_config['logger']
     try:
         conn = system_config['conn']
@@ -341,76 +1053,76 @@ def sync_data_to_server(system_config):
         if system_config['api_path'] is None:
             logger.error("DB Push to API Failed. No API path set in config file.")
             return
-        
-        # Connect to the offline database
-        cursor = conn.cursor()
-
-        # Fetch all data including 'synced' column
-        cursor.execute("SELECT * FROM TelemetryData WHERE synced = 0")
-        rows = cursor.fetchall()
-
-        # If there is no data to sync, log and return
-        if not rows:
-            logger.info("No unsynced data to sync.")
-            return
 
-        # Dynamically get the column names from the database cursor description
-        column_names = [description[0] for description in cursor.description]
+        chunk_rows = system_config['api_sync']['chunk_rows']
+        timeout = system_config['api_sync']['timeout']
+        session = get_sync_session()
 
-        # Initialize data as an empty list
-        data = []
+        last_id = 0
+        chunk = 0
+        total = 0
+        while True:
+            rows = conn.execute(UNSYNCED_ROWS_QUERY, (last_id, chunk_rows)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            chunk += 1
 
-        # Prepare data as a list of dictionaries
-        data = [dict(zip(column_names, row)) for row in rows]
+            deltas = build_sync_deltas(conn, rows)
+            # sender_node_id alone means nothing changed, no need to send it
+            changed = [delta for _, _, _, _, delta in deltas if len(delta) > 1]
 
-        # Remove the 'synced' key from each dictionary
-        for record in data:
-            record.pop('synced', None)  # Use pop to safely remove 'synced' if it exists
+            if changed:
+                payload = {'version': SYNC_PROTOCOL_VERSION, 'chunk': chunk, 'rows': changed}
+                body = gzip.compress(json.dumps(payload).encode('utf-8'))
 
-        # Get the ids of the rows that will be synced
-        ids_to_sync = [row[0] for row in rows]  # Assuming 'id' is the first column
+                logger.info(f"Attempting to sync chunk {chunk} ({len(changed)} records, {len(body)} bytes) with {system_config['api_path']}")
+                response = session.post(system_config['api_path'], data=body, timeout=timeout)
 
-        # Debug logging to verify data structure
-        logger.info(f"Attempting to sync {len(rows)} records with {system_config['api_path']}")
+                if response.status_code != 200 or response.json().get('status') != 'success':
+                    logger.error("Failed to sync chunk %d: %d %s", chunk, response.status_code, response.text)
+                    logger.info(f"{total} records synced before the failure, the rest will be retried on the next sync.")
+                    break
 
-        # Send the data to the server using a POST request
-        response = requests.post(system_config['api_path'], json=data, headers={'Content-Type': 'application/json'})
+                # the server refuses bad rows one by one, they are not remembered as sent so the next change resends them in full;
+                # until then they are parked as synced = SYNC_REJECTED instead of being retried every run
+                rejected = response.json().get('rejected', [])
+                if rejected:
+                    logger.error(f"Server rejected {len(rejected)} records in chunk {chunk}: {rejected[:10]}")
+                    rejected_ids = {reject.get('sender_node_id') for reject in rejected}
+                    with conn:
+                        conn.executemany("DELETE FROM syncState WHERE sender_node_id = ?", [(node_id,) for node_id in rejected_ids])
+                        conn.executemany(f"UPDATE TelemetryData SET synced = {SYNC_REJECTED} WHERE id = ? AND change_seq = ?",
+                                         [(row_id, change_seq) for row_id, node_id, change_seq, _, _ in deltas if node_id in rejected_ids])
+                    deltas = [delta for delta in deltas if delta[1] not in rejected_ids]
+                    held = conn.execute(f"SELECT COUNT(*) FROM TelemetryData WHERE synced = {SYNC_REJECTED}").fetchone()[0]
+                    logger.warning(f"{held} records are held back as rejected (synced = {SYNC_REJECTED}) until they change again.")
 
-        # Handle the server response
-        if response.status_code == 200:
-            logger.info("Data synced successfully: %s", response.json())
-
-            # If the data was successfully synced, mark only the fetched records as synced using their ids
-            cursor.execute(f"UPDATE TelemetryData SET synced = 1 WHERE id IN ({','.join(['?'] * len(ids_to_sync))})", ids_to_sync)
-            conn.commit()
-            logger.info(f"{len(rows)} records marked as synced.")
-        else:
-            logger.error("Failed to sync data: %d %s", response.status_code, response.text)
+            mark_chunk_synced(conn, deltas)
+            total += len(deltas)
+            logger.info(f"Chunk {chunk} acknowledged, {len(deltas)} records marked as synced.")
 
+        if total == 0 and chunk == 0:
+            logger.info("No unsynced data to sync.")
         system_config['logger'].info(f"--------------------------------------------------------")
 
-
     except Exception as e:
         logger.error("An error occurred during data sync: %s", str(e))
         system_config['logger'].info(f"--------------------------------------------------------")
 
-def sync_database_periodically(system_config, interval=60):
+def sync_database_job(system_config):
     """
-    This function will run in a separate thread to sync the database to the server periodically.
+    Scheduled job: sync the database to the server.
     """
-    while True:
-        time.sleep(interval)
-        system_config['logger'].info("Syncing database to server...")
-        sync_data_to_server(system_config)
-        system_config['logger'].info("Database synced successfully.") 
+    system_config['logger'].info("Syncing database to server...")
+    sync_data_to_server(system_config)
+    system_config['logger'].info("Database synced successfully.")
 
-def sync_trend_periodically(system_config, interval=60):
+def sync_trend_job(system_config):
     """
-    This function will run in a separate thread to collect trend data.
+    Scheduled job: collect trend data.
     """
-    while True:
-        time.sleep(interval)
-        system_config['logger'].info("Appending trend data...")
-        add_trend_data(system_config)
-        system_config['logger'].info("Append successfully.") 
+    system_config['logger'].info("Appending trend data...")
+    add_trend_data(system_config)
+    system_config['logger'].info("Append successfully.")
 
@@ -1,120 +1,170 @@
-from utils import get_node_names, format_real_number, log_text_to_file
-from db_operations import upsert_node_data
+from utils import get_node_names, format_real_number
+from db_operations import queue_node_data
+from journal import journal_packet
+from packet_history import queue_packet
+from topology import record_topology
 from datetime import datetime, timezone
+from collections import deque
+import threading
 import traceback
 import time
 
+# Latency samples kept per portnum for the percentiles
+HANDLER_SAMPLES = 1000
+
+# portnum -> {'extract': decoded -> dict of node fields, 'sink': called after the node row is queued}
+PORTNUM_HANDLERS = {}
+
+# portnum -> {'count', 'errors', 'total_ms', 'max_ms', 'samples'}
+handler_stats = {}
+handler_stats_lock = threading.Lock()
+
+def register_handler(portnum, extract=None, sink=None):
+    """
+    Register what to parse out of a portnum's decoded payload and what to do with the packet afterwards.
+    """
+    PORTNUM_HANDLERS[portnum] = {'extract': extract, 'sink': sink}
+
+def extract_telemetry(decoded_packet):
+    telemetry_data = decoded_packet.get('telemetry', {})
+    environment = telemetry_data.get('environmentMetrics', {})
+    device = telemetry_data.get('deviceMetrics', {})
+    return {
+        'temperature': format_real_number(environment.get('temperature', None)),
+        'humidity': format_real_number(environment.get('relativeHumidity', None)),
+        'pressure': format_real_number(environment.get('barometricPressure', None)),
+        'battery_level': format_real_number(device.get('batteryLevel', None)),
+        'voltage': format_real_number(device.get('voltage', None)),
+        'uptime_seconds': format_real_number(device.get('uptimeSeconds', None))
+    }
+
+def extract_position(decoded_packet):
+    location_data = decoded_packet.get('position', {})
+    return {
+        'latitude': format_real_number(location_data.get('latitude', None), precision=7),
+        'longitude': format_real_number(location_data.get('longitude', None), precision=7),
+        'altitude': format_real_number(location_data.get('altitude', None)),
+        'sats_in_view': format_real_number(location_data.get('satsInView', None))
+    }
+
+def extract_user(decoded_packet):
+    user_data = decoded_packet.get('user', {})
+    return {
+        'hardware_model': user_data.get('hwModel', None),
+        'mac_address': user_data.get('macaddr', None),
+        'role': user_data.get('role', None)
+    }
+
+def text_message_sink(system_config, packet, context):
+    journal_packet(system_config, 'TEXT_MESSAGE_APP', packet)
+    system_config['logger'].info(f"{context['sender_long_name']} ({context['sender_short_name']}) sent a message to {context['to_long_name']} ({context['to_short_name']})")
+    system_config['logger'].info(f"--- Message: \n\n{packet['decoded'].get('text')}\n")
+    system_config['logger'].info(f"--------------------------------------------------------")
+
+def telemetry_sink(system_config, packet, context):
+    journal_packet(system_config, 'TELEMETRY_APP', packet)
+
+def neighborinfo_sink(system_config, packet, context):
+    record_topology(system_config, packet, 'neighborinfo')
+
+def traceroute_sink(system_config, packet, context):
+    # responses to utils.traceroute come back through here
+    record_topology(system_config, packet, 'traceroute')
+
+register_handler('TEXT_MESSAGE_APP', sink=text_message_sink)
+register_handler('TELEMETRY_APP', extract=extract_telemetry, sink=telemetry_sink)
+register_handler('POSITION_APP', extract=extract_position)
+register_handler('NODEINFO_APP', extract=extract_user)
+register_handler('NEIGHBORINFO_APP', sink=neighborinfo_sink)
+register_handler('TRACEROUTE_APP', sink=traceroute_sink)
+register_handler('WAYPOINT_APP')
+register_handler('ROUTING_APP')
+
+def record_handler_time(portnum, elapsed_ms, failed=False):
+    with handler_stats_lock:
+        stats = handler_stats.get(portnum)
+        if stats is None:
+            stats = handler_stats[portnum] = {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'samples': deque(maxlen=HANDLER_SAMPLES)}
+        stats['count'] += 1
+        stats['errors'] += 1 if failed else 0
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        stats['samples'].append(elapsed_ms)
+
+def get_handler_stats():
+    """
+    Per portnum call counts and latency (ms), costliest first. Percentiles cover the last HANDLER_SAMPLES packets.
+    """
+    with handler_stats_lock:
+        snapshot = {portnum: (dict(stats), sorted(stats['samples'])) for portnum, stats in handler_stats.items()}
+
+    report = {}
+    for portnum, (stats, samples) in sorted(snapshot.items(), key=lambda item: item[1][0]['total_ms'], reverse=True):
+        report[portnum] = {
+            'count': stats['count'],
+            'errors': stats['errors'],
+            'total_ms': round(stats['total_ms'], 3),
+            'mean_ms': round(stats['total_ms'] / stats['count'], 3),
+            'p50_ms': round(samples[len(samples) // 2], 3),
+            'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+            'max_ms': round(stats['max_ms'], 3)
+        }
+    return report
+
+def log_handler_stats(system_config):
+    for portnum, stats in get_handler_stats().items():
+        system_config['logger'].info(f"{portnum}: {stats['count']} packets, {stats['total_ms']} ms total, "
+                                     f"p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms, {stats['errors']} errors")
+
 def onReceive(system_config, packet, interface):
     logger = system_config['logger']
     decoded_packet = packet.get('decoded', {})
 
+    # every packet, decoded or not, goes to the append-only history
+    queue_packet(system_config, packet)
+
     if decoded_packet:
+        start = time.perf_counter()
+        failed = False
         portnum = decoded_packet.get('portnum')
+        handler = PORTNUM_HANDLERS.get(portnum, {'extract': None, 'sink': None})
+
         sender_node_id = packet.get('fromId', None)
         to_node_id = packet.get('toId', None)
         sender_short_name, sender_long_name = get_node_names(interface, sender_node_id)
         to_short_name, to_long_name = get_node_names(interface, to_node_id)
         rx_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
 
-        message = decoded_packet.get('text')
-
-        telemetry_data = decoded_packet.get('telemetry', {})
-        temperature = format_real_number(telemetry_data.get('environmentMetrics', {}).get('temperature', None))
-        humidity = format_real_number(telemetry_data.get('environmentMetrics', {}).get('relativeHumidity', None)) 
-        pressure = format_real_number(telemetry_data.get('environmentMetrics', {}).get('barometricPressure', None))
-        battery = format_real_number(telemetry_data.get('deviceMetrics', {}).get('batteryLevel', None))
-        voltage = format_real_number(telemetry_data.get('deviceMetrics', {}).get('voltage', None))
-        uptime = format_real_number(telemetry_data.get('deviceMetrics', {}).get('uptimeSeconds', None))
-
-        location_data = decoded_packet.get('position', {})
-        latitude = format_real_number(location_data.get('latitude', None), precision=7)
-        longitude = format_real_number(location_data.get('longitude', None), precision=7)
-        altitude = format_real_number(location_data.get('altitude', None))
-        sats_in_view=format_real_number(location_data.get('satsInView', None))
-
-        user_data = decoded_packet.get('user', {})
         snr = format_real_number(packet.get('rxSnr', None))
-        hardware_model = user_data.get('hwModel', None)
-        mac_address = user_data.get('macaddr', None)
-        role = user_data.get('role', None)
         viaMqtt = packet.get('viaMqtt', 0)
         publicKey = packet.get('publicKey', None)
 
-        upsert_node_data(system_config, sender_node_id, timestamp=rx_time, sender_short_name=sender_short_name, to_node_id=to_node_id, temperature=temperature, humidity=humidity, pressure=pressure, battery_level=battery, voltage=voltage, uptime_seconds=uptime, latitude=latitude, longitude=longitude, altitude=altitude, sats_in_view=sats_in_view, neighbor_node_id=None, snr=snr, hardware_model=hardware_model, mac_address=mac_address, sender_long_name=sender_long_name, role=role, dst_to_bs=None, viaMqtt=viaMqtt, publicKey=publicKey)
-
-        system_config['logger'].debug(f"rxPacket: {sender_short_name} to {to_short_name} at {rx_time}")
-        system_config['logger'].info(f"-------------------------------------------------------- {portnum} ")
-
-        # Handle TEXT_MESSAGE_APP
-        if portnum == 'TEXT_MESSAGE_APP':
-            try:
-                log_text_to_file(packet, './logs/TEXT_MESSAGE_APP.txt')
-                system_config['logger'].info(f"{sender_long_name} ({sender_short_name}) sent a message to {to_long_name} ({to_short_name})")
-                system_config['logger'].info(f"--- Message: \n\n{message}\n")
-                system_config['logger'].info(f"--------------------------------------------------------")
-                # insert_telemetry_data(system_config, sender_node_id=sender_node_id, timestamp=rx_time, to_node_id=to_node_id, sender_short_name=sender_short_name, sender_long_name=sender_long_name, snr=snr, viaMqtt=viaMqtt)
-            
-            except Exception as e:
-                system_config['logger'].error(f"Error processing TEXT_MESSAGE_APP: {e}")
-                system_config['logger'].debug(traceback.format_exc())
-
-        # Handle TELEMETRY_APP
-        elif portnum == 'TELEMETRY_APP':
-            try:
-                log_text_to_file(packet, './logs/TELEMETRY_APP.txt')
-                # insert_telemetry_data(system_config, sender_node_id=sender_node_id, timestamp=rx_time, to_node_id=to_node_id, sender_short_name=sender_short_name, sender_long_name=sender_long_name, temperature=temperature, humidity=humidity, pressure=pressure, battery_level=battery, voltage=voltage, uptime_seconds=uptime, viaMqtt=viaMqtt)
-                pass
-            except Exception as e:
-                system_config['logger'].error(f"Error processing TELEMETRY_APP: {e}")
-                system_config['logger'].debug(traceback.format_exc())
-
-        # # Handle POSITION_APP
-        elif portnum == 'POSITION_APP':
-            try:
-                # log_text_to_file(packet, './logs/POSITION_APP.txt')
-                # insert_telemetry_data(system_config, sender_node_id=sender_node_id, timestamp=rx_time, to_node_id=to_node_id, sender_short_name=sender_short_name, sender_long_name=sender_long_name, latitude=latitude, longitude=longitude, altitude=altitude, viaMqtt=viaMqtt)
-                pass
-            except Exception as e:
-                system_config['logger'].error(f"Error processing POSITION_APP: {e}")
-                system_config['logger'].debug(traceback.format_exc())
-
-        # Handle NEIGHBORINFO_APP
-        elif portnum == 'NEIGHBORINFO_APP':
-            try:
-                # log_text_to_file(packet, './logs/NEIGHBORINFO_APP.txt')
-                pass
-            except Exception as e:
-                system_config['logger'].info(f"Error processing NEIGHBORINFO_APP: {e}")
-                system_config['logger'].debug(traceback.format_exc())
-                
-
-        # Handle WAYPOINT_APP
-        elif portnum == 'WAYPOINT_APP':
-            try:
-                # log_text_to_file(packet, './logs/WAYPOINT_APP.txt')
-                pass
-            except Exception as e:
-                system_config['logger'].info(f"Error processing WAYPOINT_APP: {e}")
-                system_config['logger'].debug(traceback.format_exc())
-
-        # Handle ROUTING_APP
-        elif portnum == 'ROUTING_APP':
-            try:
-                # log_text_to_file(packet, './logs/ROUTING_APP.txt')
-                pass
-            except Exception as e:
-                system_config['logger'].info(f"Error processing ROUTING_APP: {e}")
-                system_config['logger'].debug(traceback.format_exc())
-
-        # Handle NODEINFO_APP
-        elif portnum == 'NODEINFO_APP':
-            try:
-                # log_text_to_file(packet, './logs/NODEINFO_APP.txt')
-                # insert_telemetry_data(system_config, sender_node_id=sender_node_id, timestamp=rx_time, to_node_id=to_node_id, sender_short_name=sender_short_name, sender_long_name=sender_long_name, mac_address=mac_address, hardware_model=hardware_model, role=role, viaMqtt=viaMqtt)
-                pass
-            except Exception as e:
-                system_config['logger'].error(f"Error processing NODEINFO_APP: {e}")
-                system_config['logger'].debug(traceback.format_exc())
+        try:
+            # only the fields this packet type carries are parsed
+            fields = handler['extract'](decoded_packet) if handler['extract'] else {}
+
+            # hand the row to the background writer so a slow commit never stalls the radio thread
+            queue_node_data(system_config, sender_node_id, timestamp=rx_time, sender_short_name=sender_short_name, to_node_id=to_node_id, snr=snr, sender_long_name=sender_long_name, viaMqtt=viaMqtt, publicKey=publicKey, **fields)
+
+            logger.debug("rxPacket: %s to %s at %s", sender_short_name, to_short_name, rx_time, extra={'node_id': sender_node_id})
+            logger.debug("%s %s", '-' * 56, portnum)
+
+            if handler['sink']:
+                context = {
+                    'sender_short_name': sender_short_name,
+                    'sender_long_name': sender_long_name,
+                    'to_short_name': to_short_name,
+                    'to_long_name': to_long_name,
+                    'rx_time': rx_time
+                }
+                handler['sink'](system_config, packet, context)
+
+        except Exception as e:
+            failed = True
+            logger.error(f"Error processing {portnum}: {e}")
+            logger.debug(traceback.format_exc())
+
+        record_handler_time(portnum, (time.perf_counter() - start) * 1000, failed)
 
 
 # Not working
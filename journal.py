@@ -0,0 +1,195 @@
+import base64
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import Message
+
+# The file being appended to is <channel>.<YYYYMMDD>.ndjson, rotated ones are <channel>-<timestamp>.ndjson[.gz]
+SEGMENT_DAY_FORMAT = '%Y%m%d'
+
+def journal_default(value):
+    """
+    json.dumps fallback for what meshtastic puts in a packet: payload bytes go out as base64, protobuf messages
+    (the 'raw' of the decoded sub-dicts) as the same dicts meshtastic builds, anything else as str.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, Message):
+        return MessageToDict(value)
+    return str(value)
+
+def encode_record(record):
+    return json.dumps(record, default=journal_default, separators=(',', ':')) + '\n'
+
+def start_journal(system_config):
+    """
+    Start the background thread that writes journal records, one NDJSON file per channel.
+    """
+    settings = system_config['journal']
+    os.makedirs(settings['path'], exist_ok=True)
+    system_config['packet_journal'] = {
+        'queue': queue.Queue(maxsize=settings['queue_size']),
+        'stop': threading.Event(),
+        'files': {},    # channel -> {'handle', 'path', 'size', 'day'}
+        'stats': {
+            'queued': 0,
+            'written': 0,
+            'dropped': 0,
+            'rotations': 0,
+            'flushes': 0
+        }
+    }
+    thread = threading.Thread(target=journal_writer_loop, args=(system_config,), name='journal_writer')
+    thread.daemon = True
+    system_config['packet_journal']['thread'] = thread
+    thread.start()
+    system_config['logger'].info(f"Packet journal writing to {settings['path']}.")
+
+def journal_packet(system_config, channel, packet):
+    """
+    Hand a packet to the journal writer, never blocking the caller. Returns False if it was not queued.
+    """
+    journal = system_config.get('packet_journal')
+    if journal is None or journal['stop'].is_set():
+        return False
+
+    # 'raw' is the protobuf the rest of the packet was decoded from
+    record = {
+        'time': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f'),
+        'channel': channel,
+        'packet': {key: value for key, value in packet.items() if key != 'raw'} if isinstance(packet, dict) else packet
+    }
+    try:
+        journal['queue'].put_nowait(record)
+    except queue.Full:
+        journal['stats']['dropped'] += 1
+        return False
+    journal['stats']['queued'] += 1
+    return True
+
+def segment_day(settings, name):
+    """
+    The day an open segment file belongs to, from its name (an older unnamed <channel>.ndjson goes by its mtime).
+    """
+    try:
+        return datetime.strptime(name.split('.')[-2], SEGMENT_DAY_FORMAT).date()
+    except (IndexError, ValueError):
+        return datetime.fromtimestamp(os.path.getmtime(os.path.join(settings['path'], name))).date()
+
+def open_segment(settings, channel):
+    """
+    Reopen the channel's open segment if there is one, so a restart keeps appending to it and a segment
+    from an earlier day is still rotated on the next write. Otherwise start today's.
+    """
+    current = sorted(name for name in os.listdir(settings['path'])
+                     if name.startswith(f"{channel}.") and name.endswith('.ndjson'))
+    if current:
+        name = current[-1]
+        day = segment_day(settings, name)
+    else:
+        day = datetime.now().date()
+        name = f"{channel}.{day.strftime(SEGMENT_DAY_FORMAT)}.ndjson"
+    path = os.path.join(settings['path'], name)
+    return {
+        'handle': open(path, 'a', encoding='utf-8', buffering=1024 * 64),
+        'path': path,
+        'size': os.path.getsize(path) if os.path.exists(path) else 0,
+        'day': day
+    }
+
+def rotate_segment(system_config, channel, segment):
+    """
+    Close the current file, rename it with a timestamp, compress it if configured and drop the oldest segments.
+    """
+    settings = system_config['journal']
+    segment['handle'].close()
+
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    rotated = os.path.join(settings['path'], f"{channel}-{stamp}.ndjson")
+    os.replace(segment['path'], rotated)
+
+    if settings['compress']:
+        with open(rotated, 'rb') as source, gzip.open(rotated + '.gz', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(rotated)
+
+    if settings['keep_segments'] > 0:
+        # the timestamp in the name sorts oldest first
+        segments = sorted(name for name in os.listdir(settings['path']) if name.startswith(f"{channel}-") and '.ndjson' in name)
+        for name in segments[:-settings['keep_segments']]:
+            os.remove(os.path.join(settings['path'], name))
+
+    system_config['packet_journal']['stats']['rotations'] += 1
+
+def write_record(system_config, record):
+    settings = system_config['journal']
+    files = system_config['packet_journal']['files']
+    channel = record['channel']
+
+    segment = files.get(channel)
+    if segment is None:
+        segment = files[channel] = open_segment(settings, channel)
+    # checked for a reopened segment too, it may be from before a restart across midnight
+    if segment['size'] >= settings['max_bytes'] or (settings['rotate_daily'] and segment['day'] != datetime.now().date()):
+        rotate_segment(system_config, channel, segment)
+        segment = files[channel] = open_segment(settings, channel)
+
+    line = encode_record(record)
+    segment['handle'].write(line)
+    segment['size'] += len(line.encode('utf-8'))
+    system_config['packet_journal']['stats']['written'] += 1
+
+def flush_journal_files(system_config):
+    for segment in system_config['packet_journal']['files'].values():
+        segment['handle'].flush()
+    system_config['packet_journal']['stats']['flushes'] += 1
+
+def journal_writer_loop(system_config):
+    """
+    Write queued records through buffered handles and flush them every flush_interval seconds.
+    """
+    logger = system_config['logger']
+    journal = system_config['packet_journal']
+    flush_interval = system_config['journal']['flush_interval']
+    last_flush = time.monotonic()
+    dirty = False
+
+    while not (journal['stop'].is_set() and journal['queue'].empty()):
+        try:
+            record = journal['queue'].get(timeout=flush_interval)
+            try:
+                write_record(system_config, record)
+                dirty = True
+            except (OSError, ValueError) as e:
+                logger.error(f"Error writing {record['channel']} journal record: {e}")
+                logger.debug(traceback.format_exc())
+        except queue.Empty:
+            pass
+
+        if dirty and time.monotonic() - last_flush >= flush_interval:
+            flush_journal_files(system_config)
+            last_flush = time.monotonic()
+            dirty = False
+
+    for segment in journal['files'].values():
+        segment['handle'].close()
+
+def stop_journal(system_config, timeout=10):
+    """
+    Stop the journal writer after it has written everything still queued.
+    """
+    journal = system_config.get('packet_journal')
+    if journal is None:
+        return
+    journal['stop'].set()
+    journal['thread'].join(timeout)
+    stats = journal['stats']
+    system_config['logger'].info(f"Packet journal stopped: {stats['written']} records written, {stats['dropped']} dropped, {stats['rotations']} rotations.")
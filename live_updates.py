@@ -0,0 +1,167 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+from db_connection import connect_database, read_pool
+from node_cache import get_latest_nodes
+
+# How often the broadcaster looks for changes, PRAGMA data_version makes an idle check nearly free
+POLL_SECONDS = 2
+# Clients get a comment line this often so proxies keep the stream open and dead clients are noticed
+HEARTBEAT_SECONDS = 15
+# Events kept for clients reconnecting with Last-Event-ID, older gaps get a fresh snapshot
+EVENT_BACKLOG = 500
+# Browser reconnect delay sent with the first frame
+RETRY_MS = 5000
+
+logger = logging.getLogger(__name__)
+
+TREND_MAX_ID_QUERY = 'SELECT MAX(id) FROM trendData'
+TREND_NODES_SINCE_QUERY = 'SELECT DISTINCT sender_node_id FROM trendData WHERE id > ?'
+
+# One broadcaster per process: it diffs the node cache once per change and every stream reads the same encoded frames
+live_updates = {
+    'condition': threading.Condition(),
+    'start_lock': threading.Lock(),
+    'thread': None,
+    'db_path': None,
+    'format_rows': None,    # rows in NODE_FIELDS order -> {'close_nodes': [...], 'far_nodes': [...]}
+    'epoch': uuid.uuid4().hex[:8],  # event ids from an older process never match this one's
+    'seq': 0,               # id of the newest event
+    'events': deque(maxlen=EVENT_BACKLOG),  # (seq, encoded frame)
+    'rows': {},             # sender_node_id -> row, the state as of 'seq'
+    'version': None,        # node cache version 'rows' came from
+    'snapshot': (None, None),  # (seq, encoded snapshot frame), built on first use per seq
+    'trend_conn': None,
+    'trend_data_version': None,
+    'trend_max_id': None
+}
+
+def event_id(seq):
+    return f"{live_updates['epoch']}-{seq}"
+
+def parse_event_id(value):
+    """
+    Return the seq of a Last-Event-ID this process issued, or None.
+    """
+    epoch, _, seq = (value or '').partition('-')
+    if epoch != live_updates['epoch'] or not seq.isdigit():
+        return None
+    return int(seq)
+
+def encode_frame(event, data, seq):
+    return f"id: {event_id(seq)}\nevent: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+
+def publish(event, data):
+    """
+    Append one event for every stream. The caller holds the condition.
+    """
+    live_updates['seq'] += 1
+    live_updates['events'].append((live_updates['seq'], encode_frame(event, data, live_updates['seq'])))
+    live_updates['condition'].notify_all()
+
+def node_changes(db_path):
+    """
+    Publish a 'nodes' event with the rows that changed since the last check and the nodes that went away.
+    """
+    version, rows = get_latest_nodes(db_path)
+    previous_version = live_updates['version']
+    if version == previous_version:
+        return
+    rows = {row[0]: row for row in rows}
+    previous = live_updates['rows']
+    changed = [row for node_id, row in rows.items() if previous.get(node_id) != row]
+    removed = [node_id for node_id in previous if node_id not in rows]
+
+    with live_updates['condition']:
+        live_updates['rows'] = rows
+        live_updates['version'] = version
+        # the first load only sets the baseline, streams start from a snapshot
+        if previous_version is not None and (changed or removed):
+            data = live_updates['format_rows'](changed)
+            data['removed'] = removed
+            publish('nodes', data)
+
+def trend_changes(db_path):
+    """
+    Publish a 'trend' event naming the nodes that got new trendData rows, so trend pages refetch only then.
+    """
+    if live_updates['trend_conn'] is None:
+        live_updates['trend_conn'] = connect_database(db_path, read_pool['settings'], read_only=True)
+    conn = live_updates['trend_conn']
+    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+    if data_version == live_updates['trend_data_version']:
+        return
+    live_updates['trend_data_version'] = data_version
+
+    max_id = conn.execute(TREND_MAX_ID_QUERY).fetchone()[0] or 0
+    if live_updates['trend_max_id'] is not None and max_id > live_updates['trend_max_id']:
+        nodes = [row[0] for row in conn.execute(TREND_NODES_SINCE_QUERY, (live_updates['trend_max_id'],))]
+        with live_updates['condition']:
+            publish('trend', {'nodes': nodes})
+    live_updates['trend_max_id'] = max_id
+
+def broadcast_loop(db_path):
+    while True:
+        # anything escaping here would end the thread and silently stop every open stream
+        try:
+            node_changes(db_path)
+            trend_changes(db_path)
+        except Exception:
+            logger.exception("Live updates check failed")
+        time.sleep(POLL_SECONDS)
+
+def start_live_updates(db_path, format_rows):
+    """
+    Start the broadcaster thread once per process. format_rows turns node cache rows into the /get-telemetry-data payload.
+    """
+    with live_updates['start_lock']:
+        if live_updates['thread'] is not None:
+            return
+        live_updates['db_path'] = db_path
+        live_updates['format_rows'] = format_rows
+        # the first check runs here so a new stream always has a snapshot to start from
+        node_changes(db_path)
+        trend_changes(db_path)
+        live_updates['thread'] = threading.Thread(target=broadcast_loop, args=(db_path,), daemon=True)
+        live_updates['thread'].start()
+
+def snapshot_frame():
+    """
+    The full payload as of the newest event, shared by every stream that needs it. The caller holds the condition.
+    """
+    seq, frame = live_updates['snapshot']
+    if seq != live_updates['seq'] or frame is None:
+        seq = live_updates['seq']
+        frame = encode_frame('snapshot', live_updates['format_rows'](list(live_updates['rows'].values())), seq)
+        live_updates['snapshot'] = (seq, frame)
+    return seq, frame
+
+def stream_events(last_event_id=None, snapshot=True):
+    """
+    Generator of text/event-stream chunks: a snapshot (unless resuming, or snapshot is False), then the events
+    as they are published, with a heartbeat comment when nothing happens.
+    """
+    condition = live_updates['condition']
+    yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+
+    seq = parse_event_id(last_event_id)
+    with condition:
+        if seq is None and not snapshot:
+            seq = live_updates['seq']
+
+    while True:
+        with condition:
+            condition.wait_for(lambda: seq is None or live_updates['seq'] > seq, timeout=HEARTBEAT_SECONDS)
+            events = live_updates['events']
+            if seq is None or seq > live_updates['seq'] or (events and events[0][0] > seq + 1):
+                # new stream, or the backlog no longer reaches back to where the client was
+                seq, frame = snapshot_frame()
+                frames = [frame]
+            else:
+                frames = [frame for event_seq, frame in events if event_seq > seq]
+                seq = live_updates['seq']
+        yield b''.join(frames) if frames else b': heartbeat\n\n'
@@ -0,0 +1,69 @@
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = '%(asctime)s: %(message)s'
+LOG_DATE_FORMAT = '%H:%M:%S'
+
+def make_node_sampling_filter(every):
+    """
+    Let through 1 in every DEBUG records per node. Only records logged with extra={'node_id': ...} are sampled.
+    """
+    counts = {}
+
+    def node_sampling_filter(record):
+        node_id = getattr(record, 'node_id', None)
+        if every <= 1 or node_id is None or record.levelno > logging.DEBUG:
+            return True
+        count = counts.get(node_id, 0)
+        counts[node_id] = count + 1
+        return count % every == 0
+
+    return node_sampling_filter
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler.prepare formats the message (and any traceback) on the logging thread. The queue never leaves
+    the process, so the record is queued as it is and the listener thread does all the formatting.
+    Arguments are therefore rendered a moment later: pass values, not objects that are about to change.
+    """
+    def prepare(self, record):
+        return record
+
+def setup_logging(system_config, logger_name=None):
+    """
+    Send every log record through a queue to a listener thread that does the formatting and console I/O.
+    Sets system_config['logger'] to a logger at the configured log_level.
+    """
+    level = getattr(logging, str(system_config['log_level']).upper(), logging.INFO)
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    # dropped before the record is queued, so sampled-out debug lines cost no formatting
+    queue_handler.addFilter(make_node_sampling_filter(system_config['debug_sample']))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, console, respect_handler_level=True)
+    listener.start()
+
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    system_config['logger'] = logger
+    system_config['log_listener'] = listener
+    return logger
+
+def stop_logging(system_config):
+    """
+    Write out whatever is still queued and stop the listener thread.
+    """
+    listener = system_config.pop('log_listener', None)
+    if listener is not None:
+        listener.stop()
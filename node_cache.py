@@ -0,0 +1,133 @@
+import threading
+import time
+
+from db_connection import connect_database, read_pool
+
+# Columns served by /get-telemetry-data, in the order the rows are returned
+NODE_FIELDS = (
+    'sender_node_id', 'sender_short_name', 'timestamp', 'temperature', 'humidity', 'pressure',
+    'battery_level', 'voltage', 'uptime_seconds', 'latitude', 'longitude', 'altitude',
+    'sats_in_view', 'snr', 'hardware_model', 'sender_long_name', 'role', 'first_contact',
+    'miles_to_base', 'mqtt'
+)
+
+# Table wide write sequence: every insert, and every update of a served column, moves the row past the highest
+# write_seq so far. Unlike the timestamp it also moves for priming, sync ingest and the miles_to_base recompute.
+WRITE_SEQ_COLUMNS = ', '.join(NODE_FIELDS)
+WRITE_SEQ_MIGRATION = [
+    "ALTER TABLE TelemetryData ADD COLUMN write_seq INTEGER NOT NULL DEFAULT 0",
+    "UPDATE TelemetryData SET write_seq = id",
+    "CREATE INDEX IF NOT EXISTS idx_TelemetryData_write_seq ON TelemetryData (write_seq)",
+    # the cache no longer keys on the timestamp, nothing else reads this index
+    "DROP INDEX IF EXISTS idx_TelemetryData_timestamp",
+    '''CREATE TRIGGER IF NOT EXISTS TelemetryData_write_seq_insert AFTER INSERT ON TelemetryData
+       BEGIN
+           UPDATE TelemetryData SET write_seq = (SELECT MAX(write_seq) FROM TelemetryData) + 1 WHERE id = NEW.id;
+       END''',
+    f'''CREATE TRIGGER IF NOT EXISTS TelemetryData_write_seq_update AFTER UPDATE OF {WRITE_SEQ_COLUMNS} ON TelemetryData
+       BEGIN
+           UPDATE TelemetryData SET write_seq = (SELECT MAX(write_seq) FROM TelemetryData) + 1 WHERE id = NEW.id;
+       END'''
+]
+
+# Rows written since the last refresh, served by the write_seq index
+INCREMENTAL_WHERE = 'WHERE write_seq > ?'
+
+# A full reload catches deleted rows, which leave nothing behind to read incrementally
+FULL_RELOAD_SECONDS = 600
+
+# Process wide latest-state cache, one row per sender_node_id
+node_cache = {
+    'lock': threading.Lock(),
+    'conn': None,
+    'db_path': None,
+    'nodes': {},            # sender_node_id -> row tuple in NODE_FIELDS order
+    'data_version': None,   # PRAGMA data_version seen at the last refresh
+    'max_write_seq': 0,     # highest TelemetryData write_seq seen
+    'last_full_reload': 0.0,
+    'version': 0            # bumped whenever the cached rows change
+}
+
+def get_cache_connection(db_path):
+    """
+    The cache keeps its own read-only connection open, PRAGMA data_version only reports commits made by other connections.
+    """
+    if node_cache['conn'] is None or node_cache['db_path'] != db_path:
+        node_cache['conn'] = connect_database(db_path, read_pool['settings'], read_only=True)
+        node_cache['db_path'] = db_path
+        node_cache['data_version'] = None
+        node_cache['last_full_reload'] = 0.0
+    return node_cache['conn']
+
+def build_node_query(where=''):
+    return f'''
+        SELECT write_seq, {', '.join(NODE_FIELDS)}
+        FROM TelemetryData
+        {where}
+    '''
+
+def load_rows(conn, nodes, where='', params=()):
+    query = build_node_query(where)
+    changed = 0
+    for row in conn.execute(query, params):
+        write_seq, values = row[0], row[1:]
+        node = dict(zip(NODE_FIELDS, values))
+
+        # match the old query, a 0 lat/lon is treated as missing
+        if not node['latitude']:
+            node['latitude'] = None
+        if not node['longitude']:
+            node['longitude'] = None
+        values = tuple(node[field] for field in NODE_FIELDS)
+
+        if nodes.get(node['sender_node_id']) != values:
+            nodes[node['sender_node_id']] = values
+            changed += 1
+        if write_seq > node_cache['max_write_seq']:
+            node_cache['max_write_seq'] = write_seq
+    return changed
+
+def refresh_node_cache(db_path):
+    """
+    Bring the cache up to date. Does nothing unless another connection has committed since the last call.
+    Only rows past the write_seq watermark are re-read, with a periodic full reload to drop deleted rows.
+    """
+    conn = get_cache_connection(db_path)
+    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+    now = time.monotonic()
+    full_reload = now - node_cache['last_full_reload'] >= FULL_RELOAD_SECONDS
+
+    if data_version == node_cache['data_version'] and not full_reload:
+        return
+
+    if full_reload:
+        nodes = {}
+        node_cache['max_write_seq'] = 0
+        load_rows(conn, nodes)
+        changed = nodes != node_cache['nodes']
+        node_cache['nodes'] = nodes
+        node_cache['last_full_reload'] = now
+    else:
+        changed = load_rows(conn, node_cache['nodes'], INCREMENTAL_WHERE, (node_cache['max_write_seq'],))
+
+    node_cache['data_version'] = data_version
+    if changed:
+        node_cache['version'] += 1
+
+def get_latest_nodes(db_path):
+    """
+    Return (version, rows) with the latest state of every node as tuples in NODE_FIELDS order,
+    refreshing the cache first if needed. version changes whenever any row does.
+    """
+    with node_cache['lock']:
+        refresh_node_cache(db_path)
+        return node_cache['version'], list(node_cache['nodes'].values())
+
+def get_nodes(db_path, node_ids):
+    """
+    Like get_latest_nodes but only the rows for node_ids, looked up by key rather than scanned.
+    """
+    with node_cache['lock']:
+        refresh_node_cache(db_path)
+        nodes = node_cache['nodes']
+        return node_cache['version'], [nodes[node_id] for node_id in node_ids if node_id in nodes]
@@ -0,0 +1,166 @@
+import sqlite3
+import threading
+import time
+
+from db_connection import connect_database
+
+# A node the radio and the database both missed is looked up again after this many seconds
+MISS_RETRY_SECONDS = 300
+
+NODE_BY_ID_QUERY = 'SELECT sender_node_id, sender_short_name, sender_long_name FROM TelemetryData WHERE sender_node_id = ?'
+# served by the lower(sender_short_name) index
+NODES_BY_SHORT_NAME_QUERY = 'SELECT sender_node_id, sender_short_name, sender_long_name FROM TelemetryData WHERE lower(sender_short_name) = ?'
+
+# Hash indexes over interface.nodes, kept current from meshtastic.node.updated
+node_directory = {
+    'lock': threading.RLock(),
+    'interface': None,
+    'by_id': {},        # node id ('!a1b2c3d4') -> node dict in interface.nodes format
+    'by_num': {},       # node num -> node id
+    'by_short': {},     # lowercase short name -> set of node ids
+    'short_of': {},     # node id -> the lowercase short name it is indexed under
+    'missing': {},      # node id -> monotonic time of the last failed lookup
+    'db_file': None,
+    'sqlite': None,
+    'conn': None
+}
+
+def node_id_from_num(node_num):
+    return f"!{node_num:08x}"
+
+def index_node(node):
+    """
+    Add or refresh one node in the indexes. The caller holds the lock.
+    """
+    user = node.get('user') or {}
+    node_id = user.get('id') or node.get('id')
+    if node_id is None and node.get('num') is not None:
+        node_id = node_id_from_num(node['num'])
+    if node_id is None:
+        return
+
+    # meshtastic updates node dicts in place, so the old short name is remembered separately
+    short_name = user['shortName'].lower() if user.get('shortName') else None
+    previous_short = node_directory['short_of'].get(node_id)
+    if previous_short is not None and previous_short != short_name:
+        node_directory['by_short'].get(previous_short, set()).discard(node_id)
+
+    node_directory['by_id'][node_id] = node
+    node_directory['missing'].pop(node_id, None)
+    if node.get('num') is not None:
+        node_directory['by_num'][node['num']] = node_id
+    if short_name:
+        node_directory['by_short'].setdefault(short_name, set()).add(node_id)
+        node_directory['short_of'][node_id] = short_name
+
+def build_node_directory(interface):
+    """
+    (Re)build the indexes from interface.nodes.
+    """
+    with node_directory['lock']:
+        node_directory['interface'] = interface
+        node_directory['by_id'] = {}
+        node_directory['by_num'] = {}
+        node_directory['by_short'] = {}
+        node_directory['short_of'] = {}
+        node_directory['missing'] = {}
+        for node in list((interface.nodes or {}).values()):
+            index_node(node)
+
+def set_directory_database(db_file, sqlite_settings=None):
+    """
+    Let lookups fall back to TelemetryData for nodes the radio no longer lists.
+    """
+    with node_directory['lock']:
+        if node_directory['conn'] is not None:
+            node_directory['conn'].close()
+        node_directory['db_file'] = db_file
+        node_directory['sqlite'] = sqlite_settings
+        node_directory['conn'] = None
+
+def update_node(node, interface=None):
+    """
+    meshtastic.node.updated handler, re-indexes just the node that changed.
+    """
+    with node_directory['lock']:
+        if interface is not None and node_directory['interface'] is not interface:
+            build_node_directory(interface)
+        index_node(node)
+
+def ensure_directory(interface):
+    # a directory built for another interface (or none yet) is rebuilt on first use
+    if node_directory['interface'] is not interface:
+        build_node_directory(interface)
+
+def db_rows(query, params):
+    if node_directory['db_file'] is None:
+        return []
+    try:
+        if node_directory['conn'] is None:
+            node_directory['conn'] = connect_database(node_directory['db_file'], node_directory['sqlite'], read_only=True)
+        return node_directory['conn'].execute(query, params).fetchall()
+    except sqlite3.Error:
+        return []
+
+def db_node(row):
+    node_id, short_name, long_name = row
+    node = {'user': {'id': node_id, 'shortName': short_name, 'longName': long_name}}
+    if node_id.startswith('!'):
+        try:
+            node['num'] = int(node_id[1:], 16)
+        except ValueError:
+            pass
+    return node
+
+def lookup_node(interface, node_id):
+    """
+    Return the node dict for node_id from the index, interface.nodes or the database, or None.
+    """
+    if node_id is None:
+        return None
+    with node_directory['lock']:
+        ensure_directory(interface)
+        node = node_directory['by_id'].get(node_id)
+        if node is not None:
+            return node
+
+        # the radio can add a node before it announces it
+        node = (interface.nodes or {}).get(node_id)
+        if node is None:
+            missed = node_directory['missing'].get(node_id)
+            if missed is not None and time.monotonic() - missed < MISS_RETRY_SECONDS:
+                return None
+            rows = db_rows(NODE_BY_ID_QUERY, (node_id,))
+            if not rows:
+                node_directory['missing'][node_id] = time.monotonic()
+                return None
+            node = db_node(rows[0])
+        index_node(node)
+        return node
+
+def lookup_node_id(interface, node_num):
+    """
+    Return the node id for a node number, or None.
+    """
+    with node_directory['lock']:
+        ensure_directory(interface)
+        node_id = node_directory['by_num'].get(node_num)
+        if node_id is not None:
+            return node_id
+        node = lookup_node(interface, node_id_from_num(node_num))
+        return node_id_from_num(node_num) if node is not None and node.get('num') == node_num else None
+
+def lookup_short_name(interface, short_name):
+    """
+    Return the node dicts whose lowercase short name is short_name, asking the database when the radio knows none.
+    """
+    with node_directory['lock']:
+        ensure_directory(interface)
+        node_ids = node_directory['by_short'].get(short_name)
+        if not node_ids:
+            for row in db_rows(NODES_BY_SHORT_NAME_QUERY, (short_name,)):
+                # what the radio says wins over an older name in the database
+                if row[0] not in node_directory['by_id']:
+                    index_node(db_node(row))
+            node_ids = node_directory['by_short'].get(short_name, ())
+        return [node_directory['by_id'][node_id] for node_id in node_ids]
@@ -0,0 +1,81 @@
+import math
+
+# Miles per degree of latitude, and of longitude at the equator
+MILES_PER_DEGREE = 69.17
+
+# R*Tree over node positions, one point box per TelemetryData row, kept current by triggers on TelemetryData
+POSITION_MIGRATION = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS nodePositions USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    # a 0 lat/lon is treated as missing everywhere else, so it is not indexed either
+    '''CREATE TRIGGER IF NOT EXISTS nodePositions_insert AFTER INSERT ON TelemetryData
+       WHEN NEW.latitude AND NEW.longitude
+       BEGIN
+           INSERT OR REPLACE INTO nodePositions VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS nodePositions_update AFTER UPDATE OF latitude, longitude ON TelemetryData
+       WHEN NEW.latitude IS NOT OLD.latitude OR NEW.longitude IS NOT OLD.longitude
+       BEGIN
+           DELETE FROM nodePositions WHERE id = OLD.id;
+           INSERT INTO nodePositions SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+           WHERE NEW.latitude AND NEW.longitude;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS nodePositions_delete AFTER DELETE ON TelemetryData
+       BEGIN
+           DELETE FROM nodePositions WHERE id = OLD.id;
+       END''',
+    '''INSERT OR REPLACE INTO nodePositions
+       SELECT id, latitude, latitude, longitude, longitude FROM TelemetryData WHERE latitude AND longitude'''
+]
+
+# The R*Tree stores 32 bit floats rounded outwards, callers re-check exact positions
+NODES_IN_BOX_QUERY = '''
+    SELECT t.sender_node_id
+    FROM nodePositions p JOIN TelemetryData t ON t.id = p.id
+    WHERE p.max_lat >= ? AND p.min_lat <= ? AND p.max_lon >= ? AND p.min_lon <= ?
+'''
+
+def parse_bbox(value):
+    """
+    'west,south,east,north' in degrees, the order Leaflet's LatLngBounds.toBBoxString() uses.
+    Raises ValueError when the value is not four numbers with south <= north.
+    """
+    west, south, east, north = (float(part) for part in value.split(','))
+    if not all(math.isfinite(part) for part in (west, south, east, north)) or south > north:
+        raise ValueError(f"Invalid bbox: {value}")
+    return west, max(south, -90.0), east, min(north, 90.0)
+
+def wrap_longitude(lon):
+    return (lon + 180.0) % 360.0 - 180.0
+
+def bbox_boxes(west, south, east, north):
+    """
+    Split a bbox into (south, north, west, east) boxes within -180..180, two when it crosses the antimeridian.
+    """
+    if east - west >= 360.0:
+        return [(south, north, -180.0, 180.0)]
+    west, east = wrap_longitude(west), wrap_longitude(east)
+    if west <= east:
+        return [(south, north, west, east)]
+    return [(south, north, west, 180.0), (south, north, -180.0, east)]
+
+def radius_bbox(lat, lon, miles):
+    """
+    The bbox (west, south, east, north) enclosing every point within miles of lat/lon.
+    """
+    lat_delta = miles / MILES_PER_DEGREE
+    south, north = max(lat - lat_delta, -90.0), min(lat + lat_delta, 90.0)
+    # longitude degrees shrink towards the poles, near one the whole circle of longitudes is in range
+    cos_lat = min(math.cos(math.radians(south)), math.cos(math.radians(north)))
+    if cos_lat <= 0.0 or miles / (MILES_PER_DEGREE * cos_lat) >= 180.0:
+        return -180.0, south, 180.0, north
+    lon_delta = miles / (MILES_PER_DEGREE * cos_lat)
+    return lon - lon_delta, south, lon + lon_delta, north
+
+def nodes_in_bbox(conn, west, south, east, north):
+    """
+    Return the set of sender_node_ids whose position is inside the bbox, answered from the R*Tree.
+    """
+    node_ids = set()
+    for south_lat, north_lat, west_lon, east_lon in bbox_boxes(west, south, east, north):
+        node_ids.update(row[0] for row in conn.execute(NODES_IN_BOX_QUERY, (south_lat, north_lat, west_lon, east_lon)))
+    return node_ids
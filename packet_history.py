@@ -0,0 +1,146 @@
+import queue
+import sqlite3
+import time
+
+from meshtastic import portnums_pb2
+
+# Append-only, one row per received packet, typed columns and unix-second timestamps
+PACKET_COLUMNS = (
+    'rx_time', 'from_num', 'to_num', 'packet_id', 'portnum', 'channel', 'rx_snr', 'rx_rssi',
+    'hop_limit', 'hop_start', 'via_mqtt', 'payload_size'
+)
+
+PACKETS_INSERT = f"INSERT INTO packets ({', '.join(PACKET_COLUMNS)}) VALUES ({', '.join('?' for _ in PACKET_COLUMNS)})"
+
+def portnum_value(portnum):
+    """
+    Store portnums as their protobuf number, meshtastic hands them to us by name.
+    """
+    if isinstance(portnum, int):
+        return portnum
+    try:
+        return portnums_pb2.PortNum.Value(portnum)
+    except ValueError:
+        return None
+
+def portnum_name(value):
+    if value is None:
+        return None
+    try:
+        return portnums_pb2.PortNum.Name(value)
+    except ValueError:
+        return str(value)
+
+def node_num(node_id):
+    # '!a1b2c3d4' -> 0xa1b2c3d4
+    return int(node_id[1:], 16) if node_id.startswith('!') else int(node_id)
+
+def build_packet_row(packet):
+    """
+    Turn a received packet into a tuple in PACKET_COLUMNS order.
+    """
+    decoded = packet.get('decoded', {})
+    payload = decoded.get('payload')
+    return (
+        int(packet.get('rxTime') or time.time()),
+        packet.get('from'),
+        packet.get('to'),
+        packet.get('id'),
+        portnum_value(decoded.get('portnum')),
+        packet.get('channel', 0),
+        packet.get('rxSnr'),
+        packet.get('rxRssi'),
+        packet.get('hopLimit'),
+        packet.get('hopStart'),
+        1 if packet.get('viaMqtt') else 0,
+        len(payload) if isinstance(payload, (bytes, bytearray)) else None
+    )
+
+def queue_packet(system_config, packet):
+    """
+    Hand a packet to the DB writer for the history table. Never blocks: when the history queue is full
+    the packet is counted and dropped, the latest-state upsert is not affected.
+    Without a writer the row is inserted directly; once the writer is stopping late rows are counted and dropped.
+    """
+    writer = system_config.get('db_writer')
+    if not system_config['write_queue']['packet_history']:
+        return False
+    if writer is not None and writer['stop'].is_set():
+        writer['stats']['packets_late'] += 1
+        return False
+    row = build_packet_row(packet)
+    if writer is None:
+        with system_config['conn'] as conn:
+            conn.execute(PACKETS_INSERT, row)
+        return True
+
+    try:
+        writer['packet_queue'].put_nowait(row)
+    except queue.Full:
+        writer['stats']['packets_dropped'] += 1
+        return False
+    return True
+
+def write_packet_batch(system_config):
+    """
+    Insert everything waiting in the history queue with one executemany. Called from the DB writer thread.
+    """
+    writer = system_config['db_writer']
+    rows = []
+    try:
+        while True:
+            rows.append(writer['packet_queue'].get_nowait())
+    except queue.Empty:
+        pass
+    if not rows:
+        return 0
+
+    try:
+        with system_config['conn'] as conn:
+            conn.executemany(PACKETS_INSERT, rows)
+        writer['stats']['packets_written'] += len(rows)
+    except sqlite3.Error as e:
+        writer['stats']['packets_dropped'] += len(rows)
+        system_config['logger'].error(f"Error writing {len(rows)} packet history rows: {e}")
+    return len(rows)
+
+def build_timeline_query(with_portnum, with_until):
+    return f'''
+        SELECT {', '.join(PACKET_COLUMNS)}
+        FROM packets
+        WHERE from_num = ? AND rx_time >= ?
+        {'AND rx_time < ?' if with_until else ''}
+        {'AND portnum = ?' if with_portnum else ''}
+        ORDER BY rx_time DESC
+        LIMIT ?
+    '''
+
+def get_node_timeline(conn, node_id, since, until=None, portnum=None, limit=1000):
+    """
+    Packets heard from node_id since the unix time 'since' (and before 'until'), newest first, as dicts.
+    """
+    params = [node_num(node_id), int(since)]
+    if until is not None:
+        params.append(int(until))
+    if portnum is not None:
+        params.append(portnum_value(portnum))
+    params.append(int(limit))
+
+    timeline = []
+    for row in conn.execute(build_timeline_query(portnum is not None, until is not None), params):
+        entry = dict(zip(PACKET_COLUMNS, row))
+        entry['portnum'] = portnum_name(entry['portnum'])
+        timeline.append(entry)
+    return timeline
+
+PORTNUM_COUNTS_QUERY = '''
+    SELECT portnum, COUNT(*) FROM packets
+    WHERE portnum IS NOT NULL AND rx_time >= ?
+    GROUP BY portnum
+'''
+
+def count_packets_by_portnum(conn, since):
+    """
+    {portnum name: packets heard since the unix time 'since'}, served by the (portnum, rx_time) index.
+    """
+    return {portnum_name(portnum): count for portnum, count in conn.execute(PORTNUM_COUNTS_QUERY, (int(since),))}
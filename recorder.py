@@ -0,0 +1,88 @@
+import gzip
+import json
+import base64
+import threading
+import time
+
+from journal import journal_default
+
+# bytes are written as {"__bytes__": "<base64>"} so a replay hands the same bytes to onReceive as the radio did
+BYTES_TAG = '__bytes__'
+
+def recording_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {BYTES_TAG: base64.b64encode(value).decode('ascii')}
+    return journal_default(value)
+
+def encode_record(record):
+    return json.dumps(record, default=recording_default, separators=(',', ':')) + '\n'
+
+def decode_bytes(obj):
+    # json.loads object_hook, the inverse of recording_default
+    if len(obj) == 1 and BYTES_TAG in obj:
+        return base64.b64decode(obj[BYTES_TAG])
+    return obj
+
+def open_recording(path, mode):
+    # .gz recordings are compressed, anything else is plain NDJSON
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8', buffering=1024 * 64)
+
+def start_recording(system_config, interface):
+    """
+    Start capturing the packets delivered to receive_packet_ in system_config['record_file'].
+    The first line is the interface.nodes snapshot the replayer needs to resolve node names.
+    """
+    path = system_config['record_file']
+    handle = open_recording(path, 'w')
+    handle.write(encode_record({'type': 'nodes', 'nodes': interface.nodes}))
+    system_config['recorder'] = {
+        'handle': handle,
+        'lock': threading.Lock(),
+        'start': time.monotonic(),
+        'packets': 0
+    }
+    system_config['logger'].info(f"Recording packets to {path}.")
+
+def record_packet(system_config, packet):
+    """
+    Append one packet with its offset in seconds from the start of the recording.
+    """
+    recorder = system_config.get('recorder')
+    if recorder is None:
+        return
+    line = encode_record({
+        'type': 'packet',
+        'offset': round(time.monotonic() - recorder['start'], 6),
+        'packet': {key: value for key, value in packet.items() if key != 'raw'}
+    })
+    with recorder['lock']:
+        recorder['handle'].write(line)
+        recorder['packets'] += 1
+
+def stop_recording(system_config):
+    recorder = system_config.pop('recorder', None)
+    if recorder is None:
+        return
+    with recorder['lock']:
+        recorder['handle'].close()
+    system_config['logger'].info(f"Recorded {recorder['packets']} packets to {system_config['record_file']}.")
+
+def load_recording(path):
+    """
+    Return (nodes, packets) from a recording, packets as a list of (offset, packet) in delivery order.
+    Tagged bytes fields come back as bytes; recordings made before the tag load them as base64 strings.
+    """
+    nodes = {}
+    packets = []
+    with open_recording(path, 'r') as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            record = json.loads(line, object_hook=decode_bytes)
+            if record['type'] == 'nodes':
+                nodes = record['nodes']
+            elif record['type'] == 'packet':
+                packets.append((record['offset'], record['packet']))
+    return nodes, packets
@@ -0,0 +1,172 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from db_operations import TREND_RESOLUTIONS
+
+# Raw rows are only dropped when the finest rollup already holds their bucket
+FINEST_RESOLUTION = min(TREND_RESOLUTIONS.values())
+
+# Delete the covered, expired raw rows in one id range (one batch)
+RAW_TREND_DELETE_QUERY = f'''
+    DELETE FROM trendData
+    WHERE id > ? AND id <= ?
+    AND timestamp < ?
+    AND EXISTS (
+        SELECT 1 FROM trendRollup r
+        WHERE r.resolution = {FINEST_RESOLUTION}
+        AND r.sender_node_id = trendData.sender_node_id
+        AND r.bucket = datetime((CAST(strftime('%s', trendData.timestamp) AS INTEGER) / {FINEST_RESOLUTION}) * {FINEST_RESOLUTION}, 'unixepoch')
+    )
+'''
+
+ROLLUP_DELETE_QUERY = '''
+    DELETE FROM trendRollup
+    WHERE (resolution, sender_node_id, bucket) IN (
+        SELECT resolution, sender_node_id, bucket FROM trendRollup
+        WHERE resolution = ? AND bucket < ?
+        LIMIT ?
+    )
+'''
+
+# Delete the expired packets in one id range (one batch), the rowid order follows rx_time in an append-only table
+PACKET_DELETE_QUERY = 'DELETE FROM packets WHERE id > ? AND id <= ? AND rx_time < ?'
+
+def cutoff_timestamp(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+def delete_raw_trend_rows(conn, days, batch_rows, batch_pause):
+    """
+    Delete trendData rows older than days, batch_rows ids at a time, skipping rows no rollup covers yet.
+    Returns the number of rows deleted.
+    """
+    cutoff = cutoff_timestamp(days)
+    deleted = 0
+    last_id = 0
+    while True:
+        # the next id range, trendData ids grow with time so we can stop once a range starts past the cutoff
+        batch = conn.execute("SELECT id, timestamp FROM trendData WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_rows)).fetchall()
+        if not batch or (batch[0][1] or '') >= cutoff:
+            break
+
+        with conn:
+            deleted += conn.execute(RAW_TREND_DELETE_QUERY, (last_id, batch[-1][0], cutoff)).rowcount
+        last_id = batch[-1][0]
+        time.sleep(batch_pause)
+    return deleted
+
+def delete_rollup_rows(conn, resolution, days, batch_rows, batch_pause):
+    """
+    Delete rollup buckets of one resolution older than days, batch_rows at a time.
+    """
+    cutoff = cutoff_timestamp(days)
+    deleted = 0
+    while True:
+        with conn:
+            count = conn.execute(ROLLUP_DELETE_QUERY, (resolution, cutoff, batch_rows)).rowcount
+        deleted += count
+        if count < batch_rows:
+            break
+        time.sleep(batch_pause)
+    return deleted
+
+def delete_packet_rows(conn, days, batch_rows, batch_pause):
+    """
+    Delete packet history older than days, batch_rows at a time.
+    """
+    cutoff = int(time.time() - days * 86400)
+    deleted = 0
+    last_id = 0
+    while True:
+        batch = conn.execute("SELECT id, rx_time FROM packets WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_rows)).fetchall()
+        if not batch or batch[0][1] >= cutoff:
+            break
+
+        with conn:
+            deleted += conn.execute(PACKET_DELETE_QUERY, (last_id, batch[-1][0], cutoff)).rowcount
+        last_id = batch[-1][0]
+        time.sleep(batch_pause)
+    return deleted
+
+def enable_incremental_vacuum(conn, logger):
+    """
+    incremental_vacuum only works with auto_vacuum = INCREMENTAL, switching an existing file needs one full VACUUM.
+    The VACUUM locks the whole database while it rewrites it, so this is an operator step
+    (tools/run_retention.py --enable-incremental-vacuum with the logger stopped), never part of the scheduled job.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return
+    logger.info("Switching the database to auto_vacuum = INCREMENTAL (one-off full VACUUM)...")
+    start = time.perf_counter()
+    conn.commit()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    logger.info(f"VACUUM done in {time.perf_counter() - start:.1f} s.")
+
+def incremental_vacuum(conn, pages, batch_pause):
+    """
+    Hand free pages back to the filesystem a few at a time. Returns the number of pages freed.
+    """
+    freed = 0
+    while True:
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if free_pages == 0:
+            break
+        # incremental_vacuum only does its work while the statement is stepped, so drain it
+        conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+        conn.commit()
+        remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        freed += free_pages - remaining
+        if remaining >= free_pages:
+            break
+        time.sleep(batch_pause)
+    return freed
+
+def run_retention(system_config):
+    """
+    Apply the [retention] policy once and return a report of what was removed and reclaimed.
+    """
+    logger = system_config['logger']
+    settings = system_config['retention']
+    conn = system_config['conn']
+
+    start = time.perf_counter()
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    pages_before = conn.execute('PRAGMA page_count').fetchone()[0]
+
+    report = {
+        'raw_rows_deleted': 0,
+        'packet_rows_deleted': 0,
+        'rollup_rows_deleted': {},
+        'pages_before': pages_before,
+        'pages_after': pages_before,
+        'pages_reclaimed': 0,
+        'bytes_reclaimed': 0,
+        'seconds': 0.0
+    }
+
+    if settings['raw_days'] > 0:
+        report['raw_rows_deleted'] = delete_raw_trend_rows(conn, settings['raw_days'], settings['batch_rows'], settings['batch_pause'])
+
+    if settings['packet_days'] > 0:
+        report['packet_rows_deleted'] = delete_packet_rows(conn, settings['packet_days'], settings['batch_rows'], settings['batch_pause'])
+
+    for name, days in settings['rollup_days'].items():
+        if days > 0 and name in TREND_RESOLUTIONS:
+            report['rollup_rows_deleted'][name] = delete_rollup_rows(conn, TREND_RESOLUTIONS[name], days, settings['batch_rows'], settings['batch_pause'])
+
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        incremental_vacuum(conn, settings['vacuum_pages'], settings['batch_pause'])
+    else:
+        logger.info("Retention: auto_vacuum is not INCREMENTAL, free pages stay in the file "
+                    "(run tools/run_retention.py --enable-incremental-vacuum once to switch).")
+
+    pages_after = conn.execute('PRAGMA page_count').fetchone()[0]
+    report['pages_after'] = pages_after
+    report['pages_reclaimed'] = max(0, pages_before - pages_after)
+    report['bytes_reclaimed'] = report['pages_reclaimed'] * page_size
+    report['seconds'] = round(time.perf_counter() - start, 3)
+
+    system_config['retention_report'] = report
+    logger.info(f"Retention: deleted {report['raw_rows_deleted']} raw trend rows, {report['packet_rows_deleted']} packets and {sum(report['rollup_rows_deleted'].values())} rollup rows, "
+                f"reclaimed {report['pages_reclaimed']} pages ({report['bytes_reclaimed'] / 1024:.0f} KiB) in {report['seconds']} s.")
+    return report
@@ -0,0 +1,178 @@
+import asyncio
+import concurrent.futures
+import random
+import sqlite3
+import time
+import traceback
+
+from db_connection import connect_database
+
+# skip: a tick that finds the previous run still going is dropped
+# queue: it waits for the previous run and then runs once, however many ticks went by meanwhile
+OVERLAP_POLICIES = ('skip', 'queue')
+
+def new_scheduler(system_config):
+    """
+    One asyncio loop owns every periodic job of the logger, the blocking work runs on a small thread pool.
+    Register jobs with add_job, then run run_scheduler in the main thread and call stop_scheduler on the way out.
+    """
+    return {
+        'system_config': system_config,
+        'settings': system_config['scheduler'],
+        'jobs': {},
+        'executor': None,
+        'tasks': [],
+        'stopped': False
+    }
+
+def add_job(scheduler, name, func, interval, timeout=None, overlap='skip', own_connection=True, at_shutdown=False):
+    """
+    Run func(system_config) every interval seconds, first after one interval.
+    With own_connection the job gets a copy of system_config whose 'conn' is a connection only it uses.
+    A run longer than timeout seconds is reported (threads cannot be killed) and later ticks follow the overlap policy.
+    at_shutdown jobs run once more from stop_scheduler.
+    """
+    if overlap not in OVERLAP_POLICIES:
+        raise ValueError(f"Unknown overlap policy {overlap}, use one of {', '.join(OVERLAP_POLICIES)}")
+    scheduler['jobs'][name] = {
+        'name': name,
+        'func': func,
+        'interval': interval,
+        'timeout': timeout,
+        'overlap': overlap,
+        'own_connection': own_connection,
+        'at_shutdown': at_shutdown,
+        'config': None,
+        'running': None,    # concurrent future of the run in progress
+        'stats': {'runs': 0, 'failures': 0, 'timeouts': 0, 'skipped': 0, 'missed': 0,
+                  'last_seconds': 0.0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'last_started': None}
+    }
+
+def job_config(scheduler, job):
+    if job['config'] is None:
+        system_config = scheduler['system_config']
+        if job['own_connection']:
+            job['config'] = dict(system_config, conn=connect_database(system_config['db_file'], system_config['sqlite']))
+        else:
+            job['config'] = system_config
+    return job['config']
+
+def run_job(scheduler, job):
+    """
+    One run of a job, on a pool thread (or the caller's at shutdown). Exceptions are logged and counted, never raised.
+    """
+    logger = scheduler['system_config']['logger']
+    stats = job['stats']
+    stats['last_started'] = time.time()
+    start = time.perf_counter()
+    try:
+        job['func'](job_config(scheduler, job))
+    except Exception as e:
+        stats['failures'] += 1
+        logger.error(f"Scheduled job {job['name']} failed: {e}")
+        logger.debug(traceback.format_exc())
+    finally:
+        seconds = time.perf_counter() - start
+        stats['runs'] += 1
+        stats['last_seconds'] = seconds
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        logger.debug("Scheduled job %s took %.3f s", job['name'], seconds)
+
+async def watch_run(scheduler, job, future):
+    try:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), job['timeout'])
+    except asyncio.TimeoutError:
+        job['stats']['timeouts'] += 1
+        scheduler['system_config']['logger'].warning(f"Scheduled job {job['name']} is still running after {job['timeout']} s.")
+
+async def job_loop(scheduler, job):
+    loop = asyncio.get_running_loop()
+    stats = job['stats']
+    interval = job['interval']
+    jitter = min(scheduler['settings']['jitter'], interval / 2)
+    next_due = loop.time() + interval
+    watchers = set()
+
+    while True:
+        # jitter keeps jobs with the same interval from all hitting the database in the same second
+        await asyncio.sleep(max(0.0, next_due - loop.time()) + random.uniform(0, jitter))
+
+        # ticks that went by while the loop was busy or the host was asleep collapse into this one
+        missed = int((loop.time() - next_due) // interval)
+        if missed > 0:
+            stats['missed'] += missed
+        next_due += (max(missed, 0) + 1) * interval
+
+        running = job['running']
+        if running is not None and not running.done():
+            if job['overlap'] == 'skip':
+                stats['skipped'] += 1
+                continue
+            await asyncio.shield(asyncio.wrap_future(running))
+
+        future = scheduler['executor'].submit(run_job, scheduler, job)
+        job['running'] = future
+        if job['timeout']:
+            watcher = asyncio.create_task(watch_run(scheduler, job, future))
+            watchers.add(watcher)
+            watcher.add_done_callback(watchers.discard)
+
+async def run_scheduler(scheduler):
+    """
+    Run every job until cancelled (KeyboardInterrupt cancels asyncio.run's main task).
+    """
+    scheduler['executor'] = concurrent.futures.ThreadPoolExecutor(max_workers=scheduler['settings']['workers'], thread_name_prefix='scheduler')
+    scheduler['tasks'] = [asyncio.create_task(job_loop(scheduler, job), name=job['name']) for job in scheduler['jobs'].values()]
+    try:
+        await asyncio.gather(*scheduler['tasks'])
+    finally:
+        for task in scheduler['tasks']:
+            task.cancel()
+
+def stop_scheduler(scheduler):
+    """
+    Wait up to shutdown_timeout for runs in progress, run the at_shutdown jobs once more and close the job connections.
+    """
+    if scheduler['stopped']:
+        return
+    scheduler['stopped'] = True
+    logger = scheduler['system_config']['logger']
+    jobs = scheduler['jobs'].values()
+
+    running = {job['running']: job['name'] for job in jobs if job['running'] is not None and not job['running'].done()}
+    if running:
+        _, still_running = concurrent.futures.wait(running, timeout=scheduler['settings']['shutdown_timeout'])
+        for future in still_running:
+            logger.warning(f"Scheduled job {running[future]} did not finish before shutdown.")
+
+    for job in jobs:
+        if job['at_shutdown'] and (job['running'] is None or job['running'].done()):
+            run_job(scheduler, job)
+
+    if scheduler['executor'] is not None:
+        scheduler['executor'].shutdown(wait=False, cancel_futures=True)
+    for job in jobs:
+        if job['own_connection'] and job['config'] is not None and (job['running'] is None or job['running'].done()):
+            try:
+                job['config']['conn'].close()
+            except sqlite3.Error:
+                pass
+
+def get_scheduler_stats(scheduler):
+    """
+    {job name: run counters and durations}, mean_seconds included.
+    """
+    report = {}
+    for name, job in scheduler['jobs'].items():
+        stats = dict(job['stats'])
+        stats['interval'] = job['interval']
+        stats['mean_seconds'] = stats['total_seconds'] / stats['runs'] if stats['runs'] else 0.0
+        report[name] = stats
+    return report
+
+def log_scheduler_stats(system_config, scheduler):
+    logger = system_config['logger']
+    for name, stats in get_scheduler_stats(scheduler).items():
+        logger.info(f"Job {name}: {stats['runs']} runs, mean {stats['mean_seconds']:.3f} s, max {stats['max_seconds']:.3f} s, "
+                    f"{stats['failures']} failed, {stats['timeouts']} timed out, {stats['skipped']} skipped, {stats['missed']} missed")
@@ -1,11 +1,18 @@
 import time
+import asyncio
 import logging
-import threading
 from pubsub import pub
 from utils import display_banner
-from event_processing import onReceive
+from event_processing import onReceive, log_handler_stats
 from config_init import initialize_config, get_interface, init_cli_parser, merge_config
-from db_operations import initialize_database, process_and_insert_telemetry_data, get_db_connection, sync_data_to_server, sync_database_periodically, sync_trend_periodically
+from db_operations import initialize_database, process_and_insert_telemetry_data, get_db_connection, sync_database_job, sync_trend_job, start_db_writer, stop_db_writer, recompute_miles_to_base
+from retention import run_retention
+from journal import start_journal, stop_journal
+from log_setup import setup_logging, stop_logging
+from recorder import start_recording, record_packet, stop_recording
+from node_directory import build_node_directory, set_directory_database, update_node
+from topology import start_topology, topology_job
+from scheduler import new_scheduler, add_job, run_scheduler, stop_scheduler, log_scheduler_stats
 import signal
 
 
@@ -20,70 +27,107 @@ logging.basicConfig(
 )
 
 def main():
+    startup_start = time.perf_counter()
     args = init_cli_parser()
     config_file = None
     if args.config is not None:
         config_file = args.config
     system_config = initialize_config(config_file)
-    system_config['logger'] = logging.getLogger(__name__)
-
-    log_level = getattr(logging, system_config['log_level'].upper(), logging.INFO)  # Convert string to logging level
-    system_config['logger'].setLevel(logging.DEBUG)
-
     merge_config(system_config, args)
 
+    # Log records are formatted and printed by a listener thread, at the configured log_level
+    setup_logging(system_config, __name__)
+
     interface = get_interface(system_config)
 
     host_node_num = interface.myInfo.my_node_num
 
     # if the base location is not set, use the base nodes location, otherwise, use boise as hard sp.
     if system_config['general']['location']['base_lat'] == 0.0 or system_config['general']['location']['base_lon'] == 0.0:
-        system_config['general']['location']['latitude'] = interface.nodesByNum[host_node_num]['position']['latitude']
-        system_config['general']['location']['longitude'] = interface.nodesByNum[host_node_num]['position']['longitude']
+        host_position = interface.nodesByNum.get(host_node_num, {}).get('position', {})
+        if host_position.get('latitude') and host_position.get('longitude'):
+            system_config['general']['location']['base_lat'] = host_position['latitude']
+            system_config['general']['location']['base_lon'] = host_position['longitude']
 
     # Start the database connection here so we can close it on KeyboardInterrupt
-    system_config['conn'] = get_db_connection()
+    system_config['conn'] = get_db_connection(system_config['db_file'], system_config['sqlite'])
 
     initialize_database(system_config)
 
+    # Stored distances are recomputed in one pass when the base location has moved
+    recompute_miles_to_base(system_config)
+
+    # Node name/number lookups go through hash indexes, with the database as a fallback
+    set_directory_database(system_config['db_file'], system_config['sqlite'])
+    build_node_directory(interface)
+
+    # Mesh links from neighbor info and traceroutes, hop distances measured from our node
+    start_topology(system_config, host_node_num)
+
+    # Raw packets go to the NDJSON journal through a background writer
+    start_journal(system_config)
+
     # Prime the database with data contained in the interface
-    process_and_insert_telemetry_data(system_config, interface)
+    prime_report = process_and_insert_telemetry_data(system_config, interface)
+
+    # Packets from the radio are written by a background thread in batches
+    start_db_writer(system_config)
 
     display_banner()
 
     system_config['logger'].info(f"Testbench Mesh Logger is running on {system_config['interface_type']} interface...")
-    system_config['logger'].info(f"Connected to {system_config['hostname']}\n")
+    system_config['logger'].info(f"Connected to {system_config['hostname']}")
+    system_config['logger'].info(f"Startup took {time.perf_counter() - startup_start:.2f} s (priming {prime_report['seconds']} s, {prime_report['primed']} of {prime_report['nodes']} nodes written)\n")
+
 
+    # Capture traffic for offline replay (tools/replay_packets.py)
+    if system_config['record_file']:
+        start_recording(system_config, interface)
 
     def receive_packet_(packet, interface):
+        record_packet(system_config, packet)
         onReceive(system_config, packet, interface)
 
+    def node_updated_(node, interface):
+        update_node(node, interface)
+
     def onConnection_():  # supposed to be called when connecting ¯\_(ツ)_/¯
         system_config['logger'].info(f"Connected to the radio!")
 
     pub.subscribe(receive_packet_, "meshtastic.receive")
     pub.subscribe(onConnection_, "meshtastic.connection.established")
-
-    # Start the database sync in a separate thread
-    sync_thread = threading.Thread(target=sync_database_periodically, args=(system_config, 300))  # sync every 5 minutes
-    sync_thread.daemon = True
-    sync_thread.start()
-
-    # Start the database trending in a separate thread
-    trend_thread = threading.Thread(target=sync_trend_periodically, args=(system_config, 60))  # sync every 1 minutes
-    trend_thread.daemon = True
-    trend_thread.start()
+    pub.subscribe(node_updated_, "meshtastic.node.updated")
+
+    # Every periodic job runs from one scheduler, each on its own connection so runs never share a transaction
+    scheduler = new_scheduler(system_config)
+    add_job(scheduler, 'sync', sync_database_job, system_config['scheduler']['sync_interval'], timeout=120, at_shutdown=True)
+    add_job(scheduler, 'trend', sync_trend_job, system_config['scheduler']['trend_interval'], timeout=60)
+    # Write the topology graph to the edges table
+    add_job(scheduler, 'topology', topology_job, system_config['topology']['flush_interval'], timeout=60, at_shutdown=True)
+    # Trim old trend rows and hand free pages back to the filesystem
+    if system_config['retention']['enabled']:
+        add_job(scheduler, 'retention', run_retention, system_config['retention']['interval'], timeout=1800)
 
     try:
-        while True:
-            time.sleep(1)
+        asyncio.run(run_scheduler(scheduler))
 
     except KeyboardInterrupt:
-        sync_data_to_server(system_config)
+        # Write out anything still queued, then let the scheduler flush the topology and do the final sync
+        stop_db_writer(system_config)
+        stop_journal(system_config)
+        stop_recording(system_config)
+        stop_scheduler(scheduler)
+        log_handler_stats(system_config)
+        log_scheduler_stats(system_config, scheduler)
         system_config['logger'].info("Shutting down the server and DB...")
 
         system_config['conn'].close()
         interface.close()
+        # packets the radio delivered while shutting down are not written, only counted
+        writer_stats = system_config['db_writer']['stats']
+        if writer_stats['late_dropped'] or writer_stats['packets_late']:
+            system_config['logger'].info(f"{writer_stats['late_dropped']} packets ({writer_stats['packets_late']} history rows) arrived after shutdown started and were not written.")
+        stop_logging(system_config)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
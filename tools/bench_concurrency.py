@@ -0,0 +1,149 @@
+# Concurrency benchmark: one writer plus N readers, old connection setup vs the shared WAL connection factory
+# Run from the tools folder: python bench_concurrency.py --readers 4 --seconds 5
+import os
+import sys
+import time
+import logging
+import argparse
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from db_operations import initialize_database, build_node_row, execute_node_upsert, build_trend_query, TREND_RAW_FIELDS
+from db_connection import connect_database, init_read_pool, read_connection
+from node_cache import build_node_query
+from bench_upsert import make_packets
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s: %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+BASE_LOCATION = {'location': {'base_lat': 43.6008608, 'base_lon': -116.2750972}}
+
+def seed_database(db_file, nodes, trend_rows):
+    """
+    Create the schema in the old rollback-journal mode with some nodes and trend history to read.
+    """
+    conn = sqlite3.connect(db_file)
+    initialize_database({'logger': logger, 'conn': conn})
+    system_config = {'logger': logger, 'conn': conn, 'general': BASE_LOCATION}
+    with conn:
+        for packet in make_packets(nodes * 3, nodes):
+            execute_node_upsert(conn, packet.pop('sender_node_id'), build_node_row(system_config, **packet))
+        conn.executemany('''INSERT INTO trendData (sender_node_id, timestamp, temperature, humidity, battery_level)
+                            VALUES (?, datetime('2024-01-01', ? || ' minutes'), 20.0, 50.0, 90)''',
+                         ((f"!{i % nodes:08x}", str(i)) for i in range(trend_rows)))
+    conn.close()
+
+def writer(connect, packets, batch_rows, stop, result):
+    conn = connect()
+    system_config = {'logger': logger, 'conn': conn, 'general': BASE_LOCATION}
+    written = busy = 0
+    i = 0
+    while not stop.is_set():
+        batch = packets[i:i + batch_rows] or packets[:batch_rows]
+        i = (i + batch_rows) % len(packets)
+        try:
+            with conn:
+                for packet in batch:
+                    fields = dict(packet)
+                    execute_node_upsert(conn, fields.pop('sender_node_id'), build_node_row(system_config, **fields))
+            written += len(batch)
+        except sqlite3.OperationalError:
+            busy += 1
+    conn.close()
+    result['written'] = written
+    result['writer_busy'] = busy
+
+def reader(borrow, node_ids, stop, latencies, errors):
+    node_query = build_node_query()
+    trend_query = build_trend_query(TREND_RAW_FIELDS, True, False)
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with borrow() as conn:
+                if i % 2:
+                    conn.execute(node_query).fetchall()
+                else:
+                    conn.execute(trend_query, (node_ids[i % len(node_ids)], '2024-01-01 00:00:00')).fetchall()
+            latencies.append(time.perf_counter() - start)
+        except sqlite3.OperationalError:
+            errors.append(1)
+        i += 1
+
+@contextmanager
+def per_request_connection(db_file):
+    """
+    The old app.py pattern, a fresh sqlite3.connect for every request.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def run(db_file, tuned, readers, seconds, nodes, batch_rows):
+    if tuned:
+        connect = lambda: connect_database(db_file)
+        init_read_pool(db_file, dict(read_pool_size=readers, cache_size_mb=32, mmap_size_mb=256, busy_timeout_ms=5000))
+        borrow = read_connection
+    else:
+        connect = lambda: sqlite3.connect(db_file, check_same_thread=False)
+        borrow = lambda: per_request_connection(db_file)
+
+    packets = make_packets(5000, nodes, seed=2)
+    node_ids = [f"!{i:08x}" for i in range(nodes)]
+    stop = threading.Event()
+    result = {}
+    latencies = []
+    errors = []
+
+    threads = [threading.Thread(target=writer, args=(connect, packets, batch_rows, stop, result))]
+    threads += [threading.Thread(target=reader, args=(borrow, node_ids, stop, latencies, errors)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'writes_per_s': result['written'] / seconds,
+        'reads_per_s': len(latencies) / seconds,
+        'read_p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'read_p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        'errors': len(errors) + result['writer_busy']
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Writer + N readers concurrency benchmark")
+    parser.add_argument("--readers", type=int, default=4, help="Number of reader threads (4)")
+    parser.add_argument("--seconds", type=float, default=5, help="Seconds per run (5)")
+    parser.add_argument("--nodes", type=int, default=200, help="Number of distinct nodes (200)")
+    parser.add_argument("--trend-rows", type=int, default=50000, help="trendData rows to seed (50000)")
+    parser.add_argument("--batch-rows", type=int, default=20, help="Upserts per writer transaction (20)")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, tuned in (('rollback journal, connect per read', False), ('WAL factory + read pool', True)):
+            db_file = os.path.join(tmp, f"{'tuned' if tuned else 'legacy'}.db")
+            seed_database(db_file, args.nodes, args.trend_rows)
+            results[name] = run(db_file, tuned, args.readers, args.seconds, args.nodes, args.batch_rows)
+
+    print(f"readers: {args.readers}  seconds: {args.seconds}  nodes: {args.nodes}  trend rows: {args.trend_rows}")
+    print(f"{'setup':36} {'writes/s':>10} {'reads/s':>10} {'read p50':>10} {'read p99':>10} {'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:36} {result['writes_per_s']:10.0f} {result['reads_per_s']:10.0f} "
+              f"{result['read_p50_ms']:8.2f}ms {result['read_p99_ms']:8.2f}ms {result['errors']:8d}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Micro-benchmark: scalar utils.haversine_distance in a loop vs the vectorized utils.haversine_distances
+# Run from the tools folder: python bench_haversine.py --points 10000 100000 --matrix 2000
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from utils import haversine_distance, haversine_distances, distance_matrix
+
+# Boise, the default base location
+BASE_LAT = 43.6008608
+BASE_LON = -116.2750972
+
+def make_points(count, seed=1):
+    # nodes spread over a few hundred miles around the base
+    rng = np.random.default_rng(seed)
+    return BASE_LAT + rng.uniform(-4, 4, count), BASE_LON + rng.uniform(-5, 5, count)
+
+def best_of(repeat, func):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Haversine micro-benchmark")
+    parser.add_argument("--points", type=int, nargs='+', default=[10000, 100000], help="Point counts to time the base distances for (10000 100000)")
+    parser.add_argument("--matrix", type=int, default=2000, help="Nodes for the pairwise distance matrix, 0 to skip (2000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the best one is reported (3)")
+    args = parser.parse_args()
+
+    print(f"{'points':>8} {'scalar ms':>11} {'numpy ms':>10} {'speedup':>8} {'max diff mi':>12}")
+    for count in args.points:
+        lats, lons = make_points(count)
+        lat_list, lon_list = lats.tolist(), lons.tolist()
+        scalar, expected = best_of(args.repeat, lambda: [haversine_distance(BASE_LAT, BASE_LON, lat, lon) for lat, lon in zip(lat_list, lon_list)])
+        vector, result = best_of(args.repeat, lambda: haversine_distances(BASE_LAT, BASE_LON, lats, lons))
+        diff = float(np.max(np.abs(result - np.array(expected))))
+        print(f"{count:8d} {scalar * 1000:11.1f} {vector * 1000:10.2f} {scalar / vector:7.1f}x {diff:12.2e}")
+
+    if args.matrix:
+        lats, lons = make_points(args.matrix, seed=2)
+        lat_list, lon_list = lats.tolist(), lons.tolist()
+        # the scalar loop only fills the upper triangle, the matrix is symmetric
+        scalar, _ = best_of(1, lambda: [[haversine_distance(lat_list[i], lon_list[i], lat_list[j], lon_list[j]) for j in range(i + 1, args.matrix)] for i in range(args.matrix)])
+        vector, _ = best_of(args.repeat, lambda: distance_matrix(lats, lons))
+        print()
+        print(f"pairwise {args.matrix} x {args.matrix}: scalar upper triangle {scalar * 1000:.0f} ms, numpy full matrix {vector * 1000:.1f} ms ({scalar / vector:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Benchmark: /sync ingestion with one executemany UPSERT (skipping unchanged rows) vs the old UPDATE-then-INSERT per entry
+# Run from the tools folder: python bench_sync_ingest.py --entries 10000
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from db_operations import initialize_database, ingest_sync_entries, SYNC_COLUMNS
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s: %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+def legacy_ingest(conn, entries):
+    """
+    The old /sync loop: UPDATE every column, INSERT when nothing was updated.
+    """
+    cursor = conn.cursor()
+    for entry in entries:
+        values = [entry.get(col) for col in SYNC_COLUMNS]
+        cursor.execute(f'''UPDATE TelemetryData SET {', '.join(col + ' = ?' for col in SYNC_COLUMNS[1:])} WHERE sender_node_id = ?''',
+                       values[1:] + [entry['sender_node_id']])
+        if cursor.rowcount == 0:
+            cursor.execute(f'''INSERT INTO TelemetryData ({', '.join(SYNC_COLUMNS)}) VALUES ({', '.join(['?'] * len(SYNC_COLUMNS))})''', values)
+    conn.commit()
+    return len(entries), []
+
+def make_entries(count, nodes, seed=1):
+    rng = random.Random(seed)
+    # a sync payload carries one row per node (TelemetryData is keyed by node), so nodes only repeat when count > nodes
+    node_nums = rng.sample(range(16 ** 8), nodes)
+    entries = []
+    for i in range(count):
+        node = f"!{node_nums[i % nodes]:08x}"
+        entries.append({
+            'sender_node_id': node, 'sender_short_name': node[-4:], 'timestamp': f"2024-01-01 00:{(i // 60) % 60:02d}:{i % 60:02d}",
+            'temperature': round(rng.uniform(-10, 40), 2), 'humidity': round(rng.uniform(0, 100), 2), 'pressure': None,
+            'battery_level': rng.randrange(1, 101), 'voltage': round(rng.uniform(3.0, 4.2), 2), 'uptime_seconds': rng.randrange(1, 10**6),
+            'latitude': round(rng.uniform(43.0, 44.0), 7), 'longitude': round(rng.uniform(-117.0, -116.0), 7), 'altitude': rng.randrange(700, 1500),
+            'sats_in_view': rng.randrange(3, 14), 'snr': round(rng.uniform(-20, 10), 2), 'hardware_model': 'HELTEC_V3',
+            'sender_long_name': f"Node {node}", 'role': 'CLIENT', 'mqtt': 0, 'miles_to_base': round(rng.uniform(0, 200), 2)
+        })
+    return entries
+
+def make_deltas(entries, seed=2):
+    """
+    Version 2 sync rows: only a few columns changed since the last sync.
+    """
+    rng = random.Random(seed)
+    return [{'sender_node_id': entry['sender_node_id'], 'timestamp': entry['timestamp'], 'temperature': round(rng.uniform(-10, 40), 2), 'snr': entry['snr']}
+            for entry in entries]
+
+def make_changed(entries, seed=3):
+    """
+    The same full rows with a new reading, so every row really updates its node.
+    """
+    rng = random.Random(seed)
+    return [dict(entry, temperature=round(rng.uniform(-10, 40), 2), uptime_seconds=entry['uptime_seconds'] + 60) for entry in entries]
+
+def run(ingest, entries, db_file, seed_entries=None, repeat=3):
+    best = 0.0
+    for attempt in range(repeat):
+        path = f"{db_file}.{attempt}"
+        conn = sqlite3.connect(path)
+        initialize_database({'logger': logger, 'conn': conn})
+        if seed_entries:
+            # every node already exists on the server
+            ingest_sync_entries(conn, seed_entries)
+
+        start = time.perf_counter()
+        ingest(conn, entries)
+        elapsed = time.perf_counter() - start
+
+        conn.close()
+        best = max(best, len(entries) / elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="/sync ingestion benchmark")
+    parser.add_argument("--entries", type=int, default=10000, help="Entries per payload (10000)")
+    parser.add_argument("--nodes", type=int, default=10000, help="Number of distinct nodes (10000)")
+    args = parser.parse_args()
+
+    entries = make_entries(args.entries, args.nodes)
+    deltas = make_deltas(entries)
+
+    print(f"entries: {args.entries}  nodes: {args.nodes}  (best of 3)")
+    with tempfile.TemporaryDirectory() as tmp:
+        # old clients resend every row on each sync, most of them unchanged since the last one
+        for label, payload, seed in (("full rows, new nodes          ", entries, None),
+                                     ("full rows, existing, changed  ", make_changed(entries), entries),
+                                     ("full rows, existing, unchanged", entries, entries)):
+            legacy = run(legacy_ingest, payload, os.path.join(tmp, 'legacy.db'), seed)
+            bulk = run(ingest_sync_entries, payload, os.path.join(tmp, 'bulk.db'), seed)
+            print(f"{label}: UPDATE/INSERT per entry {legacy:8.0f} rows/s | executemany upsert {bulk:8.0f} rows/s | {bulk / legacy:5.2f}x")
+
+        # the old endpoint had no way to apply a partial row, so there is nothing to compare against
+        bulk = run(ingest_sync_entries, deltas, os.path.join(tmp, 'delta.db'), entries)
+        print(f"delta rows, existing nodes: executemany upsert {bulk:8.0f} rows/s")
+
+if __name__ == "__main__":
+    main()
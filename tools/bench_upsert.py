@@ -0,0 +1,123 @@
+# Micro-benchmark: single-statement upsert vs the old one-UPDATE-per-field upsert
+# Run from the tools folder: python bench_upsert.py --packets 5000 --nodes 200
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from db_operations import initialize_database, upsert_node_data
+from utils import haversine_distance, format_real_number
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s: %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+# The fields the old implementation wrote, one UPDATE each, in the same order
+LEGACY_FIELDS = [
+    'sender_long_name', 'sender_short_name', 'to_node_id', 'temperature', 'humidity', 'pressure',
+    'battery_level', 'voltage', 'uptime_seconds'
+]
+LEGACY_TAIL_FIELDS = ['altitude', 'sats_in_view', 'snr', 'hardware_model', 'mac_address', 'role']
+
+def legacy_upsert_node_data(system_config, sender_node_id, timestamp=None, latitude=None, longitude=None, viaMqtt=0, updated=1, **fields):
+    """
+    The pre-engine upsert: one INSERT, then a separate UPDATE for every field that is set.
+    """
+    conn = system_config['conn']
+    with conn:
+        conn.execute('''INSERT INTO TelemetryData (sender_node_id) VALUES (?) ON CONFLICT(sender_node_id) DO NOTHING''', (sender_node_id,))
+        for field in LEGACY_FIELDS:
+            if fields.get(field):
+                conn.execute(f'''UPDATE TelemetryData SET {field} = ? WHERE sender_node_id = ?''', (fields[field], sender_node_id))
+        if latitude and longitude:
+            conn.execute('''UPDATE TelemetryData SET latitude = ? WHERE sender_node_id = ?''', (latitude, sender_node_id))
+            conn.execute('''UPDATE TelemetryData SET longitude = ? WHERE sender_node_id = ?''', (longitude, sender_node_id))
+            distance = format_real_number(haversine_distance(system_config['general']['location']['base_lat'], system_config['general']['location']['base_lon'], latitude, longitude))
+            conn.execute('''UPDATE TelemetryData SET miles_to_base = ? WHERE sender_node_id = ?''', (distance, sender_node_id))
+        for field in LEGACY_TAIL_FIELDS:
+            if fields.get(field):
+                conn.execute(f'''UPDATE TelemetryData SET {field} = ? WHERE sender_node_id = ?''', (fields[field], sender_node_id))
+        if viaMqtt == 0:
+            conn.execute('''UPDATE TelemetryData SET mqtt = ? WHERE sender_node_id = ?''', (viaMqtt, sender_node_id))
+        if updated:
+            conn.execute('''UPDATE TelemetryData SET updated = ? WHERE sender_node_id = ?''', (updated, sender_node_id))
+        conn.execute('''UPDATE TelemetryData SET synced = ? WHERE sender_node_id = ?''', (0, sender_node_id))
+        if timestamp:
+            conn.execute('''UPDATE TelemetryData SET timestamp = ? WHERE sender_node_id = ?''', (timestamp, sender_node_id))
+
+def make_packets(count, nodes, seed=1):
+    """
+    Build a repeatable mix of telemetry, position and nodeinfo shaped packets.
+    """
+    rng = random.Random(seed)
+    packets = []
+    for i in range(count):
+        node = f"!{rng.randrange(nodes):08x}"
+        packet = {
+            'sender_node_id': node,
+            'timestamp': f"2024-01-01 00:{(i // 60) % 60:02d}:{i % 60:02d}",
+            'sender_short_name': node[-4:],
+            'sender_long_name': f"Node {node}",
+            'snr': round(rng.uniform(-20, 10), 2),
+        }
+        kind = i % 3
+        if kind == 0:
+            packet.update(temperature=round(rng.uniform(-10, 40), 2), humidity=round(rng.uniform(0, 100), 2),
+                          battery_level=rng.randrange(1, 101), voltage=round(rng.uniform(3.0, 4.2), 2),
+                          uptime_seconds=rng.randrange(1, 10**6))
+        elif kind == 1:
+            packet.update(latitude=round(rng.uniform(43.0, 44.0), 7), longitude=round(rng.uniform(-117.0, -116.0), 7),
+                          altitude=rng.randrange(700, 1500), sats_in_view=rng.randrange(3, 14))
+        else:
+            packet.update(hardware_model='HELTEC_V3', mac_address='aa:bb:cc:dd:ee:ff', role='CLIENT')
+        packets.append(packet)
+    return packets
+
+def run(upsert, packets, db_file, fsync=True):
+    system_config = {
+        'logger': logger,
+        'conn': sqlite3.connect(db_file, check_same_thread=False),
+        'general': {'location': {'base_lat': 43.6008608, 'base_lon': -116.2750972}},
+    }
+    if not fsync:
+        # isolate statement cost from commit cost
+        system_config['conn'].execute('PRAGMA synchronous = OFF')
+    initialize_database(system_config)
+
+    start = time.perf_counter()
+    for packet in packets:
+        upsert(system_config, **packet)
+    elapsed = time.perf_counter() - start
+
+    system_config['conn'].close()
+    return len(packets) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Upsert micro-benchmark")
+    parser.add_argument("--packets", type=int, default=5000, help="Number of packets to upsert (5000)")
+    parser.add_argument("--nodes", type=int, default=200, help="Number of distinct nodes (200)")
+    parser.add_argument("--no-fsync", action="store_true", help="Run with PRAGMA synchronous = OFF to measure statement cost only")
+    args = parser.parse_args()
+
+    packets = make_packets(args.packets, args.nodes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = run(legacy_upsert_node_data, packets, os.path.join(tmp, 'legacy.db'), not args.no_fsync)
+        engine = run(upsert_node_data, packets, os.path.join(tmp, 'engine.db'), not args.no_fsync)
+
+    print(f"packets: {args.packets}  nodes: {args.nodes}")
+    print(f"per-field UPDATEs : {legacy:10.0f} packets/s")
+    print(f"single upsert     : {engine:10.0f} packets/s")
+    print(f"speedup           : {engine / legacy:10.2f}x")
+
+if __name__ == "__main__":
+    main()
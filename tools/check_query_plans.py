@@ -0,0 +1,92 @@
+# Check that the hot queries in app.py, node_cache.py and db_operations.py are served by an index.
+# Builds a scratch database with the current schema and runs EXPLAIN QUERY PLAN on each query.
+# Run from the tools folder: python check_query_plans.py   (exits 1 if any query scans a table)
+import os
+import sys
+import logging
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from db_operations import initialize_database, build_trend_query, build_rollup_query, build_trend_range_query, TREND_RAW_FIELDS, TREND_ROLLUP_FIELDS, UNSYNCED_ROWS_QUERY, TREND_INSERT_QUERY, TREND_ROLLUP_QUERIES, TREND_RESET_QUERY, SCHEMA_MIGRATIONS
+from node_cache import build_node_query, INCREMENTAL_WHERE
+from retention import RAW_TREND_DELETE_QUERY, ROLLUP_DELETE_QUERY, PACKET_DELETE_QUERY
+from packet_history import build_timeline_query, PORTNUM_COUNTS_QUERY
+from topology import EDGES_SINCE_QUERY, EDGE_EXPIRE_QUERY
+from node_directory import NODE_BY_ID_QUERY, NODES_BY_SHORT_NAME_QUERY
+from node_positions import NODES_IN_BOX_QUERY
+from trend_compression import STATE_QUERY
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s: %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+# (where the query lives, sql, sample parameters)
+HOT_QUERIES = [
+    ("app.get_trend_data (days)", build_trend_query(TREND_RAW_FIELDS, True, False), ['!a', '2024-01-01 00:00:00']),
+    ("app.get_trend_data (all)", build_trend_query(TREND_RAW_FIELDS, False, False), ['!a']),
+    ("app.get_trend_data (next page)", build_trend_query(('timestamp', 'temperature'), True, True), ['!a', '2024-01-01 00:00:00', '2024-02-01 00:00:00', '2024-02-01 00:00:00', 10]),
+    ("app.get_trend_data (rollup)", build_rollup_query(TREND_ROLLUP_FIELDS, True, False), [3600, '!a', '2024-01-01 00:00:00']),
+    ("app.get_trend_data (rollup next page)", build_rollup_query(('timestamp', 'temperature'), True, True), [3600, '!a', '2024-01-01 00:00:00', '2024-02-01 00:00:00']),
+    ("app.get_trend_data (window)", build_trend_range_query(2, False), ['!a', '!b']),
+    ("app.get_trend_data (window, days)", build_trend_range_query(2, True), ['!a', '!b', '2024-01-01 00:00:00']),
+    ("node_cache incremental refresh", build_node_query(INCREMENTAL_WHERE), [10]),
+    ("db_operations.sync_data_to_server", UNSYNCED_ROWS_QUERY, [0, 500]),
+    ("db_operations.add_trend_data insert", TREND_INSERT_QUERY, []),
+    ("db_operations.add_trend_data rollup", TREND_ROLLUP_QUERIES[0], []),
+    ("db_operations.add_trend_data reset", TREND_RESET_QUERY, []),
+    ("retention.delete_raw_trend_rows", RAW_TREND_DELETE_QUERY, [0, 500, '2024-01-01 00:00:00']),
+    ("retention.delete_rollup_rows", ROLLUP_DELETE_QUERY, [900, '2024-01-01 00:00:00', 500]),
+    ("node_directory.lookup_node", NODE_BY_ID_QUERY, ['!a']),
+    ("node_directory.lookup_short_name", NODES_BY_SHORT_NAME_QUERY, ['abcd']),
+    ("packet_history.get_node_timeline", build_timeline_query(True, True), [1, 0, 10, 67, 100]),
+    ("packet_history.count_packets_by_portnum", PORTNUM_COUNTS_QUERY, [0]),
+    ("retention.delete_packet_rows", PACKET_DELETE_QUERY, [0, 500, 1700000000]),
+    ("topology.refresh_topology_cache", EDGES_SINCE_QUERY, [1700000000]),
+    ("topology.flush_topology expire", EDGE_EXPIRE_QUERY, [1700000000]),
+    ("node_positions.nodes_in_bbox", NODES_IN_BOX_QUERY, [43.0, 44.0, -117.0, -116.0]),
+    ("trend_compression.compress_samples state", STATE_QUERY.format('?, ?'), ['!a', '!b']),
+    ("db_operations.build_sync_deltas", "SELECT sender_node_id, sent FROM syncState WHERE sender_node_id IN (?, ?)", ['!a', '!b']),
+]
+
+def uses_index(plan):
+    """
+    Every step that touches a table has to go through an index, the rowid or a WITHOUT ROWID primary key.
+    """
+    for _, _, _, detail in plan:
+        if detail.startswith(('SCAN', 'SEARCH')) and 'INDEX' not in detail and 'PRIMARY KEY' not in detail:
+            return False
+    return True
+
+def main():
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'plans.db'))
+        initialize_database({'logger': logger, 'conn': conn})
+
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        expected = SCHEMA_MIGRATIONS[-1][0]
+        print(f"schema version: {version} (expected {expected})")
+        if version != expected:
+            failed += 1
+
+        for name, query, params in HOT_QUERIES:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            ok = uses_index(plan)
+            failed += 0 if ok else 1
+            print(f"[{'ok' if ok else 'FULL SCAN'}] {name}")
+            for row in plan:
+                print(f"        {row[3]}")
+        conn.close()
+
+    if failed:
+        print(f"{failed} check(s) failed.")
+        sys.exit(1)
+    print("All hot queries use an index.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Check that sync_data_to_server only sends the columns that changed since the last acknowledged sync.
+# Builds a scratch database, syncs a node through a fake API session, changes one column and syncs again.
+# Run from the tools folder: python check_sync_deltas.py   (exits 1 if the second sync sends more than the change)
+import os
+import sys
+import gzip
+import json
+import logging
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import db_operations
+from db_operations import initialize_database, upsert_node_data, sync_data_to_server
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s: %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+class FakeResponse:
+    status_code = 200
+    text = ''
+
+    def json(self):
+        return {'status': 'success', 'rejected': []}
+
+class FakeSession:
+    """
+    Stands in for the requests session and keeps the rows of every posted chunk.
+    """
+    def __init__(self):
+        self.posted = []
+
+    def post(self, url, data=None, timeout=None):
+        self.posted.append(json.loads(gzip.decompress(data))['rows'])
+        return FakeResponse()
+
+def main():
+    failed = 0
+    session = FakeSession()
+    db_operations.sync_session = session
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'sync.db'))
+        system_config = {
+            'logger': logger,
+            'conn': conn,
+            'api_path': 'http://localhost/sync',
+            'api_sync': {'chunk_rows': 500, 'timeout': 5},
+            'general': {'location': {'base_lat': 43.6, 'base_lon': -116.2}}
+        }
+        initialize_database(system_config)
+
+        upsert_node_data(system_config, '!a', sender_short_name='aaaa', sender_long_name='Node A', temperature=20.5,
+                         humidity=40.0, battery_level=90, voltage=4.1, latitude=43.5, longitude=-116.1, hardware_model='TBEAM')
+        sync_data_to_server(system_config)
+        upsert_node_data(system_config, '!a', temperature=21.0)
+        sync_data_to_server(system_config)
+        conn.close()
+
+    if len(session.posted) != 2:
+        print(f"[FAIL] expected 2 posted chunks, got {len(session.posted)}")
+        failed += 1
+    else:
+        first, second = session.posted
+        print(f"first sync: {len(first[0])} columns")
+        print(f"second sync: {sorted(second[0])}")
+        # timestamp moves with every upsert, so it goes out alongside the change
+        expected = {'sender_node_id', 'temperature', 'timestamp'}
+        if set(second[0]) - expected:
+            print(f"[FAIL] second sync sent unchanged columns: {sorted(set(second[0]) - expected)}")
+            failed += 1
+        if second[0].get('temperature') != 21.0:
+            print(f"[FAIL] second sync is missing the temperature change")
+            failed += 1
+
+    if failed:
+        print(f"{failed} check(s) failed.")
+        sys.exit(1)
+    print("Second sync sent only the changed columns.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Replay a packet recording (server.py --record FILE) through event_processing.onReceive against a throwaway database.
+# Run from the tools folder: python replay_packets.py capture.ndjson.gz --speed 0
+import os
+import sys
+import json
+import time
+import types
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+# config.ini of the project, whichever folder the script is run from
+DEFAULT_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'config.ini'))
+
+from config_init import initialize_config
+from db_connection import connect_database
+from db_operations import initialize_database, process_and_insert_telemetry_data, start_db_writer, stop_db_writer
+from event_processing import onReceive, get_handler_stats
+from journal import start_journal, stop_journal
+from recorder import load_recording
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s: %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def replay(system_config, interface, packets, speed):
+    """
+    Feed the packets to onReceive, spaced by their recorded offsets divided by speed (0 = as fast as possible).
+    Returns the per-packet onReceive latencies in seconds.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for offset, packet in packets:
+        if speed > 0:
+            delay = offset / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        packet_start = time.perf_counter()
+        onReceive(system_config, packet, interface)
+        latencies.append(time.perf_counter() - packet_start)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded packets through the ingest path")
+    parser.add_argument("recording", help="Recording made with server.py --record")
+    parser.add_argument("--config", "-c", default=DEFAULT_CONFIG, help="System configuration file (../config.ini)")
+    parser.add_argument("--speed", "-s", type=float, default=0, help="1 = real time, N = N times faster, 0 = as fast as possible (0)")
+    parser.add_argument("--db-file", "-d", default=None, help="Keep the database at this path instead of a temporary one")
+    parser.add_argument("--log-level", "-l", default="WARNING", help="Logging level while replaying (WARNING)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    nodes, packets = load_recording(args.recording)
+    # onReceive and the priming only read interface.nodes
+    interface = types.SimpleNamespace(nodes=nodes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        system_config = initialize_config(args.config)
+        system_config['logger'] = logger
+        logger.setLevel(getattr(logging, args.log_level.upper(), logging.WARNING))
+        system_config['db_file'] = args.db_file or os.path.join(tmp, 'replay.db')
+        system_config['journal']['path'] = os.path.join(tmp, 'logs')
+        system_config['conn'] = connect_database(system_config['db_file'], system_config['sqlite'])
+
+        initialize_database(system_config)
+        start_journal(system_config)
+        process_and_insert_telemetry_data(system_config, interface)
+        start_db_writer(system_config)
+
+        start = time.perf_counter()
+        latencies = replay(system_config, interface, packets, args.speed)
+        # the run ends when the writer has committed everything it was handed
+        stop_db_writer(system_config)
+        elapsed = time.perf_counter() - start
+        stop_journal(system_config)
+
+        system_config['conn'].execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        system_config['conn'].close()
+        db_size = os.path.getsize(system_config['db_file'])
+
+        latencies.sort()
+        stats = system_config['db_writer']['stats']
+        report = {
+            'packets': len(packets),
+            'nodes': len(nodes),
+            'speed': args.speed,
+            'seconds': round(elapsed, 3),
+            'packets_per_s': round(len(packets) / elapsed, 1) if elapsed else 0.0,
+            'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'rows_written': stats['written'],
+            'rows_failed': stats['failed'],
+            'history_rows': stats['packets_written'],
+            'history_dropped': stats['packets_dropped'],
+            'db_bytes': db_size,
+            'portnums': get_handler_stats()
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+        return
+
+    print(f"recording : {args.recording} ({report['packets']} packets, {report['nodes']} nodes)")
+    print(f"speed     : {'max' if args.speed <= 0 else f'{args.speed}x'}")
+    print(f"throughput: {report['packets_per_s']:.1f} packets/s over {report['seconds']} s")
+    print(f"latency   : p50 {report['latency_p50_ms']:.3f} ms  p99 {report['latency_p99_ms']:.3f} ms per packet")
+    print(f"database  : {report['rows_written']} rows written, {report['rows_failed']} failed, {report['db_bytes'] / 1024:.0f} KiB")
+    print(f"history   : {report['history_rows']} packets written, {report['history_dropped']} dropped")
+    print()
+    print(f"{'portnum':24} {'packets':>8} {'total ms':>10} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for portnum, stats in report['portnums'].items():
+        print(f"{str(portnum):24} {stats['count']:8d} {stats['total_ms']:10.1f} {stats['mean_ms']:9.3f} {stats['p50_ms']:9.3f} {stats['p99_ms']:9.3f} {stats['errors']:7d}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Apply the [retention] policy from config.ini once and print what was removed and reclaimed.
+# Run from the project folder: python tools/run_retention.py [--db-file nodeData.db] [--config config.ini]
+# --enable-incremental-vacuum switches the file to auto_vacuum = INCREMENTAL first (one full VACUUM, stop the logger for it).
+import os
+import sys
+import json
+import logging
+import argparse
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from config_init import initialize_config
+from db_operations import initialize_database
+from retention import run_retention, enable_incremental_vacuum
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s: %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the trend retention policy once")
+    parser.add_argument("--config", "-c", default=None, help="System configuration file (config.ini)")
+    parser.add_argument("--db-file", "-d", default=None, help="Database file path (from the config file)")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true", help="Switch the database to auto_vacuum = INCREMENTAL with one full VACUUM before the cleanup")
+    args = parser.parse_args()
+
+    system_config = initialize_config(args.config)
+    system_config['logger'] = logger
+    system_config['conn'] = sqlite3.connect(args.db_file or system_config['db_file'])
+
+    initialize_database(system_config)
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum(system_config['conn'], logger)
+    report = run_retention(system_config)
+    system_config['conn'].close()
+
+    print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    main()
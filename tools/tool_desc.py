@@ -6,4 +6,22 @@ print("clear_db.py: Clear the nodeData DBs contents")
 print("-"*100)
 print("write_wsgi.py: Write the correct contents into the passenger_wsgi.py file. If you recieve a 500 error, the CPanel Python interface probably overwrote it.")
 print("-"*100)
-print("show.py: Show the parent folder contents and its subfolders.")
\ No newline at end of file
+print("show.py: Show the parent folder contents and its subfolders.")
+print("-"*100)
+print("bench_upsert.py: Compare packets/s of the single-statement node upsert against the old one-UPDATE-per-field upsert.")
+print("-"*100)
+print("bench_sync_ingest.py: Compare rows/s of the executemany /sync ingest against the old UPDATE-then-INSERT loop for 10k entry payloads of new, changed and unchanged (resent) nodes. The gain comes from skipping unchanged rows and from new nodes; changed rows run at about the same speed, the per-row index and trigger work dominates.")
+print("-"*100)
+print("check_query_plans.py: EXPLAIN QUERY PLAN the hot queries against a scratch database and fail if any of them scans a table.")
+print("-"*100)
+print("run_retention.py: Apply the [retention] policy from config.ini once and print the rows deleted, pages reclaimed and time spent.")
+print("-"*100)
+print("bench_concurrency.py: Benchmark one writer plus N readers with the old rollback journal / connect per request setup against the WAL connection factory and read pool.")
+print("-"*100)
+print("replay_packets.py: Replay a packet recording made with server.py --record through onReceive against a throwaway database at real time, N x or max speed and report packets/s, p50/p99 latency and DB size.")
+print("-"*100)
+print("bench_haversine.py: Benchmark the scalar haversine_distance loop against the NumPy vectorized haversine_distances for 10k/100k points and a pairwise distance matrix.")
+print("-"*100)
+print("trend_compression_report.py: Run the swinging door / deadband trend compression over a database's raw trendData rows and report the rows kept and the worst reconstruction error per metric.")
+print("-"*100)
+print("check_sync_deltas.py: Sync a node to a fake API twice on a scratch database and fail if the second sync sends more than the column that changed.")
@@ -0,0 +1,94 @@
+# Run the trend compression over the raw trendData rows of a database and report the storage ratio and the
+# worst reconstruction error (linear interpolation between kept rows, as the trend charts draw it) per metric.
+# Run from the tools folder: python trend_compression_report.py --db ../nodeData.db --method all
+import os
+import sys
+import argparse
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+# config.ini of the project, whichever folder the script is run from
+DEFAULT_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'config.ini'))
+
+from config_init import initialize_config
+from trend_compression import SAMPLE_COLUMNS, COMPRESSED_METRICS, LABEL_COLUMNS, METHODS, offer_sample, sample_time, interpolate
+
+def load_series(db_file):
+    """
+    {sender_node_id: [(t, row dict)]} in time order, straight from trendData.
+    """
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    series = {}
+    for row in conn.execute(f"SELECT {', '.join(SAMPLE_COLUMNS)} FROM trendData ORDER BY sender_node_id, timestamp, id"):
+        sample = dict(zip(SAMPLE_COLUMNS, row))
+        t = sample_time(sample['timestamp'])
+        if t is not None:
+            series.setdefault(sample['sender_node_id'], []).append((t, sample))
+    conn.close()
+    return series
+
+def compress(samples, tolerances, method):
+    """
+    What compress_samples would leave in trendData for one node: the indexes of the kept samples.
+    """
+    kept = []
+    state = None
+    for index, (t, sample) in enumerate(samples):
+        values = [sample[metric] for metric in COMPRESSED_METRICS]
+        labels = [sample[label] for label in LABEL_COLUMNS]
+        state, superseded = offer_sample(state, t, values, labels, tolerances, method)
+        if superseded is not None:
+            kept.remove(superseded)
+        kept.append(index)
+        if state is not None and state['tail_t'] is not None:
+            state['tail_id'] = index
+    return kept
+
+def report(series, tolerances, method):
+    rows = 0
+    kept_rows = 0
+    max_error = {metric: 0.0 for metric in COMPRESSED_METRICS}
+    missing = {metric: 0 for metric in COMPRESSED_METRICS}
+    for samples in series.values():
+        kept = compress(samples, tolerances, method)
+        rows += len(samples)
+        kept_rows += len(kept)
+        # two samples at the same second have no single value to reconstruct, they are both kept and not scored
+        times = [t for t, _ in samples]
+        shared = {t for t in times if times.count(t) > 1} if len(set(times)) != len(times) else set()
+        for metric in COMPRESSED_METRICS:
+            points = [(samples[index][0], samples[index][1][metric]) for index in kept]
+            for t, sample in samples:
+                if sample[metric] is None or t in shared:
+                    continue
+                value = interpolate(points, t)
+                if value is None:
+                    missing[metric] += 1
+                else:
+                    max_error[metric] = max(max_error[metric], abs(value - sample[metric]))
+    return rows, kept_rows, max_error, missing
+
+def main():
+    parser = argparse.ArgumentParser(description="Trend compression storage ratio and reconstruction error")
+    parser.add_argument("--db", default=os.path.join(os.pardir, 'nodeData.db'), help="Database with raw trendData rows (../nodeData.db)")
+    parser.add_argument("--config", "-c", default=DEFAULT_CONFIG, help="System configuration file with the [trend_compression] tolerances (../config.ini)")
+    parser.add_argument("--method", "-m", default=None, choices=METHODS + ('all',), help="Compression method (the configured one)")
+    args = parser.parse_args()
+
+    settings = initialize_config(args.config)['trend_compression']
+    tolerances = [settings['tolerances'][metric] for metric in COMPRESSED_METRICS]
+    methods = METHODS if args.method == 'all' else (args.method or settings['method'],)
+    series = load_series(args.db)
+
+    for method in methods:
+        rows, kept_rows, max_error, missing = report(series, tolerances, method)
+        print(f"{method}: {kept_rows} of {rows} rows kept over {len(series)} nodes, ratio {kept_rows / rows if rows else 0:.3f} ({rows / kept_rows if kept_rows else 0:.1f}x smaller)")
+        print(f"  {'metric':16} {'tolerance':>10} {'max error':>10} {'unreconstructed':>16}")
+        for metric, tolerance in zip(COMPRESSED_METRICS, tolerances):
+            flag = '' if max_error[metric] <= tolerance + 1e-9 else '  OVER'
+            print(f"  {metric:16} {tolerance:10.4g} {max_error[metric]:10.4g} {missing[metric]:16d}{flag}")
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+
+from db_connection import connect_database, read_pool
+
+# Traceroute SNRs are sent as dB * 4, this value means unknown
+UNKNOWN_TRACEROUTE_SNR = -128
+
+EDGE_COLUMNS = ('from_num', 'to_num', 'snr', 'last_seen', 'source')
+
+EDGE_UPSERT = '''INSERT INTO edges (from_num, to_num, snr, last_seen, source) VALUES (?, ?, ?, ?, ?)
+                 ON CONFLICT(from_num, to_num) DO UPDATE SET
+                    snr = COALESCE(excluded.snr, snr), last_seen = excluded.last_seen, source = excluded.source'''
+
+EDGE_EXPIRE_QUERY = 'DELETE FROM edges WHERE last_seen < ?'
+
+# Edges seen since the last refresh, served by the last_seen index
+EDGES_SINCE_QUERY = f"SELECT {', '.join(EDGE_COLUMNS)} FROM edges WHERE last_seen >= ?"
+
+BASE_NODE_UPSERT = '''INSERT INTO meshState (key, value) VALUES ('base_node_num', ?)
+                      ON CONFLICT(key) DO UPDATE SET value = excluded.value'''
+BASE_NODE_QUERY = "SELECT value FROM meshState WHERE key = 'base_node_num'"
+
+# A full reload drops edges the logger has expired
+FULL_RELOAD_SECONDS = 600
+
+def new_graph(base=None):
+    return {
+        'lock': threading.Lock(),
+        'edges': {},        # (from_num, to_num) -> {'snr', 'last_seen', 'source'}, to_num heard from_num
+        'adjacency': {},    # node num -> set of node nums it shares an edge with, either direction
+        'base': base,       # node num hop distances are measured from
+        'hops': {},         # node num -> hops from base
+        'dirty': set(),     # edges not yet written to the edges table
+        'version': 0        # bumped whenever an edge or a hop distance changes
+    }
+
+def node_id(num):
+    return f"!{num:08x}"
+
+def relax_hops(graph, start):
+    """
+    Breadth-first from start, lowering hop counts that the new edge made shorter. Only the improved part of the graph is visited.
+    """
+    hops = graph['hops']
+    pending = deque([start])
+    while pending:
+        node = pending.popleft()
+        for neighbor in graph['adjacency'].get(node, ()):
+            if hops[node] + 1 < hops.get(neighbor, float('inf')):
+                hops[neighbor] = hops[node] + 1
+                pending.append(neighbor)
+
+def recompute_hops(graph):
+    """
+    Full breadth-first search from the base, only needed when edges go away or the base changes.
+    """
+    graph['hops'] = {}
+    if graph['base'] is not None:
+        graph['hops'][graph['base']] = 0
+        relax_hops(graph, graph['base'])
+
+def set_base(graph, base):
+    with graph['lock']:
+        if graph['base'] != base:
+            graph['base'] = base
+            recompute_hops(graph)
+            graph['version'] += 1
+
+def add_edge(graph, from_num, to_num, snr, last_seen, source, mark_dirty=True):
+    """
+    Record that to_num heard from_num. The caller holds the lock. Returns True if the graph changed.
+    """
+    if from_num is None or to_num is None or from_num == to_num:
+        return False
+    key = (from_num, to_num)
+    edge = graph['edges'].get(key)
+    if edge is not None and edge['last_seen'] > last_seen:
+        return False
+    # a packet without an SNR keeps the one already known
+    if snr is None and edge is not None:
+        snr = edge['snr']
+    # a re-heard edge changes the payload too, its last_seen moves
+    changed = edge is None or edge['snr'] != snr or edge['source'] != source or edge['last_seen'] != last_seen
+    if not changed:
+        return False
+    graph['edges'][key] = {'snr': snr, 'last_seen': last_seen, 'source': source}
+    if mark_dirty:
+        graph['dirty'].add(key)
+
+    if edge is None:
+        graph['adjacency'].setdefault(from_num, set()).add(to_num)
+        graph['adjacency'].setdefault(to_num, set()).add(from_num)
+        hops = graph['hops']
+        # a new edge can only shorten paths through whichever end is closer to the base
+        if from_num in hops and hops[from_num] + 1 < hops.get(to_num, float('inf')):
+            hops[to_num] = hops[from_num] + 1
+            relax_hops(graph, to_num)
+        elif to_num in hops and hops[to_num] + 1 < hops.get(from_num, float('inf')):
+            hops[from_num] = hops[to_num] + 1
+            relax_hops(graph, from_num)
+
+    graph['version'] += 1
+    return True
+
+def neighborinfo_edges(packet):
+    """
+    NEIGHBORINFO_APP: the sender lists the neighbors it hears and at what SNR.
+    """
+    info = packet.get('decoded', {}).get('neighborinfo', {})
+    receiver = info.get('nodeId') or packet.get('from')
+    return [(neighbor.get('nodeId'), receiver, neighbor.get('snr')) for neighbor in info.get('neighbors', [])]
+
+def traceroute_edges(packet):
+    """
+    TRACEROUTE_APP response: the hops towards the traced node and, if present, back to us, with the SNR at each receiving hop.
+    """
+    route = packet.get('decoded', {}).get('traceroute', {})
+    edges = []
+    for path, snrs in (([packet.get('to')] + route.get('route', []) + [packet.get('from')], route.get('snrTowards', [])),
+                       ([packet.get('from')] + route.get('routeBack', []) + [packet.get('to')], route.get('snrBack', []))):
+        # without one SNR per hop the path was not recorded
+        if len(snrs) != len(path) - 1:
+            continue
+        for i in range(len(path) - 1):
+            snr = snrs[i] / 4 if snrs[i] != UNKNOWN_TRACEROUTE_SNR else None
+            edges.append((path[i], path[i + 1], snr))
+    return edges
+
+def record_topology(system_config, packet, source):
+    """
+    Handler sink for NEIGHBORINFO_APP and TRACEROUTE_APP packets, applies the edges they carry to the live graph.
+    """
+    graph = system_config.get('topology_graph')
+    if graph is None:
+        return
+    edges = neighborinfo_edges(packet) if source == 'neighborinfo' else traceroute_edges(packet)
+    last_seen = int(packet.get('rxTime') or time.time())
+    with graph['lock']:
+        for from_num, to_num, snr in edges:
+            add_edge(graph, from_num, to_num, snr, last_seen, source)
+
+def start_topology(system_config, base_node_num):
+    """
+    Build the live graph from the edges table and record our node as the base for hop distances.
+    """
+    conn = system_config['conn']
+    graph = new_graph()
+    with conn:
+        conn.execute(BASE_NODE_UPSERT, (str(base_node_num),))
+    for from_num, to_num, snr, last_seen, source in conn.execute(EDGES_SINCE_QUERY, (0,)):
+        add_edge(graph, from_num, to_num, snr, last_seen, source, mark_dirty=False)
+    set_base(graph, base_node_num)
+    system_config['topology_graph'] = graph
+    system_config['logger'].info(f"Topology loaded: {len(graph['edges'])} edges, {len(graph['hops'])} nodes reachable from {node_id(base_node_num)}.")
+    return graph
+
+def flush_topology(system_config, conn, max_age=None):
+    """
+    Write changed edges to the edges table and drop edges not heard from in max_age seconds.
+    """
+    graph = system_config['topology_graph']
+    with graph['lock']:
+        rows = [(from_num, to_num, *(graph['edges'][(from_num, to_num)][column] for column in EDGE_COLUMNS[2:]))
+                for from_num, to_num in graph['dirty']]
+        graph['dirty'] = set()
+
+        expired = []
+        if max_age:
+            cutoff = time.time() - max_age
+            expired = [key for key, edge in graph['edges'].items() if edge['last_seen'] < cutoff]
+            for from_num, to_num in expired:
+                del graph['edges'][(from_num, to_num)]
+                # the pair stays adjacent while the reverse direction is still heard
+                if (to_num, from_num) not in graph['edges']:
+                    graph['adjacency'][from_num].discard(to_num)
+                    graph['adjacency'][to_num].discard(from_num)
+            if expired:
+                recompute_hops(graph)
+                graph['version'] += 1
+
+    with conn:
+        conn.executemany(EDGE_UPSERT, rows)
+        if max_age:
+            conn.execute(EDGE_EXPIRE_QUERY, (int(time.time() - max_age),))
+    return len(rows), len(expired)
+
+def topology_job(system_config):
+    """
+    Scheduled job: persist the topology graph and expire old edges.
+    """
+    written, expired = flush_topology(system_config, system_config['conn'], system_config['topology']['edge_max_age'])
+    system_config['logger'].debug("Topology flushed: %d edges written, %d expired", written, expired)
+
+# Web app side: the graph rebuilt from the edges table, refreshed incrementally by last_seen
+topology_cache = {
+    'lock': threading.Lock(),
+    'conn': None,
+    'db_path': None,
+    'graph': new_graph(),
+    'data_version': None,
+    'max_last_seen': 0,
+    'last_full_reload': 0.0,
+    'payload_version': None,
+    'payload': None,
+    'etag': None
+}
+
+def refresh_topology_cache(db_path):
+    """
+    Apply edges written since the last refresh, reloading everything every FULL_RELOAD_SECONDS to drop expired ones.
+    """
+    cache = topology_cache
+    if cache['conn'] is None or cache['db_path'] != db_path:
+        cache['conn'] = connect_database(db_path, read_pool['settings'], read_only=True)
+        cache['db_path'] = db_path
+        cache['data_version'] = None
+        cache['last_full_reload'] = 0.0
+    conn = cache['conn']
+
+    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+    now = time.monotonic()
+    full_reload = now - cache['last_full_reload'] >= FULL_RELOAD_SECONDS
+    if data_version == cache['data_version'] and not full_reload:
+        return
+
+    if full_reload:
+        version = cache['graph']['version']
+        cache['graph'] = new_graph()
+        # keep versions increasing so a full reload always invalidates the payload
+        cache['graph']['version'] = version + 1
+        cache['max_last_seen'] = 0
+        cache['last_full_reload'] = now
+
+    graph = cache['graph']
+    base = conn.execute(BASE_NODE_QUERY).fetchone()
+    with graph['lock']:
+        # >= on last_seen because several edges can share the same second
+        for from_num, to_num, snr, last_seen, source in conn.execute(EDGES_SINCE_QUERY, (cache['max_last_seen'],)):
+            add_edge(graph, from_num, to_num, snr, last_seen, source, mark_dirty=False)
+            cache['max_last_seen'] = max(cache['max_last_seen'], last_seen)
+    set_base(graph, int(base[0]) if base else None)
+    cache['data_version'] = data_version
+
+def get_topology_payload(db_path):
+    """
+    Return (etag, json body) for /get-topology, serialized only when the graph has changed.
+    """
+    with topology_cache['lock']:
+        refresh_topology_cache(db_path)
+        graph = topology_cache['graph']
+        if topology_cache['payload_version'] != graph['version']:
+            with graph['lock']:
+                nodes = sorted(graph['adjacency'])
+                payload = {
+                    'base': node_id(graph['base']) if graph['base'] is not None else None,
+                    'nodes': [{'id': node_id(num), 'num': num, 'hops': graph['hops'].get(num)} for num in nodes],
+                    'edges': [{'from': node_id(from_num), 'to': node_id(to_num), 'snr': edge['snr'], 'last_seen': edge['last_seen'], 'source': edge['source']}
+                              for (from_num, to_num), edge in graph['edges'].items()]
+                }
+            topology_cache['payload'] = json.dumps(payload).encode('utf-8')
+            topology_cache['etag'] = hashlib.sha1(topology_cache['payload']).hexdigest()[:20]
+            topology_cache['payload_version'] = graph['version']
+        return topology_cache['etag'], topology_cache['payload']
@@ -0,0 +1,150 @@
+import json
+from datetime import datetime, timezone
+
+# The trendData columns a trend sample carries, in insert order
+SAMPLE_COLUMNS = (
+    'timestamp', 'sender_node_id', 'sender_long_name', 'sender_short_name', 'latitude', 'longitude',
+    'temperature', 'humidity', 'pressure', 'battery_level', 'voltage', 'uptime_seconds', 'altitude', 'sats_in_view', 'snr'
+)
+# Compressed within a tolerance, the names have to match exactly
+COMPRESSED_METRICS = SAMPLE_COLUMNS[4:]
+LABEL_COLUMNS = ('sender_long_name', 'sender_short_name')
+
+# Allowed reconstruction error per metric, in stored units (temperature is Celsius). 0 only drops collinear points.
+DEFAULT_TOLERANCES = {
+    'latitude': 0.0001, 'longitude': 0.0001, 'temperature': 0.2, 'humidity': 1.0, 'pressure': 0.5,
+    'battery_level': 1.0, 'voltage': 0.02, 'uptime_seconds': 600.0, 'altitude': 5.0, 'sats_in_view': 1.0, 'snr': 1.0
+}
+
+METHODS = ('swinging_door', 'deadband')
+
+STATE_QUERY = 'SELECT sender_node_id, state FROM trendCompression WHERE sender_node_id IN ({})'
+STATE_UPSERT = '''INSERT INTO trendCompression (sender_node_id, state) VALUES (?, ?)
+                  ON CONFLICT(sender_node_id) DO UPDATE SET state = excluded.state'''
+STATE_DELETE = 'DELETE FROM trendCompression WHERE sender_node_id = ?'
+
+# Every sample is written, the newest one per node is provisional: when the next sample still fits the line from the
+# last kept point it replaces that row. So trendData holds the kept points plus one tail row per node, and linear
+# interpolation between consecutive rows (what the trend charts draw) stays within the tolerance of every sample.
+
+def sample_time(timestamp):
+    try:
+        return datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def new_state(t, values, labels):
+    return {'t': t, 'values': values, 'labels': labels, 'tail_id': None, 'tail_t': None, 'tail_values': None,
+            'low': [None] * len(values), 'up': [None] * len(values)}
+
+def narrow_door(state, t, values, tolerances):
+    """
+    Narrow each metric's range of slopes from the kept point that stay within tolerance of this sample.
+    """
+    dt = t - state['t']
+    for i, (value, kept, tolerance) in enumerate(zip(values, state['values'], tolerances)):
+        if value is None or kept is None:
+            continue
+        low, up = (value - tolerance - kept) / dt, (value + tolerance - kept) / dt
+        state['low'][i] = low if state['low'][i] is None else max(state['low'][i], low)
+        state['up'][i] = up if state['up'][i] is None else min(state['up'][i], up)
+
+def fits(state, t, values, tolerances, method):
+    """
+    True when the line from the kept point to this sample passes within tolerance of every sample since the kept point.
+    deadband uses half the tolerance around the kept value instead, which bounds the same line error.
+    """
+    dt = t - state['t']
+    for i, (value, kept, tolerance) in enumerate(zip(values, state['values'], tolerances)):
+        if (value is None) != (kept is None):
+            return False
+        if value is None:
+            continue
+        if method == 'deadband':
+            if abs(value - kept) > tolerance / 2:
+                return False
+            continue
+        slope = (value - kept) / dt
+        if (state['low'][i] is not None and slope < state['low'][i]) or (state['up'][i] is not None and slope > state['up'][i]):
+            return False
+    return True
+
+def offer_sample(state, t, values, labels, tolerances, method):
+    """
+    Decide what to do with a new sample of one node. Returns (state, tail_id to delete or None).
+    The caller inserts the sample and stores its row id in state['tail_id'].
+    """
+    if t is None:
+        return None, None
+    if state is None or labels != state['labels'] or t <= (state['tail_t'] or state['t']):
+        # nothing to extend: the sample becomes the new kept point, a previous tail simply stays
+        return new_state(t, values, labels), None
+
+    if fits(state, t, values, tolerances, method):
+        superseded = state['tail_id']
+    elif state['tail_t'] is None:
+        # out of band right after the kept point, it becomes the kept point itself
+        return new_state(t, values, labels), None
+    else:
+        # the tail was the last sample the line could reach, it is kept and the new sample starts the next line
+        superseded = None
+        state = new_state(state['tail_t'], state['tail_values'], labels)
+        # a deadband tail has to sit inside the band too, otherwise the sample is a kept point itself
+        if t <= state['t'] or not fits(state, t, values, tolerances, method):
+            return new_state(t, values, labels), None
+
+    narrow_door(state, t, values, tolerances)
+    state['tail_t'] = t
+    state['tail_values'] = values
+    return state, superseded
+
+def compress_samples(conn, rows, settings):
+    """
+    Write trend samples (tuples in SAMPLE_COLUMNS order) to trendData, dropping superseded tail rows.
+    Runs inside the caller's transaction. Returns (samples written, tail rows removed).
+    """
+    tolerances = [settings['tolerances'][metric] for metric in COMPRESSED_METRICS]
+    node_ids = list({row[1] for row in rows})
+    states = {}
+    for start in range(0, len(node_ids), 500):
+        chunk = node_ids[start:start + 500]
+        states.update((node_id, json.loads(state)) for node_id, state in conn.execute(STATE_QUERY.format(','.join('?' * len(chunk))), chunk))
+
+    insert = f"INSERT INTO trendData ({', '.join(SAMPLE_COLUMNS)}) VALUES ({', '.join('?' * len(SAMPLE_COLUMNS))})"
+    removed = 0
+    for row in rows:
+        sample = dict(zip(SAMPLE_COLUMNS, row))
+        values = [sample[metric] for metric in COMPRESSED_METRICS]
+        labels = [sample[label] for label in LABEL_COLUMNS]
+        state, superseded = offer_sample(states.get(sample['sender_node_id']), sample_time(sample['timestamp']), values, labels, tolerances, settings['method'])
+        if superseded is not None:
+            removed += conn.execute('DELETE FROM trendData WHERE id = ?', (superseded,)).rowcount
+        row_id = conn.execute(insert, row).lastrowid
+        if state is not None and state['tail_t'] is not None:
+            state['tail_id'] = row_id
+        states[sample['sender_node_id']] = state
+
+    conn.executemany(STATE_UPSERT, [(node_id, json.dumps(state)) for node_id, state in states.items() if state is not None])
+    # a sample without a usable timestamp ends its node's line
+    conn.executemany(STATE_DELETE, [(node_id,) for node_id, state in states.items() if state is None])
+    return len(rows), removed
+
+def interpolate(points, t):
+    """
+    Linear interpolation of a sorted [(t, value)] series at t, None outside it or across a missing value.
+    """
+    if not points or t < points[0][0] or t > points[-1][0]:
+        return None
+    low, high = 0, len(points) - 1
+    while high - low > 1:
+        middle = (low + high) // 2
+        if points[middle][0] <= t:
+            low = middle
+        else:
+            high = middle
+    (t0, v0), (t1, v1) = points[low], points[high]
+    if v0 is None or v1 is None:
+        return v0 if t == t0 else v1 if t == t1 else None
+    if t1 == t0:
+        return v0
+    return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
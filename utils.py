@@ -3,7 +3,9 @@ import time
 import math
 import secrets
 import string
+import numpy as np
 import meshtastic.tcp_interface
+from node_directory import lookup_node, lookup_node_id, lookup_short_name
 
 def send_message(message, destination, interface):
     max_payload_size = 200
@@ -23,44 +25,27 @@ def send_message(message, destination, interface):
         time.sleep(2)
 
 def get_node_info(interface, short_name):
-    nodes = [{'num': node_id, 'shortName': node['user']['shortName'], 'longName': node['user']['longName']}
-             for node_id, node in interface.nodes.items()
-             if node['user']['shortName'].lower() == short_name] 
+    nodes = [{'num': node['user']['id'], 'shortName': node['user']['shortName'], 'longName': node['user']['longName']}
+             for node in lookup_short_name(interface, short_name)]
     return nodes
 
 def get_node_names(interface, node_id):
-    node = interface.nodes.get(node_id)
+    node = lookup_node(interface, node_id)
     if node and 'user' in node:
         return node['user']['shortName'], node['user']['longName']
     else:
         return None, None  # Return None or an appropriate response if the node_id is not found
 
 def get_node_id_from_num(node_num, interface):
-    for node_id, node in interface.nodes.items():
-        if node['num'] == node_num:
-            return node_id
-    return None
+    return lookup_node_id(interface, node_num)
 
 
 def get_node_short_name(node_id, interface):
-    node_info = interface.nodes.get(node_id)
+    node_info = lookup_node(interface, node_id)
     if node_info:
         return node_info['user']['shortName']
     return None
 
-def log_text_to_file(data, file_path='log.txt', mode='a', separator=True, clear_first=False):
-    try:
-        # if clear_first:
-        #     with open(file_path, 'w') as log_file:
-        #         log_file.write('')
-
-        with open(file_path, mode) as log_file:
-            if separator:
-                log_file.write('{"' + '\n\n' + '-'*100 + '\n\n' + '"}')  # Add separator line
-            log_file.write(f"{str(data)}")  # Convert the data to a string and write it to the file
-    except Exception as e:
-        logging.error(f"Error writing to log file {file_path}: {e}")
-
 def display_banner():
     # clear the console
     print("\033[H\033[J")
@@ -118,6 +103,25 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     distance = R * c
     return distance
 
+def haversine_distances(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine_distance in miles, the arguments are scalars or NumPy arrays that broadcast against each other.
+    """
+    R = 3959.0
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    # rounding can push a a hair past 1 for antipodal points
+    a = np.clip(a, 0.0, 1.0)
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def distance_matrix(lats, lons):
+    """
+    n x n miles between every pair of points, for analytics over node positions.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return haversine_distances(lats[:, None], lons[:, None], lats[None, :], lons[None, :])
+
 def create_auth_key():
     characters = string.ascii_letters + string.digits + string.punctuation  # You can customize the character set
     return ''.join(secrets.choice(characters) for _ in range(256))